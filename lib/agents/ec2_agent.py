@@ -2,10 +2,14 @@ from agents.base_agent import BaseAgent, AgentConfigurationException, AgentRunti
 import boto
 from boto.exception import EC2ResponseError
 import datetime
+import hashlib
 import os
+import socket
+import threading
 import time
 from appscale_logger import AppScaleLogger
 from local_state import LocalState
+from parallel_helper import ParallelHelper
 
 __author__ = 'hiranya'
 __email__ = 'hiranya@appscale.com'
@@ -24,17 +28,38 @@ class EC2Agent(BaseAgent):
   # started.
   MAX_VM_CREATION_TIME = 1800
 
-  # The amount of time that run_instances waits between each describe-instances
-  # request. Setting this value too low can cause Eucalyptus to interpret
-  # requests as replay attacks.
+  # The longest amount of time that run_instances waits between each
+  # describe-instances request. Setting this value too low can cause
+  # Eucalyptus to interpret requests as replay attacks.
   SLEEP_TIME = 20
 
+  # The amount of time that run_instances waits before its first
+  # describe-instances request. Each later wait is POLL_BACKOFF_FACTOR times
+  # longer than the last, up to SLEEP_TIME.
+  INITIAL_POLL_DELAY = 2
+
+  # How much longer run_instances waits between each describe-instances
+  # request than it did before the last one.
+  POLL_BACKOFF_FACTOR = 1.5
+
+  # The public IP that Eucalyptus reports for instances that it hasn't given
+  # a public IP to yet.
+  NO_PUBLIC_IP = '0.0.0.0'
+
+  # The states that an instance can be in once it's never going to boot.
+  FAILED_STATES = ('shutting-down', 'terminated', 'stopping', 'stopped')
+
+  # The EC2 error code returned when we ask about instances that it doesn't
+  # know about yet, which can happen right after they're started.
+  INSTANCE_NOT_FOUND_ERROR = 'InvalidInstanceID.NotFound'
+
   PARAM_CREDENTIALS = 'credentials'
   PARAM_GROUP = 'group'
   PARAM_IMAGE_ID = 'image_id'
   PARAM_INSTANCE_TYPE = 'instance_type'
   PARAM_KEYNAME = 'keyname'
   PARAM_INSTANCE_IDS = 'instance_ids'
+  PARAM_ZONES = 'zones'
 
   REQUIRED_EC2_RUN_INSTANCES_PARAMS = (
     PARAM_CREDENTIALS,
@@ -67,7 +92,59 @@ class EC2Agent(BaseAgent):
   REQUIRED_CREDENTIALS = REQUIRED_EC2_CREDENTIALS
 
 
-  DESCRIBE_INSTANCES_RETRY_COUNT = 3
+  # The EC2 error codes that indicate that a connection's credentials were
+  # rejected, in which case we make a new connection for later calls. The
+  # failed call isn't tried again, since the same credentials would be
+  # rejected again.
+  AUTH_ERROR_CODES = ('AuthFailure', 'SignatureDoesNotMatch')
+
+  # The prefixes of the Boto methods that only read from the cloud, and so
+  # can safely be tried again if the connection breaks partway through.
+  # Methods that change something (like run_instances) may have taken effect
+  # before the connection broke, so they're never repeated.
+  READ_ONLY_METHOD_PREFIXES = ('describe_', 'get_')
+
+  # The EC2 error codes that indicate that there isn't enough capacity to
+  # start the instances we asked for right now, which we can work around by
+  # asking for them again (possibly in another availability zone).
+  CAPACITY_ERROR_CODES = ('InsufficientInstanceCapacity',)
+
+  # The most instances that run_instances asks for in a single request.
+  # Larger requests are split into batches of (at most) this many instances,
+  # which are started and waited on concurrently.
+  MAX_BATCH_SIZE = 20
+
+  # The number of times that run_instances asks for more instances when some
+  # of the ones it asked for couldn't be started, or failed to boot.
+  MAX_TOP_UPS = 2
+
+  # The amount of time that run_instances waits before its first top-up, so
+  # that a capacity shortage has a chance to clear up before we ask again.
+  # Each later wait is TOP_UP_BACKOFF_FACTOR times longer than the last.
+  INITIAL_TOP_UP_DELAY = 15
+
+  # How much longer run_instances waits before each top-up than it did
+  # before the last one.
+  TOP_UP_BACKOFF_FACTOR = 2
+
+  # The most batches of instances that run_instances starts and waits on at
+  # the same time.
+  MAX_CONCURRENT_BATCHES = 10
+
+  # The maximum number of instances that describe_instances asks for in a
+  # single request. Deployments with more instances than this are fetched a
+  # page at a time. None means that the cloud doesn't support paging, and
+  # returns every instance at once.
+  DESCRIBE_INSTANCES_PAGE_SIZE = 1000
+
+  def __init__(self):
+    """
+    Creates a new EC2Agent, with no connections to the cloud opened yet.
+    """
+    # A dictionary that maps the tuple returned by get_connection_key to the
+    # Boto connection that we've made with those credentials and endpoint.
+    self.connections = {}
+    self.connections_lock = threading.Lock()
 
   def configure_instance_security(self, parameters):
     """
@@ -131,6 +208,7 @@ class EC2Agent(BaseAgent):
       self.PARAM_IMAGE_ID : args.machine,
       self.PARAM_INSTANCE_TYPE : args.instance_type,
       self.PARAM_KEYNAME : args.keyname,
+      self.PARAM_ZONES : args.zones,
       'IS_VERBOSE' : args.verbose
     }
 
@@ -203,19 +281,75 @@ class EC2Agent(BaseAgent):
       A tuple of the form (public_ips, private_ips, instances) where each
       member is a list.
     """
-    instance_ids = []
-    public_ips = []
-    private_ips = []
+    instances = self.describe_instance_records(parameters)
+    public_ips = [instance['public_ip'] for instance in instances]
+    private_ips = [instance['private_ip'] for instance in instances]
+    instance_ids = [instance['id'] for instance in instances]
+    return public_ips, private_ips, instance_ids
+
+  def describe_instance_records(self, parameters, instance_ids=None,
+    states=('running',)):
+    """
+    Retrieves a compact record of each instance that has been instantiated
+    using a particular EC2 keyname (and security group, if one is given).
+    EC2 does the filtering for us, so that we never download the rest of the
+    instances in the account, and large results are fetched a page at a time
+    when our version of Boto supports it.
+
+    Args:
+      parameters    A dictionary containing the 'keyname' parameter, and
+                    optionally the 'group' parameter
+      instance_ids  A list of instance IDs to restrict the search to, or None
+                    to search every instance with this keyname
+      states        A tuple of the instance states to search for, or None to
+                    search for instances in any state
+
+    Returns:
+      A list of dictionaries, one per instance, each containing the instance's
+      'id', 'state', 'public_ip' and 'private_ip'.
+    """
+    keyname = parameters[self.PARAM_KEYNAME]
+    filters = {'key-name' : keyname}
+    if parameters.get(self.PARAM_GROUP):
+      filters['instance.group-name'] = parameters[self.PARAM_GROUP]
+    if states:
+      filters['instance-state-name'] = list(states)
 
     conn = self.open_connection(parameters)
-    reservations = conn.get_all_instances()
-    instances = [i for r in reservations for i in r.instances]
-    for i in instances:
-      if i.state == 'running' and i.key_name == parameters[self.PARAM_KEYNAME]:
-        instance_ids.append(i.id)
-        public_ips.append(i.public_dns_name)
-        private_ips.append(i.private_dns_name)
-    return public_ips, private_ips, instance_ids
+    # The Boto that we install (2.6) predates paging through results, so we
+    # only ask for pages if the Boto we're running with can fetch them. EC2
+    # doesn't page results for specific instances either, but then there can
+    # only be as many results as instances we asked for.
+    paging = self.DESCRIBE_INSTANCES_PAGE_SIZE and not instance_ids and \
+      hasattr(conn, 'get_all_reservations')
+    records = []
+    next_token = None
+    while True:
+      if paging:
+        reservations = conn.get_all_reservations(filters=filters,
+          max_results=self.DESCRIBE_INSTANCES_PAGE_SIZE, next_token=next_token)
+      else:
+        reservations = conn.get_all_instances(instance_ids=instance_ids,
+          filters=filters)
+
+      for reservation in reservations:
+        for instance in reservation.instances:
+          # Clouds that don't support every filter ignore the ones they don't
+          # know about, so make sure each instance really is one we asked for.
+          if states and instance.state not in states:
+            continue
+          if instance.key_name != keyname:
+            continue
+          records.append({
+            'id' : instance.id,
+            'state' : instance.state,
+            'public_ip' : instance.public_dns_name,
+            'private_ip' : instance.private_dns_name
+          })
+
+      next_token = getattr(reservations, 'next_token', None)
+      if not paging or not next_token:
+        return records
 
   def run_instances(self, count, parameters, security_configured):
     """
@@ -226,12 +360,18 @@ class EC2Agent(BaseAgent):
     it as an error and return. (Also see documentation for the BaseAgent
     class)
 
+    Only the instances that this request started are waited on, so other
+    instances running with the same keyname don't slow us down, and aren't
+    mistaken for the ones we started. Large requests are split into batches
+    that are started concurrently, and if the cloud can't give us every
+    instance we asked for, we return the ones that it could.
+
     Args:
       count               No. of VMs to spawned
       parameters          A dictionary of parameters. This must contain 'keyname',
                           'group', 'image_id' and 'instance_type' parameters.
-      security_configured Uses this boolean value as an heuristic to
-                          detect brand new AppScale deployments.
+      security_configured Unused, since we no longer need to tell new
+                          instances apart from ones already running.
 
     Returns:
       A tuple of the form (instances, public_ips, private_ips)
@@ -246,70 +386,27 @@ class EC2Agent(BaseAgent):
       image_id, instance_type, keyname, group, spot))
 
     start_time = datetime.datetime.now()
-    active_public_ips = []
-    active_private_ips = []
-    active_instances = []
+    end_time = start_time + datetime.timedelta(0, self.MAX_VM_CREATION_TIME)
 
     try:
-      attempts = 1
-      while True:
-        instance_info = self.describe_instances(parameters)
-        active_public_ips = instance_info[0]
-        active_private_ips = instance_info[1]
-        active_instances = instance_info[2]
-
-        # If security has been configured on this agent just now,
-        # that's an indication that this is a fresh cloud deployment.
-        # As such it's not expected to have any running VMs.
-        if len(active_instances) > 0 or security_configured:
-          break
-        elif attempts == self.DESCRIBE_INSTANCES_RETRY_COUNT:
-          self.handle_failure('Failed to invoke describe_instances')
-        attempts += 1
-
-      conn = self.open_connection(parameters)
       if spot:
+        conn = self.open_connection(parameters)
         price = self.get_optimal_spot_price(conn, instance_type)
-        conn.request_spot_instances(str(price), image_id, key_name=keyname,
-          security_groups=[group], instance_type=instance_type, count=count)
+        spot_requests = conn.request_spot_instances(str(price), image_id,
+          key_name=keyname, security_groups=[group],
+          instance_type=instance_type, count=count)
+        instance_ids = self.wait_for_spot_requests(conn, spot_requests,
+          end_time)
+        booted_ids, public_ips, private_ips = self.boot_instances(parameters,
+          instance_ids, end_time)
       else:
-        conn.run_instances(image_id, count, count, key_name=keyname,
-          security_groups=[group], instance_type=instance_type)
-
-      instance_ids = []
-      public_ips = []
-      private_ips = []
-      end_time = datetime.datetime.now() + datetime.timedelta(0,
-        self.MAX_VM_CREATION_TIME)
-      now = datetime.datetime.now()
-
-      while now < end_time:
-        time_left = (end_time - now).seconds
-        AppScaleLogger.log('[{0}] {1} seconds left...'.format(now, time_left))
-        instance_info = self.describe_instances(parameters)
-        public_ips = instance_info[0]
-        private_ips = instance_info[1]
-        instance_ids = instance_info[2]
-        public_ips = self.diff(public_ips, active_public_ips)
-        private_ips = self.diff(private_ips, active_private_ips)
-        instance_ids = self.diff(instance_ids, active_instances)
-        if count == len(public_ips):
-          break
-        time.sleep(self.SLEEP_TIME)
-        now = datetime.datetime.now()
+        booted_ids, public_ips, private_ips = self.run_instance_batches(count,
+          parameters, end_time)
 
       if not public_ips:
         self.handle_failure('No public IPs were able to be procured '
                             'within the time limit')
 
-      if len(public_ips) != count:
-        for index in range(0, len(public_ips)):
-          if public_ips[index] == '0.0.0.0':
-            instance_to_term = instance_ids[index]
-            AppScaleLogger.log('Instance {0} failed to get a public IP address and' \
-                      ' is being terminated'.format(instance_to_term))
-            conn.terminate_instances([instance_to_term])
-
       end_time = datetime.datetime.now()
       total_time = end_time - start_time
       if spot:
@@ -318,11 +415,253 @@ class EC2Agent(BaseAgent):
       else:
         AppScaleLogger.log('TIMING: It took {0} seconds to spawn {1} ' \
                   'regular instances'.format(total_time.seconds, count))
-      return instance_ids, public_ips, private_ips
+      return booted_ids, public_ips, private_ips
     except EC2ResponseError as exception:
       self.handle_failure('EC2 response error while starting VMs: ' +
                           exception.error_message)
 
+  def run_instance_batches(self, count, parameters, end_time):
+    """
+    Starts the specified number of instances in concurrent batches of at
+    most MAX_BATCH_SIZE instances, spreading the batches across the
+    availability zones in the 'zones' parameter (if any). Batches that the
+    cloud can only partially fill are accepted, and if fewer instances boot
+    than we asked for, we make up the difference with up to MAX_TOP_UPS more
+    rounds of batches, waiting longer before each one. If any batch fails
+    outright, every instance started so far is terminated before the error
+    is raised.
+
+    Args:
+      count       No. of VMs to spawn
+      parameters  A dictionary of parameters, as given to run_instances
+      end_time    The datetime after which we stop waiting for instances
+
+    Returns:
+      A tuple of the form (instances, public_ips, private_ips), containing
+      the instances that booted, which may be fewer than were asked for
+    """
+    zones = parameters.get(self.PARAM_ZONES) or [None]
+    booted_ids, public_ips, private_ips = [], [], []
+    batch_number = 0
+    delay = self.INITIAL_TOP_UP_DELAY
+    for attempt in range(self.MAX_TOP_UPS + 1):
+      needed = count - len(booted_ids)
+      if needed <= 0:
+        break
+      time_left = (end_time - datetime.datetime.now()).total_seconds()
+      if time_left <= 0:
+        break
+      if attempt:
+        AppScaleLogger.log('Only {0} of {1} instances booted, so starting ' \
+          '{2} more in {3} seconds'.format(len(booted_ids), count, needed,
+          int(min(delay, time_left))))
+        time.sleep(min(delay, time_left))
+        delay *= self.TOP_UP_BACKOFF_FACTOR
+        if datetime.datetime.now() >= end_time:
+          break
+
+      batches = {}
+      while needed > 0:
+        size = min(needed, self.MAX_BATCH_SIZE)
+        batches[batch_number] = (size, zones[batch_number % len(zones)])
+        batch_number += 1
+        needed -= size
+
+      def run_batch(number):
+        """Starts a single batch of instances, and waits for them to boot."""
+        size, zone = batches[number]
+        return self.run_instance_batch(parameters, end_time, number, size,
+          zone)
+
+      results, errors = ParallelHelper.run_on_hosts(sorted(batches.keys()),
+        run_batch, max_threads=self.MAX_CONCURRENT_BATCHES)
+      for number in sorted(results.keys()):
+        booted_ids.extend(results[number][0])
+        public_ips.extend(results[number][1])
+        private_ips.extend(results[number][2])
+
+      if errors:
+        failure = errors[min(errors.keys())]
+        # Nobody will ever hear about the instances that the other batches
+        # booted, so don't leave them running.
+        self.terminate_started_instances(parameters, booted_ids)
+        raise failure
+
+    if len(booted_ids) < count:
+      AppScaleLogger.log('Only {0} of {1} instances could be started'.format(
+        len(booted_ids), count))
+    return booted_ids, public_ips, private_ips
+
+  def run_instance_batch(self, parameters, end_time, batch_number, size,
+    zone):
+    """
+    Asks for up to the given number of instances in a single run-instances
+    request, and waits for the ones that the cloud starts to boot.
+
+    Args:
+      parameters    A dictionary of parameters, as given to run_instances
+      end_time      The datetime after which we stop waiting for instances
+      batch_number  The number that identifies this batch in our logs
+      size          The most instances to start in this batch
+      zone          The availability zone to start the instances in, or None
+                    to let the cloud pick
+
+    Returns:
+      A tuple of the form (instances, public_ips, private_ips), containing
+      the instances in this batch that booted
+    """
+    start_time = datetime.datetime.now()
+    conn = self.open_connection(parameters)
+    try:
+      reservation = conn.run_instances(parameters[self.PARAM_IMAGE_ID], 1,
+        size, key_name=parameters[self.PARAM_KEYNAME],
+        security_groups=[parameters[self.PARAM_GROUP]],
+        instance_type=parameters[self.PARAM_INSTANCE_TYPE], placement=zone)
+    except EC2ResponseError as exception:
+      if exception.error_code not in self.CAPACITY_ERROR_CODES:
+        raise
+      AppScaleLogger.log('Batch {0} couldn\'t start any instances: {1}'
+        .format(batch_number, exception.error_message))
+      return [], [], []
+
+    instance_ids = [instance.id for instance in reservation.instances]
+    try:
+      booted = self.boot_instances(parameters, instance_ids, end_time)
+    except Exception:
+      self.terminate_started_instances(parameters, instance_ids)
+      raise
+    total_time = datetime.datetime.now() - start_time
+    AppScaleLogger.log('TIMING: Batch {0} booted {1} of {2} instances in {3} ' \
+      'seconds'.format(batch_number, len(booted[0]), size, total_time.seconds))
+    return booted
+
+  def boot_instances(self, parameters, instance_ids, end_time):
+    """
+    Waits for the given instances to boot, and terminates the ones that
+    don't, since they'll never be of any use to us.
+
+    Args:
+      parameters    A dictionary containing the 'keyname' parameter
+      instance_ids  A list of the IDs of the instances to wait for
+      end_time      The datetime after which we stop waiting
+
+    Returns:
+      A tuple of the form (instances, public_ips, private_ips), containing
+      only the instances that booted
+    """
+    booted = self.wait_for_instances(parameters, instance_ids, end_time)
+    failed_ids = [instance_id for instance_id in instance_ids
+      if instance_id not in booted[0]]
+    if failed_ids:
+      AppScaleLogger.log('Instances {0} failed to get a public IP address ' \
+        'and are being terminated'.format(', '.join(failed_ids)))
+      self.open_connection(parameters).terminate_instances(failed_ids)
+    return booted
+
+  def terminate_started_instances(self, parameters, instance_ids):
+    """
+    Terminates instances that we started but can't hand back to our caller
+    (because starting other instances failed), so that they don't keep
+    running unnoticed. Failing to terminate them is only logged, so that our
+    caller sees the error that got us here instead.
+
+    Args:
+      parameters    A dictionary containing the 'credentials' parameter
+      instance_ids  A list of the IDs of the instances to terminate
+    """
+    if not instance_ids:
+      return
+    AppScaleLogger.log('Terminating instances {0}, since we couldn\'t ' \
+      'finish starting instances'.format(', '.join(instance_ids)))
+    try:
+      self.open_connection(parameters).terminate_instances(instance_ids)
+    except (socket.error, EC2ResponseError) as exception:
+      AppScaleLogger.log('Couldn\'t terminate instances {0}: {1}'.format(
+        ', '.join(instance_ids), exception))
+
+  def wait_for_instances(self, parameters, instance_ids, end_time):
+    """
+    Waits for the given instances to boot, asking about only the instances
+    that are still booting each time. We check back quickly at first, since
+    small instances can boot in seconds, and then back off so that slow
+    clouds aren't flooded with requests.
+
+    Args:
+      parameters    A dictionary containing the 'keyname' parameter
+      instance_ids  A list of the IDs of the instances to wait for
+      end_time      The datetime after which we stop waiting
+
+    Returns:
+      A tuple of the form (instances, public_ips, private_ips), containing
+      only the instances that booted, in the order they were given
+    """
+    booting = list(instance_ids)
+    states = {}
+    addresses = {}
+    delay = self.INITIAL_POLL_DELAY
+    while booting:
+      time_left = (end_time - datetime.datetime.now()).total_seconds()
+      if time_left <= 0:
+        break
+      AppScaleLogger.log('{0} of {1} instances booted, {2} seconds left...'
+        .format(len(addresses), len(instance_ids), int(time_left)))
+      time.sleep(min(delay, time_left))
+      delay = min(delay * self.POLL_BACKOFF_FACTOR, self.SLEEP_TIME)
+
+      try:
+        records = self.describe_instance_records(parameters,
+          instance_ids=booting, states=None)
+      except EC2ResponseError as exception:
+        if exception.error_code != self.INSTANCE_NOT_FOUND_ERROR:
+          raise
+        continue
+
+      for record in records:
+        instance_id = record['id']
+        if instance_id not in booting:
+          continue
+        if states.get(instance_id) != record['state']:
+          AppScaleLogger.log('Instance {0} is now {1}'.format(instance_id,
+            record['state']))
+          states[instance_id] = record['state']
+
+        if record['state'] in self.FAILED_STATES:
+          booting.remove(instance_id)
+        elif record['state'] == 'running' and record['public_ip'] and \
+          record['public_ip'] != self.NO_PUBLIC_IP:
+          addresses[instance_id] = (record['public_ip'], record['private_ip'])
+          booting.remove(instance_id)
+
+    booted_ids = [instance_id for instance_id in instance_ids
+      if instance_id in addresses]
+    public_ips = [addresses[instance_id][0] for instance_id in booted_ids]
+    private_ips = [addresses[instance_id][1] for instance_id in booted_ids]
+    return booted_ids, public_ips, private_ips
+
+  def wait_for_spot_requests(self, conn, spot_requests, end_time):
+    """
+    Waits for the given spot instance requests to be fulfilled.
+
+    Args:
+      conn           A connection to the back-end EC2 APIs
+      spot_requests  A list of the boto SpotInstanceRequests to wait for
+      end_time       The datetime after which we stop waiting
+
+    Returns:
+      A list of the IDs of the instances started for the fulfilled requests
+    """
+    request_ids = [request.id for request in spot_requests]
+    delay = self.INITIAL_POLL_DELAY
+    while True:
+      instance_ids = [request.instance_id for request in spot_requests
+        if request.instance_id]
+      time_left = (end_time - datetime.datetime.now()).total_seconds()
+      if len(instance_ids) == len(request_ids) or time_left <= 0:
+        return instance_ids
+      time.sleep(min(delay, time_left))
+      delay = min(delay * self.POLL_BACKOFF_FACTOR, self.SLEEP_TIME)
+      spot_requests = conn.get_all_spot_instance_requests(request_ids)
+
   def terminate_instances(self, parameters):
     """
     Stop one of more EC2 instances using. The input instance IDs are
@@ -404,6 +743,58 @@ class EC2Agent(BaseAgent):
     return plus_twenty
 
   def open_connection(self, parameters):
+    """
+    Returns a connection to the back-end EC2 APIs. Every connection opened
+    with the same credentials and endpoint shares one Boto connection (and
+    thus its HTTPS connections), and calls through it that fail because of
+    socket or authentication errors are retried once on a new connection.
+
+    Args:
+      parameters  A dictionary containing the 'credentials' parameter.
+
+    Returns:
+      A CloudConnection, which can be used just like a Boto EC2Connection
+    """
+    return CloudConnection(self, parameters)
+
+  def get_connection(self, parameters, replace=False):
+    """
+    Returns the Boto connection for the given credentials and endpoint,
+    making one if we haven't already.
+
+    Args:
+      parameters  A dictionary containing the 'credentials' parameter.
+      replace     True if the connection we already have is broken, and
+                  should be replaced with a new one.
+
+    Returns:
+      An instance of Boto EC2Connection
+    """
+    key = self.get_connection_key(parameters)
+    with self.connections_lock:
+      if replace or key not in self.connections:
+        self.connections[key] = self.create_connection(parameters)
+      return self.connections[key]
+
+  def get_connection_key(self, parameters):
+    """
+    Determines which connections can be shared with each other: those made
+    with the same credentials to the same endpoint.
+
+    Args:
+      parameters  A dictionary containing the 'credentials' parameter.
+
+    Returns:
+      A tuple that uniquely identifies the connection's credentials and
+      endpoint
+    """
+    credentials = parameters[self.PARAM_CREDENTIALS]
+    return (str(credentials.get('EC2_URL')),
+      str(credentials['EC2_ACCESS_KEY']),
+      hashlib.sha1(str(credentials['EC2_SECRET_KEY'])).hexdigest(),
+      bool(parameters.get('IS_VERBOSE')))
+
+  def create_connection(self, parameters):
     """
     Initialize a connection to the back-end EC2 APIs.
 
@@ -417,6 +808,22 @@ class EC2Agent(BaseAgent):
     return boto.connect_ec2(str(credentials['EC2_ACCESS_KEY']),
       str(credentials['EC2_SECRET_KEY']))
 
+  def is_connection_error(self, exception):
+    """
+    Decides if the given exception means that the connection it was raised
+    by is broken, and should be replaced.
+
+    Args:
+      exception  The exception that a call to the cloud raised
+
+    Returns:
+      True if the connection should be replaced, and False otherwise
+    """
+    if isinstance(exception, socket.error):
+      return True
+    return isinstance(exception, EC2ResponseError) and \
+      (exception.status == 401 or exception.error_code in self.AUTH_ERROR_CODES)
+
   def handle_failure(self, msg):
     """
     Log the specified error message and raise an AgentRuntimeException
@@ -430,3 +837,57 @@ class EC2Agent(BaseAgent):
     AppScaleLogger.log(msg)
     raise AgentRuntimeException(msg)
 
+
+
+class CloudConnection:
+  """
+  CloudConnection stands in for the Boto connection that an agent has opened
+  to its cloud. Calls made through it go to the agent's shared connection,
+  and if one fails because the connection is broken (see
+  EC2Agent.is_connection_error), the connection is replaced. Calls that only
+  read from the cloud are then tried once more on the new connection, while
+  all others (and calls whose credentials were rejected) raise the error.
+  """
+
+  def __init__(self, agent, parameters):
+    """
+    Creates a new CloudConnection.
+
+    Args:
+      agent       The EC2Agent (or subclass) whose connections we use
+      parameters  A dictionary containing the 'credentials' parameter
+    """
+    self.agent = agent
+    self.parameters = parameters
+
+  def __getattr__(self, name):
+    """
+    Looks up the named attribute on the agent's shared connection, wrapping
+    methods so that the connection is replaced if it breaks, and read-only
+    methods are retried on the new connection.
+
+    Args:
+      name  A str naming the attribute to look up
+
+    Returns:
+      The attribute's value, or a function that calls the named method
+    """
+    value = getattr(self.agent.get_connection(self.parameters), name)
+    if not callable(value):
+      return value
+
+    def call_with_retry(*args, **kwargs):
+      try:
+        return value(*args, **kwargs)
+      except (socket.error, EC2ResponseError) as exception:
+        if not self.agent.is_connection_error(exception):
+          raise
+        AppScaleLogger.log('Reconnecting to the cloud after error: {0}'
+          .format(exception))
+        connection = self.agent.get_connection(self.parameters, replace=True)
+        if isinstance(exception, EC2ResponseError) or \
+          not name.startswith(self.agent.READ_ONLY_METHOD_PREFIXES):
+          raise
+        return getattr(connection, name)(*args, **kwargs)
+
+    return call_with_retry
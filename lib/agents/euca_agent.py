@@ -32,7 +32,12 @@ class EucalyptusAgent(EC2Agent):
   REQUIRED_CREDENTIALS = REQUIRED_EUCA_CREDENTIALS
 
 
-  def open_connection(self, parameters):
+  # The version of the EC2 API that Eucalyptus speaks predates paging through
+  # describe-instances results, so we get them all at once.
+  DESCRIBE_INSTANCES_PAGE_SIZE = None
+
+
+  def create_connection(self, parameters):
     """
     Initialize a connection to the back-end Eucalyptus APIs.
 
@@ -17,6 +17,7 @@ import SOAPpy
 # AppScale-specific imports
 from appscale_logger import AppScaleLogger
 from custom_exceptions import AppControllerException
+from soap_transport import PooledTransport
 
 
 class AppControllerClient():
@@ -55,9 +56,33 @@ class AppControllerClient():
     self.host = host
     self.server = SOAPpy.SOAPProxy('https://%s:%s' % (host,
       self.PORT))
+
+    # Reuse connections to this host (and every other host we talk to) across
+    # requests and clients, instead of opening a new one per request.
+    self.server.transport = PooledTransport()
     self.secret = secret
 
 
+  def batch(self, method_names):
+    """Makes several calls to this AppController, one after another.
+
+    SOAP has no way to make several calls in one request, and httplib can't
+    send a request until it has read the response to the last one, so these
+    calls aren't pipelined. But since every call to the same host goes over
+    the same kept-alive connection, batching calls this way only pays for
+    connecting to the AppController once.
+
+    Args:
+      method_names: A list of strs naming AppControllerClient methods that
+        take no arguments (e.g., 'get_all_public_ips'), in the order they
+        should be called.
+    Returns:
+      A list containing the value that each method returned, in the same
+      order as method_names.
+    """
+    return [getattr(self, method_name)() for method_name in method_names]
+
+
   def set_parameters(self, locations, credentials, app=None):
     """Passes the given parameters to an AppController, allowing it to start
     configuring API services in this AppScale deployment.
@@ -5,6 +5,7 @@
 # General-purpose Python libraries
 import os
 import re
+import tarfile
 import yaml
 
 
@@ -99,15 +100,33 @@ class AppEngineHelper():
         application.
     """
     app_config_file = cls.get_config_file_from_dir(app_dir)
+    return cls.get_app_id_from_config_contents(app_config_file,
+      cls.read_file(app_config_file))
+
+
+  @classmethod
+  def get_app_id_from_config_contents(cls, app_config_file, contents):
+    """Parses the given App Engine configuration file to determine what the
+    user has set as this application's name.
+
+    Args:
+      app_config_file: A str naming the configuration file (an app.yaml or
+        appengine-web.xml file).
+      contents: A str containing the configuration file's contents.
+    Returns:
+      A str indicating the application ID for this application.
+    Raises:
+      AppEngineConfigException: If there is no application ID set for this
+        application.
+    """
     if cls.FILE_IS_YAML.search(app_config_file):
-      yaml_contents = yaml.safe_load(cls.read_file(app_config_file))
+      yaml_contents = yaml.safe_load(contents)
       if 'application' in yaml_contents and yaml_contents['application'] != '':
         return yaml_contents['application']
       else:
         raise AppEngineConfigException("No application id set in your app.yaml")
     else:
-      xml_contents = cls.read_file(app_config_file)
-      app_id_matchdata = cls.JAVA_APP_ID_REGEX.search(xml_contents)
+      app_id_matchdata = cls.JAVA_APP_ID_REGEX.search(contents)
       if app_id_matchdata:
         return app_id_matchdata.group(1)
       else:
@@ -132,8 +151,26 @@ class AppEngineHelper():
       AppEngineConfigException: If there is no runtime set for this application.
     """
     app_config_file = cls.get_config_file_from_dir(app_dir)
+    return cls.get_app_runtime_from_config_contents(app_config_file,
+      cls.read_file(app_config_file))
+
+
+  @classmethod
+  def get_app_runtime_from_config_contents(cls, app_config_file, contents):
+    """Parses the given App Engine configuration file to determine what
+    language runtime should be used to deploy this app.
+
+    Args:
+      app_config_file: A str naming the configuration file (an app.yaml or
+        appengine-web.xml file).
+      contents: A str containing the configuration file's contents.
+    Returns:
+      A str indicating which runtime should be used to run this application.
+    Raises:
+      AppEngineConfigException: If there is no runtime set for this application.
+    """
     if cls.FILE_IS_YAML.search(app_config_file):
-      yaml_contents = yaml.safe_load(cls.read_file(app_config_file))
+      yaml_contents = yaml.safe_load(contents)
       if 'runtime' in yaml_contents and yaml_contents['runtime'] in \
         cls.ALLOWED_RUNTIMES:
         return yaml_contents['runtime']
@@ -167,6 +204,54 @@ class AppEngineHelper():
         "appengine-web.xml file in {0}".format(app_dir))
 
 
+  @classmethod
+  def get_config_from_tarball(cls, tar_location):
+    """Reads the app.yaml or appengine-web.xml file out of the given App Engine
+    app, which has been packaged as a tar.gz file, without extracting the rest
+    of the app.
+
+    Args:
+      tar_location: The location on the local filesystem where the tar.gz
+        file can be found.
+    Returns:
+      A tuple containing a str naming the configuration file that we found,
+        and a str containing its contents.
+    Raises:
+      AppEngineConfigException: If the tar.gz file can't be read, or if there
+        is no configuration file in it.
+    """
+    app_yaml = cls.get_app_yaml_location(os.curdir)
+    appengine_web_xml = cls.get_appengine_web_xml_location(os.curdir)
+
+    try:
+      tar = tarfile.open(tar_location, 'r:gz')
+    except (IOError, tarfile.TarError) as exception:
+      raise AppEngineConfigException("Couldn't read {0}: {1}".format(
+        tar_location, exception))
+
+    try:
+      xml_contents = None
+      for member in tar:
+        if not member.isfile():
+          continue
+        path = os.path.join(os.curdir, os.path.normpath(member.name))
+        if path == app_yaml:
+          # app.yaml takes precedence, so we can stop as soon as we find it.
+          return app_yaml, tar.extractfile(member).read()
+        elif path == appengine_web_xml:
+          xml_contents = tar.extractfile(member).read()
+    except (IOError, tarfile.TarError) as exception:
+      raise AppEngineConfigException("Couldn't read {0}: {1}".format(
+        tar_location, exception))
+    finally:
+      tar.close()
+
+    if xml_contents is None:
+      raise AppEngineConfigException("Couldn't find an app.yaml or " +
+        "appengine-web.xml file in {0}".format(tar_location))
+    return appengine_web_xml, xml_contents
+
+
   @classmethod
   def validate_app_id(cls, app_id):
     """Checks the given app_id to make sure that it represents an app_id that
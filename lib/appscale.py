@@ -3,12 +3,15 @@
 
 
 # First party Python libraries
+import Queue
 import base64
 import json
 import os
 import shutil
 import socket
 import subprocess
+import sys
+import threading
 
 
 # Third-party Python libraries
@@ -28,6 +31,7 @@ from custom_exceptions import UsageException
 from appscale_tools import AppScaleTools
 from parse_args import ParseArgs
 from remote_helper import RemoteHelper
+from role_index import RoleIndex
 
 
 class AppScale():
@@ -55,6 +59,22 @@ class AppScale():
   APPSCALE_DIRECTORY = os.path.expanduser("~") + os.sep + ".appscale" + os.sep
 
 
+  # The argument to 'appscale tail' that indicates that logs should be tailed
+  # from every machine in the deployment.
+  ALL_NODES = "all"
+
+
+  # The number of lines that 'appscale tail' buffers from each machine when
+  # tailing logs from more than one machine. Once a machine's buffer fills up,
+  # we stop reading from that machine until its lines have been printed.
+  TAIL_BUFFER_SIZE = 100
+
+
+  # The number of seconds to wait for any machine to send us a line when
+  # tailing logs from more than one machine, before checking again.
+  TAIL_POLL_INTERVAL = 0.5
+
+
   # The usage that should be displayed to users if they call 'appscale'
   # with a bad directive or ask for help.
   USAGE = """
@@ -307,20 +327,24 @@ Available commands:
     Args:
       node: An int that represents the node to SSH to. The value is used as an
         index into the list of nodes running in the AppScale deployment,
-        starting with zero.
+        starting with zero. Alternatively, a str containing a role query
+        (e.g., 'appengine'), to SSH to the first node that matches it.
     Raises:
       AppScalefileException: If there is no AppScalefile in the current
         directory.
-      TypeError: If the user does not provide an integer for 'node'.
+      TypeError: If the user does not provide an integer or a role query for
+        'node'.
     """
     contents = self.read_appscalefile()
     contents_as_yaml = yaml.safe_load(contents)
 
-    # make sure the user gave us an int for node
+    # make sure the user gave us an int or a role query for node
     try:
       index = int(node)
     except ValueError:
-      raise TypeError("Usage: appscale ssh <node id to ssh to>")
+      index = None
+      if not self.is_valid_role_query(node):
+        raise TypeError("Usage: appscale ssh <node id or role to ssh to>")
 
     # get a list of the nodes running
     if 'keyname' in contents_as_yaml:
@@ -335,14 +359,21 @@ Available commands:
       raise AppScaleException("AppScale does not currently appear to" +
         " be running. Please start it and try again.")
 
-    # make sure there is a node at position 'index'
     nodes = json.loads(nodes_json_raw)
-    try:
-      ip = nodes[index]['public_ip']
-    except IndexError:
-      raise AppScaleException("Cannot ssh to node at index " +
-        str(index) + ", as there are only " + str(len(nodes)) +
-        " in the currently running AppScale deployment.")
+    if index is None:
+      ips = RoleIndex(nodes).query(node)
+      if not ips:
+        raise AppScaleException("No machines in the currently running " + \
+          "AppScale deployment match the role query {0}.".format(node))
+      ip = ips[0]
+    else:
+      # make sure there is a node at position 'index'
+      try:
+        ip = nodes[index]['public_ip']
+      except IndexError:
+        raise AppScaleException("Cannot ssh to node at index " +
+          str(index) + ", as there are only " + str(len(nodes)) +
+          " in the currently running AppScale deployment.")
 
     # construct the ssh command to exec with that IP address
     command = ["ssh", "-o", "StrictHostkeyChecking=no", "-i",
@@ -422,24 +453,29 @@ Available commands:
     directory, and then tail it.
 
     Args:
-      node: An int that indicates the id of the machine to tail logs from.
+      node: An int that indicates the id of the machine to tail logs from, the
+        str 'all' to tail logs from every machine, or a str containing a role
+        query to tail logs from every machine that matches it (e.g.,
+        'appengine', or 'memcache+database').
       file_regex: The regular expression that should be used to indicate which
         logs to tail from on the remote host.
     Raises:
       AppScalefileException: If there is no AppScalefile in the current working
         directory.
-      TypeError: If index is not an int.
+      TypeError: If node is not an int, 'all', or a role query.
     """
     contents = self.read_appscalefile()
     contents_as_yaml = yaml.safe_load(contents)
 
-    # ensure that index is an int
-    # TODO(cgb): Consider node = *, to tail from all nodes.
+    # ensure that node is an index, 'all', or a role query
     try:
       index = int(node)
     except ValueError:
-      raise TypeError("Usage: appscale tail <node id to tail from> " + \
-        "<regex of files to tail>\nExample: appscale tail 0 controller*")
+      index = None
+      if node != self.ALL_NODES and not self.is_valid_role_query(node):
+        raise TypeError("Usage: appscale tail <node id, role, or 'all' to " + \
+          "tail from> <regex of files to tail>\nExample: appscale tail 0 " + \
+          "controller*")
 
     # get a list of the nodes running
     if 'keyname' in contents_as_yaml:
@@ -453,9 +489,25 @@ Available commands:
     except IOError as e:
       raise AppScaleException("AppScale does not currently appear to" +
         " be running. Please start it and try again.")
+    nodes = json.loads(nodes_json_raw)
+
+    # construct the command to tail logs with
+    tail = "tail -f /var/log/appscale/" + str(file_regex)
+
+    if index is None:
+      role_index = RoleIndex(nodes)
+      if node == self.ALL_NODES:
+        ips = role_index.get_all_hosts()
+      else:
+        ips = role_index.query(node)
+
+      if not ips:
+        raise AppScaleException("No machines in the currently running " + \
+          "AppScale deployment match the role query {0}.".format(node))
+      self.tail_from_nodes(ips, keyname, tail)
+      return
 
     # make sure there is a node at position 'index'
-    nodes = json.loads(nodes_json_raw)
     try:
       ip = nodes[index]['public_ip']
     except IndexError:
@@ -464,20 +516,104 @@ Available commands:
         " in the currently running AppScale deployment.")
 
     # construct the ssh command to exec with that IP address
-    tail = "tail -f /var/log/appscale/" + str(file_regex)
     command = ["ssh", "-o", "StrictHostkeyChecking=no", "-i", self.get_key_location(keyname), "root@" + ip, tail]
 
     # exec the ssh command
     subprocess.call(command)
 
 
-  def logs(self, location):
+  def is_valid_role_query(self, role_query):
+    """Checks if the given str is a role query that only names roles that
+    machines in an AppScale deployment can run.
+
+    Args:
+      role_query: A str that may contain a role query (e.g., 'appengine' or
+        'memcache+database').
+    Returns:
+      True if role_query is a valid role query, and False otherwise.
+    """
+    try:
+      RoleIndex.validate_query(role_query)
+      return True
+    except BadConfigurationException:
+      return False
+
+
+  def tail_from_nodes(self, ips, keyname, tail):
+    """Runs the given tail command on many machines at once, and prints the
+    lines that each one produces as they come in, prefixed with the machine
+    that they came from.
+
+    Each machine gets its own buffer of lines, and we take lines from each
+    buffer in turn. If a machine produces lines faster than we can print them,
+    its buffer fills up, and we stop reading from it until it has room again,
+    so that one machine can't drown out the others.
+
+    Args:
+      ips: A list of strs, where each str is the IP address of a machine to
+        tail logs on.
+      keyname: A str representing the SSH keypair name used for this AppScale
+        deployment.
+      tail: A str containing the tail command to run on each machine.
+    """
+    processes = {}
+    buffers = {}
+    lines_ready = threading.Event()
+
+    def read_lines(ip):
+      """Moves lines from the given machine's ssh connection into its buffer,
+      blocking when the buffer is full, until the connection is closed."""
+      for line in iter(processes[ip].stdout.readline, ''):
+        buffers[ip].put(line)
+        lines_ready.set()
+      buffers[ip].put(None)
+      lines_ready.set()
+
+    try:
+      for ip in ips:
+        processes[ip] = subprocess.Popen(["ssh", "-o",
+          "StrictHostkeyChecking=no", "-i", self.get_key_location(keyname),
+          "root@" + ip, tail], stdout=subprocess.PIPE,
+          stderr=subprocess.STDOUT)
+        buffers[ip] = Queue.Queue(maxsize=self.TAIL_BUFFER_SIZE)
+        reader = threading.Thread(target=read_lines, args=(ip,))
+        reader.daemon = True
+        reader.start()
+
+      still_tailing = list(ips)
+      while still_tailing:
+        lines_ready.clear()
+        printed_line = False
+        for ip in list(still_tailing):
+          try:
+            line = buffers[ip].get_nowait()
+          except Queue.Empty:
+            continue
+
+          printed_line = True
+          if line is None:
+            still_tailing.remove(ip)
+          else:
+            sys.stdout.write("[{0}] {1}".format(ip, line.rstrip("\n") + "\n"))
+        sys.stdout.flush()
+
+        if not printed_line:
+          lines_ready.wait(self.TAIL_POLL_INTERVAL)
+    finally:
+      for process in processes.values():
+        if process.poll() is None:
+          process.terminate()
+
+
+  def logs(self, location, incremental=False):
     """'logs' provides a cleaner experience for users than the
     appscale-gather-logs command, by using the configuration options present in
     the AppScalefile found in the current working directory.
 
     Args:
       location: The path on the local filesystem where logs should be copied to.
+      incremental: A bool that indicates if we should only copy logs written
+        since the last time we copied logs to this location.
     Raises:
       AppScalefileException: If there is no AppScalefile in the current working
       directory.
@@ -494,6 +630,9 @@ Available commands:
     command.append("--location")
     command.append(location)
 
+    if incremental:
+      command.append("--incremental")
+
     # and exec it
     options = ParseArgs(command, "appscale-gather-logs").args
     try:
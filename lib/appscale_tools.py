@@ -7,8 +7,8 @@ import getpass
 import json
 import os
 import re
-import shutil
 import sys
+import tarfile
 import time
 
 
@@ -19,9 +19,12 @@ from appengine_helper import AppEngineHelper
 from appscale_logger import AppScaleLogger
 from custom_exceptions import AppScaleException
 from custom_exceptions import BadConfigurationException
+from key_pool import KeyPool
 from local_state import APPSCALE_VERSION
 from local_state import LocalState
 from node_layout import NodeLayout
+from parallel_helper import ParallelHelper
+from phase_timer import PhaseTimer
 from remote_helper import RemoteHelper
 from user_app_client import UserAppClient
 
@@ -53,6 +56,34 @@ class AppScaleTools():
   TAR_GZ_REGEX = re.compile('.tar.gz\Z')
 
 
+  # The name of the file that each machine's logs are copied into, within the
+  # directory that gather_logs creates for that machine.
+  LOGS_TARBALL_NAME = "appscale-logs.tar.gz"
+
+
+  # The name of the file that keeps track of how much of each of a machine's
+  # logs we've copied, within the directory that gather_logs creates for that
+  # machine, when logs are copied incrementally.
+  LOG_SYNC_STATE_NAME = ".appscale-log-sync.json"
+
+
+  # A regular expression that matches the state that an AppController reports
+  # itself as being in, in its status.
+  CURRENT_STATE_REGEX = re.compile(r'Current State: (.*)')
+
+
+  # A regular expression that matches how much CPU and memory an AppController
+  # reports its machine as using, in its status.
+  LOAD_REGEX = re.compile(r'Currently using ([\d.]+) Percent CPU and ' \
+    r'([\d.]+) Percent Memory')
+
+
+  # The column headers that describe_instances prints when reporting on each
+  # machine as a table.
+  NODE_TABLE_HEADERS = ["IP", "ROLES", "STATE", "CPU", "MEMORY",
+    "INITIALIZED", "LATENCY"]
+
+
   @classmethod
   def add_instances(cls, options):
     """Adds additional machines to an AppScale deployment.
@@ -99,6 +130,11 @@ class AppScaleTools():
       options: A Namespace that has fields for each parameter that can be
         passed in via the command-line interface.
     """
+    if not options.add_to_existing:
+      # Generate the new keypair while we check our commands and ask for the
+      # root password.
+      KeyPool.start()
+
     LocalState.require_ssh_commands(options.auto, options.verbose)
     LocalState.make_appscale_directory()
 
@@ -126,22 +162,46 @@ class AppScaleTools():
         "placement strategy: " + str(node_layout.errors()))
 
     all_ips = [node.id for node in node_layout.nodes]
-    for ip in all_ips:
-      # first, set up passwordless ssh
+
+    def copy_id(ip):
+      """Sets up passwordless ssh to the given machine."""
       AppScaleLogger.log("Executing ssh-copy-id for host: {0}".format(ip))
       if options.auto:
-        LocalState.shell("{0} root@{1} {2} {3}".format(cls.EXPECT_SCRIPT, ip,
-          private_key, password), options.verbose)
+        LocalState.run([cls.EXPECT_SCRIPT, "root@{0}".format(ip),
+          private_key, password], options.verbose,
+          retry_policy=LocalState.RETRY_ALWAYS)
       else:
-        LocalState.shell("ssh-copy-id -i {0} root@{1}".format(private_key, ip),
-          options.verbose)
+        LocalState.run(["ssh-copy-id", "-i", private_key,
+          "root@{0}".format(ip)], options.verbose,
+          retry_policy=LocalState.RETRY_ALWAYS)
 
-      # next, copy over the ssh keypair we generate
+    def copy_keypair(ip):
+      """Copies over the ssh keypair we generate to the given machine."""
       RemoteHelper.scp(ip, options.keyname, public_key, '/root/.ssh/id_rsa.pub',
         options.verbose)
       RemoteHelper.scp(ip, options.keyname, private_key, '/root/.ssh/id_rsa',
         options.verbose)
 
+    def set_up_node(ip):
+      """Sets up passwordless ssh to the given machine and copies over the
+      keypair we generate."""
+      copy_id(ip)
+      copy_keypair(ip)
+
+    if options.auto:
+      # ssh-copy-id doesn't need the user to type anything in, so we can set up
+      # every machine at once
+      _, errors = ParallelHelper.run_on_hosts(all_ips, set_up_node,
+        description="setting up passwordless ssh")
+    else:
+      # ssh-copy-id prompts the user for each machine's password, so do those
+      # one at a time, and then copy the keypair everywhere at once
+      for ip in all_ips:
+        copy_id(ip)
+      _, errors = ParallelHelper.run_on_hosts(all_ips, copy_keypair,
+        description="copying over the ssh keypair")
+    ParallelHelper.raise_if_any_failed(errors, "setting up passwordless ssh")
+
     AppScaleLogger.success("Generated a new SSH key for this deployment " + \
       "at {0}".format(private_key))
 
@@ -151,24 +211,181 @@ class AppScaleTools():
     """Queries each node in the currently running AppScale deployment and
     reports on their status.
 
+    Every node is queried at the same time, and nodes that don't respond
+    within options.timeout seconds are reported as unreachable.
+
     Args:
       options: A Namespace that has fields for each parameter that can be
         passed in via the command-line interface.
+    Returns:
+      A list of dicts, one per node, in the order that the head node lists
+      them. Each has the node's ip, roles, state, cpu and memory usage,
+      whether or not it is initialized, how many seconds it took to report
+      its status (latency), its full status, and the error we saw trying to
+      reach it (if any).
     """
     login_host = LocalState.get_login_host(options.keyname)
-    login_acc = AppControllerClient(login_host,
-      LocalState.get_secret_key(options.keyname))
+    secret = LocalState.get_secret_key(options.keyname)
+    all_ips, role_info = AppControllerClient(login_host, secret).batch(
+      ['get_all_public_ips', 'get_role_info'])
+    if options.roles:
+      all_ips = cls.get_hosts_matching_roles(all_ips, options.keyname,
+        options.roles)
 
-    for ip in login_acc.get_all_public_ips():
-      acc = AppControllerClient(ip, LocalState.get_secret_key(options.keyname))
-      AppScaleLogger.log("Status of node at {0}:".format(ip))
-      try:
-        AppScaleLogger.log(acc.get_status())
-      except Exception as e:
-        AppScaleLogger.warn("Unable to contact machine: {0}\n".format(str(e)))
+    roles = {}
+    for node in role_info:
+      roles[node['public_ip']] = node['jobs']
+
+    results, errors = ParallelHelper.run_on_hosts(all_ips,
+      lambda ip: cls.describe_node(ip, secret),
+      max_threads=options.concurrency, timeout=options.timeout)
+
+    nodes = []
+    for ip in all_ips:
+      if ip in results:
+        node = results[ip]
+      else:
+        node = {
+          'ip' : ip,
+          'state' : None,
+          'cpu' : None,
+          'memory' : None,
+          'initialized' : False,
+          'latency' : None,
+          'status' : None,
+          'error' : str(errors[ip])
+        }
+      node['roles'] = roles.get(ip, [])
+      nodes.append(node)
+
+    if options.format == "json":
+      AppScaleLogger.log(json.dumps(nodes, indent=2, sort_keys=True))
+      return nodes
+
+    if options.format == "table":
+      AppScaleLogger.log(cls.format_node_table(nodes))
+    else:
+      for node in nodes:
+        AppScaleLogger.log("Status of node at {0}:".format(node['ip']))
+        if node['error'] is None:
+          AppScaleLogger.log(node['status'])
+        else:
+          AppScaleLogger.warn("Unable to contact machine: {0}\n".format(
+            node['error']))
 
     AppScaleLogger.success("View status information about your AppScale " + \
       "deployment at http://{0}/status".format(login_host))
+    return nodes
+
+
+  @classmethod
+  def get_hosts_matching_roles(cls, ips, keyname, role_query):
+    """Narrows down the given machines to those that match a role query.
+
+    Args:
+      ips: A list of strs, the public IPs of the machines to choose from.
+      keyname: A str that uniquely identifies this AppScale deployment.
+      role_query: A str containing a role query (e.g., 'memcache+database').
+    Returns:
+      A list of strs, the machines in ips that match the role query, in the
+      same order.
+    Raises:
+      AppScaleException: If none of the machines match the role query.
+    """
+    matching = set(LocalState.get_role_index(keyname).query(role_query))
+    hosts = [ip for ip in ips if ip in matching]
+    if not hosts:
+      raise AppScaleException("No machines in the currently running " + \
+        "AppScale deployment match the role query {0}.".format(role_query))
+    return hosts
+
+
+  @classmethod
+  def describe_node(cls, ip, secret):
+    """Asks the AppController on a single node for its status.
+
+    Args:
+      ip: A str containing the public IP address of the node to query.
+      secret: A str containing the secret key, used to authenticate to the
+        AppController.
+    Returns:
+      A dict with the node's ip, state, cpu and memory usage, whether or not
+      it is initialized, how many seconds it took to answer both questions
+      (latency), and its full status.
+    """
+    start_time = time.time()
+    status, initialized = AppControllerClient(ip, secret).batch(
+      ['get_status', 'is_initialized'])
+    latency = time.time() - start_time
+
+    state = None
+    state_match = cls.CURRENT_STATE_REGEX.search(status)
+    if state_match:
+      state = state_match.group(1).strip()
+
+    cpu, memory = None, None
+    load_match = cls.LOAD_REGEX.search(status)
+    if load_match:
+      cpu, memory = float(load_match.group(1)), float(load_match.group(2))
+
+    return {
+      'ip' : ip,
+      'state' : state,
+      'cpu' : cpu,
+      'memory' : memory,
+      'initialized' : initialized,
+      'latency' : round(latency, 3),
+      'status' : status,
+      'error' : None
+    }
+
+
+  @classmethod
+  def format_node_table(cls, nodes):
+    """Lays out the given node reports as a table, one row per node.
+
+    Args:
+      nodes: A list of dicts, as returned by describe_instances.
+    Returns:
+      A str containing the table, with columns padded to line up.
+    """
+    rows = [cls.NODE_TABLE_HEADERS]
+    for node in nodes:
+      if node['error'] is None:
+        state = node['state'] or "-"
+        latency = "{0:.0f} ms".format(node['latency'] * 1000)
+      else:
+        state = "unreachable ({0})".format(node['error'])
+        latency = "-"
+
+      rows.append([
+        node['ip'],
+        ",".join(node['roles']) or "-",
+        state,
+        cls.format_percent(node['cpu']),
+        cls.format_percent(node['memory']),
+        "yes" if node['initialized'] else "no",
+        latency
+      ])
+
+    widths = [max([len(row[column]) for row in rows])
+      for column in range(len(cls.NODE_TABLE_HEADERS))]
+    return "\n".join(["  ".join([cell.ljust(width) for cell, width in
+      zip(row, widths)]).rstrip() for row in rows])
+
+
+  @classmethod
+  def format_percent(cls, percent):
+    """Converts the given percentage into a str for a table cell.
+
+    Args:
+      percent: A float, or None if the percentage isn't known.
+    Returns:
+      A str with the percentage and a percent sign, or '-' if it isn't known.
+    """
+    if percent is None:
+      return "-"
+    return "{0:.1f}%".format(percent)
 
 
   @classmethod
@@ -181,8 +398,9 @@ class AppScaleTools():
         passed in via the command-line interface.
     """
     # First, make sure that the place we want to store logs doesn't
-    # already exist.
-    if os.path.exists(options.location):
+    # already exist (unless we're adding to logs we've copied there before).
+    location_exists = os.path.exists(options.location)
+    if location_exists and not options.incremental:
       raise AppScaleException("Can't gather logs, as the location you " + \
         "specified, {0}, already exists.".format(options.location))
 
@@ -191,16 +409,153 @@ class AppScaleTools():
 
     # do the mkdir after we get the secret key, so that a bad keyname will
     # cause the tool to crash and not create this directory
-    os.mkdir(options.location)
+    if not location_exists:
+      os.mkdir(options.location)
+
+    def copy_logs(ip):
+      """Gets the logs from the given node as a compressed tarball, and stores
+      them in our local directory (unpacking them unless the user asked us not
+      to).
 
-    for ip in acc.get_all_public_ips():
-      # Get the logs from each node, and store them in our local directory
+      Returns:
+        An int indicating how many (compressed) bytes we copied.
+      """
       local_dir = "{0}/{1}".format(options.location, ip)
       os.mkdir(local_dir)
-      RemoteHelper.scp_remote_to_local(ip, options.keyname, '/var/log/appscale',
-        local_dir, options.verbose)
-    AppScaleLogger.success("Successfully copied logs to {0}".format(
-      options.location))
+      local_tarball = "{0}/{1}".format(local_dir, cls.LOGS_TARBALL_NAME)
+
+      start_time = time.time()
+      RemoteHelper.copy_remote_dir_as_tarball(ip, options.keyname,
+        '/var/log/appscale', local_tarball, options.verbose)
+      elapsed_time = max(time.time() - start_time, 0.001)
+      num_bytes = os.path.getsize(local_tarball)
+      AppScaleLogger.log("Copied {0} of logs from {1} in {2:.1f} seconds " \
+        "({3}/s)".format(cls.format_size(num_bytes), ip, elapsed_time,
+        cls.format_size(num_bytes / elapsed_time)))
+
+      if not options.compressed:
+        tar = tarfile.open(local_tarball, 'r:gz')
+        tar.extractall(local_dir)
+        tar.close()
+        os.remove(local_tarball)
+      return num_bytes
+
+    def sync_logs(ip):
+      """Gets only the parts of the given node's logs that we haven't copied
+      before, and adds them to the logs in our local directory.
+
+      Returns:
+        An int indicating how many bytes we copied.
+      """
+      local_dir = "{0}/{1}".format(options.location, ip)
+      if not os.path.exists(local_dir):
+        os.mkdir(local_dir)
+
+      start_time = time.time()
+      num_bytes, num_files = cls.sync_remote_logs(ip, options.keyname,
+        '/var/log/appscale', local_dir + '/appscale', "{0}/{1}".format(
+        local_dir, cls.LOG_SYNC_STATE_NAME), options.verbose)
+      elapsed_time = max(time.time() - start_time, 0.001)
+      AppScaleLogger.log("Copied {0} of new logs in {1} file(s) from {2} in " \
+        "{3:.1f} seconds ({4}/s)".format(cls.format_size(num_bytes), num_files,
+        ip, elapsed_time, cls.format_size(num_bytes / elapsed_time)))
+      return num_bytes
+
+    if options.incremental:
+      copy_function = sync_logs
+    else:
+      copy_function = copy_logs
+
+    all_ips = acc.get_all_public_ips()
+    if options.roles:
+      all_ips = cls.get_hosts_matching_roles(all_ips, options.keyname,
+        options.roles)
+
+    start_time = time.time()
+    results, errors = ParallelHelper.run_on_hosts(all_ips,
+      copy_function, max_threads=options.concurrency,
+      description="copying logs")
+    ParallelHelper.raise_if_any_failed(errors, "copying logs")
+    AppScaleLogger.success("Successfully copied {0} of logs from {1} " \
+      "machine(s) to {2} in {3:.1f} seconds".format(cls.format_size(
+      sum(results.values())), len(results), options.location,
+      time.time() - start_time))
+
+
+  @classmethod
+  def sync_remote_logs(cls, host, keyname, remote_dir, local_dir,
+    state_location, is_verbose):
+    """Brings a local copy of a remote machine's log directory up to date,
+    copying only the bytes that have been appended to each log since the last
+    time we synced it.
+
+    The state file records how much of each log we've copied, and a digest of
+    the start of each log. If a log has shrunk or its start has changed since
+    then (e.g., because it was rotated), or if our copy of it is gone, we copy
+    the whole log again.
+
+    Args:
+      host: A str representing the machine to copy logs from.
+      keyname: A str representing the name of the SSH keypair to log in with.
+      remote_dir: A str representing the path on the remote machine where the
+        logs can be found.
+      local_dir: A str representing the path on the local machine where the
+        logs should be copied to.
+      state_location: A str representing the path on the local machine where
+        we keep track of how much of each log we've copied.
+      is_verbose: A bool that indicates if we should print the commands we
+        execute to stdout.
+    Returns:
+      A tuple containing the number of bytes copied and the number of logs
+      that they were copied into.
+    """
+    old_state = {}
+    if os.path.exists(state_location):
+      with open(state_location, 'r') as file_handle:
+        try:
+          old_state = json.loads(file_handle.read())
+        except ValueError:
+          AppScaleLogger.warn("Couldn't read {0}, so copying all logs from " \
+            "{1} again".format(state_location, host))
+
+    new_state = {}
+    ranges = []
+    remote_files = RemoteHelper.list_remote_files(host, keyname, remote_dir,
+      is_verbose)
+    for path, (size, head_digest) in sorted(remote_files.items()):
+      previous = old_state.get(path)
+      if previous and previous['head'] == head_digest and \
+        previous['size'] <= size and os.path.exists(os.path.join(local_dir,
+        path)):
+        if previous['size'] < size:
+          ranges.append((path, previous['size'], size - previous['size']))
+      else:
+        ranges.append((path, 0, size))
+      new_state[path] = {'size' : size, 'head' : head_digest}
+
+    num_bytes = RemoteHelper.copy_remote_file_ranges(host, keyname, remote_dir,
+      ranges, local_dir, is_verbose)
+    with open(state_location, 'w') as file_handle:
+      file_handle.write(json.dumps(new_state))
+    return num_bytes, len(ranges)
+
+
+  @classmethod
+  def format_size(cls, num_bytes):
+    """Converts the given number of bytes into a str that is easier for
+    people to read.
+
+    Args:
+      num_bytes: An int or float indicating a number of bytes.
+    Returns:
+      A str with the given number of bytes, in the largest unit that keeps
+      the number at or above one (e.g., '1.5 MB').
+    """
+    for unit in ['B', 'KB', 'MB', 'GB']:
+      if num_bytes < 1024:
+        return "{0:.1f} {1}".format(num_bytes, unit)
+      num_bytes /= 1024.0
+    return "{0:.1f} TB".format(num_bytes)
 
 
   @classmethod
@@ -277,82 +632,115 @@ class AppScaleTools():
         contradictory options (e.g., running on EC2 but not specifying EC2
         credentials).
     """
+    PhaseTimer.reset()
     LocalState.make_appscale_directory()
     LocalState.ensure_appscale_isnt_running(options.keyname, options.force)
 
-    if options.infrastructure:
-      AppScaleLogger.log("Starting AppScale " + APPSCALE_VERSION +
-        " over the " + options.infrastructure + " cloud.")
-    else:
-      AppScaleLogger.log("Starting AppScale " + APPSCALE_VERSION +
-        " over a virtualized cluster.")
-    AppScaleLogger.remote_log_tools_state(options, "started")
+    # Time every phase, and report on them even if we fail partway through,
+    # since that's when knowing which phase was slow matters most.
+    try:
+      # The key for our self-signed certificate is generated while the head node
+      # boots, so there's only something to gain from the pool if it can hand
+      # us a key that an earlier run made (and make one for the next run).
+      if options.keep_spare_keys:
+        KeyPool.start(LocalState.get_spare_key_directory())
+
+      if options.infrastructure:
+        AppScaleLogger.log("Starting AppScale " + APPSCALE_VERSION +
+          " over the " + options.infrastructure + " cloud.")
+      else:
+        AppScaleLogger.log("Starting AppScale " + APPSCALE_VERSION +
+          " over a virtualized cluster.")
+      AppScaleLogger.remote_log_tools_state(options, "started")
+
+      node_layout = NodeLayout(options)
+      if not node_layout.is_valid():
+        raise BadConfigurationException("There were errors with your " + \
+          "placement strategy:\n{0}".format(str(node_layout.errors())))
+
+      if not node_layout.is_supported():
+        AppScaleLogger.warn("Warning: This deployment strategy is not " + \
+          "officially supported.")
+
+      with PhaseTimer.span('start_head_node'):
+        public_ip, instance_id = RemoteHelper.start_head_node(options,
+          node_layout)
+      AppScaleLogger.log("\nPlease wait for AppScale to prepare your " +
+        "machines for use.")
+
+      # Write our metadata as soon as possible to let users SSH into those
+      # machines via 'appscale ssh'
+      with PhaseTimer.span('copy_metadata'):
+        LocalState.update_local_metadata(options, node_layout, public_ip,
+          instance_id)
+        RemoteHelper.copy_local_metadata(public_ip, options.keyname,
+          options.verbose)
 
-    node_layout = NodeLayout(options)
-    if not node_layout.is_valid():
-      raise BadConfigurationException("There were errors with your " + \
-        "placement strategy:\n{0}".format(str(node_layout.errors())))
-
-    if not node_layout.is_supported():
-      AppScaleLogger.warn("Warning: This deployment strategy is not " + \
-        "officially supported.")
-
-    public_ip, instance_id = RemoteHelper.start_head_node(options, node_layout)
-    AppScaleLogger.log("\nPlease wait for AppScale to prepare your machines " +
-      "for use.")
-
-    # Write our metadata as soon as possible to let users SSH into those
-    # machines via 'appscale ssh'
-    LocalState.update_local_metadata(options, node_layout, public_ip,
-      instance_id)
-    RemoteHelper.copy_local_metadata(public_ip, options.keyname,
-      options.verbose)
+      with PhaseTimer.span('uaserver_wait'):
+        acc = AppControllerClient(public_ip, LocalState.get_secret_key(
+          options.keyname))
+        uaserver_host = acc.get_uaserver_host(options.verbose)
+        RemoteHelper.sleep_until_port_is_open(uaserver_host, UserAppClient.PORT,
+          options.verbose)
 
-    acc = AppControllerClient(public_ip, LocalState.get_secret_key(
-      options.keyname))
-    uaserver_host = acc.get_uaserver_host(options.verbose)
-    RemoteHelper.sleep_until_port_is_open(uaserver_host, UserAppClient.PORT,
-      options.verbose)
+      # Update our metadata again so that users can SSH into other boxes that
+      # may have been started.
+      with PhaseTimer.span('update_metadata'):
+        LocalState.update_local_metadata(options, node_layout, public_ip,
+          instance_id)
+        RemoteHelper.copy_local_metadata(public_ip, options.keyname,
+          options.verbose)
 
-    # Update our metadata again so that users can SSH into other boxes that
-    # may have been started.
-    LocalState.update_local_metadata(options, node_layout, public_ip,
-      instance_id)
-    RemoteHelper.copy_local_metadata(public_ip, options.keyname,
-      options.verbose)
+      AppScaleLogger.log("UserAppServer is at {0}".format(uaserver_host))
 
-    AppScaleLogger.log("UserAppServer is at {0}".format(uaserver_host))
+      uaserver_client = UserAppClient(uaserver_host,
+        LocalState.get_secret_key(options.keyname))
 
-    uaserver_client = UserAppClient(uaserver_host,
-      LocalState.get_secret_key(options.keyname))
+      if options.admin_user and options.admin_pass:
+        AppScaleLogger.log("Using the provided admin username/password")
+        username, password = options.admin_user, options.admin_pass
+      elif options.test:
+        AppScaleLogger.log("Using default admin username/password")
+        username = LocalState.DEFAULT_USER
+        password = LocalState.DEFAULT_PASSWORD
+      else:
+        username, password = LocalState.get_credentials()
+
+      with PhaseTimer.span('user_accounts'):
+        RemoteHelper.create_user_accounts(username, password, uaserver_host,
+          options.keyname)
+        uaserver_client.set_admin_role(username)
+
+      with PhaseTimer.span('node_initialization'):
+        RemoteHelper.wait_for_machines_to_finish_loading(public_ip,
+          options.keyname)
+        # Finally, update our metadata once we know that all of the machines are
+        # up and have started all their API services.
+        LocalState.update_local_metadata(options, node_layout, public_ip,
+          instance_id)
+        RemoteHelper.copy_local_metadata(public_ip, options.keyname,
+          options.verbose)
 
-    if options.admin_user and options.admin_pass:
-      AppScaleLogger.log("Using the provided admin username/password")
-      username, password = options.admin_user, options.admin_pass
-    elif options.test:
-      AppScaleLogger.log("Using default admin username/password")
-      username, password = LocalState.DEFAULT_USER, LocalState.DEFAULT_PASSWORD
-    else:
-      username, password = LocalState.get_credentials()
+      with PhaseTimer.span('load_balancer_wait'):
+        RemoteHelper.sleep_until_port_is_open(LocalState.get_login_host(
+          options.keyname), RemoteHelper.APP_LOAD_BALANCER_PORT,
+          options.verbose)
+      AppScaleLogger.success("AppScale successfully started!")
+      AppScaleLogger.success("View status information about your AppScale " + \
+        "deployment at http://{0}/status".format(LocalState.get_login_host(
+        options.keyname)))
+      AppScaleLogger.remote_log_tools_state(options, "finished")
+    finally:
+      # Let the spare key for the next run finish being written to disk.
+      KeyPool.stop()
 
-    RemoteHelper.create_user_accounts(username, password, uaserver_host,
-      options.keyname)
-    uaserver_client.set_admin_role(username)
-
-    RemoteHelper.wait_for_machines_to_finish_loading(public_ip, options.keyname)
-    # Finally, update our metadata once we know that all of the machines are
-    # up and have started all their API services.
-    LocalState.update_local_metadata(options, node_layout, public_ip,
-      instance_id)
-    RemoteHelper.copy_local_metadata(public_ip, options.keyname, options.verbose)
-
-    RemoteHelper.sleep_until_port_is_open(LocalState.get_login_host(
-      options.keyname), RemoteHelper.APP_LOAD_BALANCER_PORT, options.verbose)
-    AppScaleLogger.success("AppScale successfully started!")
-    AppScaleLogger.success("View status information about your AppScale " + \
-      "deployment at http://{0}/status".format(LocalState.get_login_host(
-      options.keyname)))
-    AppScaleLogger.remote_log_tools_state(options, "finished")
+      try:
+        PhaseTimer.write_report(LocalState.get_timing_report_location(
+          options.keyname))
+      except (IOError, OSError) as exception:
+        AppScaleLogger.warn("Couldn't write the timing report: {0}".format(
+          exception))
+      PhaseTimer.log_summary()
 
 
   @classmethod
@@ -377,6 +765,10 @@ class AppScaleTools():
       RemoteHelper.terminate_virtualized_cluster(options.keyname,
         options.verbose)
 
+    # The machines we were talking to are gone (or no longer run AppScale), so
+    # don't keep any SSH connections to them open.
+    RemoteHelper.close_ssh_connections(is_verbose=options.verbose)
+
     LocalState.cleanup_appscale_files(options.keyname)
     AppScaleLogger.success("Successfully shut down your AppScale deployment.")
 
@@ -389,17 +781,20 @@ class AppScaleTools():
       options: A Namespace that has fields for each parameter that can be
         passed in via the command-line interface.
     """
-    if cls.TAR_GZ_REGEX.search(options.file):
-      file_location = LocalState.extract_app_to_dir(options.file,
-        options.verbose)
-      created_dir = True
+    is_tarball = cls.TAR_GZ_REGEX.search(options.file)
+    if is_tarball:
+      # Only read the config file out of the tarball - we send the tarball
+      # itself to the login node as-is.
+      config_file, config_contents = AppEngineHelper.get_config_from_tarball(
+        options.file)
+      app_id = AppEngineHelper.get_app_id_from_config_contents(config_file,
+        config_contents)
+      app_language = AppEngineHelper.get_app_runtime_from_config_contents(
+        config_file, config_contents)
     else:
-      file_location = options.file
-      created_dir = False
-
-    app_id = AppEngineHelper.get_app_id_from_app_config(file_location)
-    app_language = AppEngineHelper.get_app_runtime_from_app_config(
-      file_location)
+      app_id = AppEngineHelper.get_app_id_from_app_config(options.file)
+      app_language = AppEngineHelper.get_app_runtime_from_app_config(
+        options.file)
     AppEngineHelper.validate_app_id(app_id)
 
     acc = AppControllerClient(LocalState.get_login_host(options.keyname),
@@ -434,8 +829,12 @@ class AppScaleTools():
     AppScaleLogger.log("Uploading {0}".format(app_id))
     userappclient.reserve_app_id(username, app_id, app_language)
 
-    remote_file_path = RemoteHelper.copy_app_to_host(file_location,
-      options.keyname, options.verbose)
+    if is_tarball:
+      remote_file_path = RemoteHelper.copy_app_tarball_to_host(options.file,
+        app_id, options.keyname, options.verbose)
+    else:
+      remote_file_path = RemoteHelper.copy_app_to_host(options.file,
+        options.keyname, options.verbose)
     acc.done_uploading(app_id, remote_file_path)
     acc.update([app_id])
 
@@ -448,6 +847,3 @@ class AppScaleTools():
       options.verbose)
     AppScaleLogger.success("Your app can be reached at the following URL: " +
       "http://{0}:{1}".format(serving_host, serving_port))
-
-    if created_dir:
-      shutil.rmtree(file_location)
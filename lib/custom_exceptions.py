@@ -47,7 +47,24 @@ class ShellException(Exception):
   """A special Exception class that should be thrown if a shell command is
   executed and has a non-zero return value.
   """
-  pass
+
+
+  def __init__(self, message, returncode=None, output=None, error=None):
+    """Creates a new ShellException.
+
+    Args:
+      message: A str that describes the command that failed.
+      returncode: An int that the failed command exited with, or None if it
+        never exited on its own (e.g., because it timed out).
+      output: A str containing what the failed command wrote to its standard
+        output.
+      error: A str containing what the failed command wrote to its standard
+        error, if it was kept separate from its standard output.
+    """
+    Exception.__init__(self, message)
+    self.returncode = returncode
+    self.output = output
+    self.error = error
 
 
 class UsageException(Exception):
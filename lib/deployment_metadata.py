@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import copy
+import json
+import os
+import yaml
+
+
+# AppScale-specific imports
+from role_index import RoleIndex
+
+
+class DeploymentMetadata():
+  """DeploymentMetadata keeps the metadata files that describe a single
+  AppScale deployment (its locations.yaml, locations.json, and secret key)
+  in memory, so that looking something up in them doesn't mean reading and
+  parsing them from disk each time.
+
+  Each file is only read again once it has changed on disk. We also index
+  the machines in locations.json with a RoleIndex, so that finding the
+  machines that run a given role doesn't mean searching through all of them.
+  """
+
+
+  def __init__(self, yaml_location, json_location, secret_location):
+    """Creates a new DeploymentMetadata.
+
+    Args:
+      yaml_location: A str naming the deployment's locations.yaml file.
+      json_location: A str naming the deployment's locations.json file.
+      secret_location: A str naming the file holding the deployment's secret
+        key.
+    """
+    self.yaml_location = yaml_location
+    self.json_location = json_location
+    self.secret_location = secret_location
+
+    # A dict that maps each file we've read to a tuple containing the
+    # modification time and size it had when we read it, and its parsed
+    # contents.
+    self.files = {}
+
+
+  def get_yaml(self):
+    """Returns the parsed contents of the deployment's locations.yaml file.
+
+    Returns:
+      A dict containing the deployment's YAML metadata.
+    """
+    return self.load(self.yaml_location, yaml.safe_load)
+
+
+  def get_nodes(self):
+    """Returns the parsed contents of the deployment's locations.json file.
+
+    Returns:
+      A list of dicts, where each dict contains information on a single
+      machine in this AppScale deployment. Callers get their own copy, which
+      they are free to modify.
+    """
+    nodes, _ = self.load(self.json_location, self.index_nodes)
+    return copy.deepcopy(nodes)
+
+
+  def get_secret(self):
+    """Returns the deployment's secret key.
+
+    Returns:
+      A str containing the secret key.
+    """
+    return self.load(self.secret_location, str)
+
+
+  def get_role_index(self):
+    """Returns an index of the machines in the deployment's locations.json
+    file.
+
+    Returns:
+      A RoleIndex over this deployment's machines.
+    """
+    _, role_index = self.load(self.json_location, self.index_nodes)
+    return role_index
+
+
+  def get_hosts_with_role(self, role):
+    """Finds every machine that runs the given role.
+
+    Args:
+      role: A str naming the role to search for.
+    Returns:
+      A list of strs, the public IPs of the machines that run the role, in the
+      order that locations.json lists them.
+    """
+    return self.get_role_index().get_hosts_with_role(role)
+
+
+  def get_roles_for_host(self, host):
+    """Finds every role that the given machine runs.
+
+    Args:
+      host: A str containing the public IP of the machine.
+    Returns:
+      A list of strs, the roles that the machine runs.
+    """
+    return self.get_role_index().get_roles_for_host(host)
+
+
+  def invalidate(self):
+    """Forgets everything we've read, so that the next lookup reads each file
+    from disk again. Callers should do this after writing to any of them."""
+    self.files.clear()
+
+
+  def load(self, location, parse):
+    """Reads and parses the given file, unless we've already done so and it
+    hasn't changed since.
+
+    Args:
+      location: A str naming the file to read.
+      parse: A function that converts the file's contents into the value
+        that callers should be given.
+    Returns:
+      The value that parse returned for the file's contents.
+    """
+    try:
+      stat = os.stat(location)
+      stamp = (stat.st_mtime, stat.st_size)
+    except OSError:
+      # If we can't tell when the file changes, we can't cache it.
+      stamp = None
+
+    cached = self.files.get(location)
+    if stamp is not None and cached is not None and cached[0] == stamp:
+      return cached[1]
+
+    with open(location, 'r') as file_handle:
+      contents = parse(file_handle.read())
+
+    if stamp is not None:
+      self.files[location] = (stamp, contents)
+    return contents
+
+
+  @classmethod
+  def index_nodes(cls, json_contents):
+    """Parses the contents of a locations.json file and indexes the machines
+    it lists.
+
+    Args:
+      json_contents: A str containing the JSON-encoded list of machines.
+    Returns:
+      A tuple containing the list of machines and a RoleIndex over them.
+    """
+    nodes = json.loads(json_contents)
+    return nodes, RoleIndex(nodes)
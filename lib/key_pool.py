@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import os
+import threading
+import uuid
+
+
+# Third-party imports
+import M2Crypto.BIO
+import M2Crypto.RSA
+
+
+class KeyPool():
+  """KeyPool generates RSA keys in the background, so that they are ready by
+  the time that we need them, instead of making callers wait for them.
+
+  Generating a 2048-bit key takes long enough to notice, so callers should
+  start the pool early (e.g., before they prompt the user for a password),
+  and take keys from it later. Each key is only ever handed out once.
+
+  The pool can also keep its spare keys on disk, so that a spare key made
+  (but not needed) by one run of the AppScale Tools is ready for the next.
+  Only a pool that does so replaces the keys taken from it, since a key made
+  in memory after the last one is taken would never be used.
+  """
+
+
+  # The number of bits in the keys that we generate.
+  KEY_SIZE = 2048
+
+
+  # The public exponent of the keys that we generate.
+  PUBLIC_EXPONENT = 65537
+
+
+  # The number of keys that we try to keep ready at all times.
+  SPARE_KEYS = 1
+
+
+  # The file extension that spare keys cached on disk have.
+  CACHED_KEY_EXTENSION = ".pem"
+
+
+  # A bool that indicates if we should replace keys as they are taken.
+  started = False
+
+
+  # A str naming the directory that spare keys are cached in, or None if they
+  # are only kept in memory.
+  cache_dir = None
+
+
+  # A list of tuples, each containing a spare M2Crypto.RSA.RSA key and the
+  # file it is cached in (or None if it isn't cached on disk).
+  spare_keys = []
+
+
+  # The number of keys that we're generating right now.
+  keys_in_progress = 0
+
+
+  # A condition that protects the pool's state, and is notified whenever a
+  # key finishes generating.
+  lock = threading.Condition()
+
+
+  @classmethod
+  def start(cls, cache_dir=None):
+    """Starts generating spare keys in the background.
+
+    Args:
+      cache_dir: A str naming the directory to cache spare keys in, or None
+        if they should only be kept in memory. Any keys already cached there
+        are used before we generate new ones.
+    """
+    with cls.lock:
+      cls.started = True
+      cls.cache_dir = cache_dir
+      if cache_dir:
+        cls.spare_keys.extend(cls.load_cached_keys(cache_dir))
+    cls.replenish()
+
+
+  @classmethod
+  def stop(cls):
+    """Stops generating spare keys, waiting for any that we're already
+    generating to finish, and forgets the spare keys we have in memory. Keys
+    cached on disk are kept for later."""
+    with cls.lock:
+      cls.started = False
+      while cls.keys_in_progress:
+        cls.lock.wait()
+      cls.spare_keys = []
+      cls.cache_dir = None
+
+
+  @classmethod
+  def get_key(cls):
+    """Takes a key from the pool, waiting for one that is being generated if
+    there are none ready, or generating one if there are none on the way. If
+    the pool caches its keys on disk, a replacement for the key is generated
+    in the background for the next run of the AppScale Tools.
+
+    Returns:
+      An M2Crypto.RSA.RSA key that no other caller has been (or will be)
+      given.
+    """
+    with cls.lock:
+      while not cls.spare_keys and cls.keys_in_progress:
+        cls.lock.wait()
+      if cls.spare_keys:
+        key, location = cls.spare_keys.pop(0)
+      else:
+        key, location = None, None
+
+    if key is None:
+      key = cls.generate_key()
+    elif location:
+      # Make sure that no later run of the tools hands out the same key.
+      os.remove(location)
+
+    if cls.cache_dir:
+      cls.replenish()
+    return key
+
+
+  @classmethod
+  def generate_key(cls):
+    """Generates a new RSA key.
+
+    Returns:
+      A new M2Crypto.RSA.RSA key.
+    """
+    return M2Crypto.RSA.gen_key(cls.KEY_SIZE, cls.PUBLIC_EXPONENT,
+      callback=lambda *args: None)
+
+
+  @classmethod
+  def replenish(cls):
+    """Starts generating enough keys in the background to bring the pool
+    back up to SPARE_KEYS keys, if the pool has been started."""
+    with cls.lock:
+      if not cls.started:
+        return
+      while len(cls.spare_keys) + cls.keys_in_progress < cls.SPARE_KEYS:
+        cls.keys_in_progress += 1
+        thread = threading.Thread(target=cls.generate_spare_key,
+          args=(cls.cache_dir,))
+        thread.daemon = True
+        thread.start()
+
+
+  @classmethod
+  def generate_spare_key(cls, cache_dir):
+    """Generates a key and adds it to the pool, caching it on disk if the
+    pool is configured to do so. This is run in its own thread.
+
+    Args:
+      cache_dir: A str naming the directory to cache the key in, or None.
+    """
+    try:
+      key = cls.generate_key()
+      if cache_dir:
+        location = cls.cache_key(key, cache_dir)
+      else:
+        location = None
+    except Exception:
+      # Callers that find the pool empty generate their own keys, so there's
+      # nothing more to do if this one failed.
+      key = None
+
+    with cls.lock:
+      cls.keys_in_progress -= 1
+      if key is not None:
+        cls.spare_keys.append((key, location))
+      cls.lock.notify_all()
+
+
+  @classmethod
+  def cache_key(cls, key, cache_dir):
+    """Writes the given key to the cache directory, readable only by us.
+
+    Args:
+      key: The M2Crypto.RSA.RSA key to cache.
+      cache_dir: A str naming the directory to cache the key in.
+    Returns:
+      A str naming the file that the key was written to.
+    """
+    if not os.path.exists(cache_dir):
+      os.makedirs(cache_dir, 0700)
+
+    location = os.path.join(cache_dir, str(uuid.uuid4()) +
+      cls.CACHED_KEY_EXTENSION)
+    temp_location = location + ".tmp"
+    cls.write_key(key, temp_location)
+
+    # Only give the key its real name once it's completely written, so that
+    # we never load a partially written key.
+    os.rename(temp_location, location)
+    return location
+
+
+  @classmethod
+  def write_key(cls, key, location):
+    """Writes the private half of the given key to a new file, which only we
+    can read from the moment that it's created.
+
+    Args:
+      key: The M2Crypto.RSA.RSA key to write.
+      location: A str naming the file to write the key to.
+    Raises:
+      OSError: If the file already exists.
+    """
+    file_descriptor = os.open(location, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+      0600)
+    with os.fdopen(file_descriptor, 'w') as file_handle:
+      file_handle.write(key.as_pem(cipher=None))
+
+
+  @classmethod
+  def load_cached_keys(cls, cache_dir):
+    """Loads the spare keys cached in the given directory.
+
+    Args:
+      cache_dir: A str naming the directory that keys are cached in.
+    Returns:
+      A list of tuples, each containing a cached M2Crypto.RSA.RSA key and the
+      file it was loaded from.
+    """
+    if not os.path.exists(cache_dir):
+      return []
+
+    keys = []
+    for file_name in sorted(os.listdir(cache_dir)):
+      if not file_name.endswith(cls.CACHED_KEY_EXTENSION):
+        continue
+      location = os.path.join(cache_dir, file_name)
+      try:
+        keys.append((M2Crypto.RSA.load_key(location), location))
+      except (M2Crypto.RSA.RSAError, M2Crypto.BIO.BIOError):
+        # The key is unusable, so don't keep it around.
+        os.remove(location)
+    return keys
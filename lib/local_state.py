@@ -5,13 +5,17 @@
 # First-party Python imports
 import getpass
 import hashlib
+import base64
 import json
 import os
+import pipes
 import re
-import shutil
+import signal
+import struct
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import uuid
 import yaml
@@ -27,6 +31,8 @@ from appscale_logger import AppScaleLogger
 from custom_exceptions import AppScaleException
 from custom_exceptions import BadConfigurationException
 from custom_exceptions import ShellException
+from deployment_metadata import DeploymentMetadata
+from key_pool import KeyPool
 
 
 # The version of the AppScale Tools we're running on.
@@ -43,11 +49,62 @@ class LocalState():
   DEFAULT_NUM_RETRIES = 5
 
 
+  # The number of seconds to wait before trying a failed command again.
+  RETRY_DELAY = 1
+
+
+  # A retry policy that tries a failed command again no matter how it failed.
+  RETRY_ALWAYS = "always"
+
+
+  # A retry policy that only tries a failed command again if it failed in a
+  # way that may not happen next time: if it timed out, or if it exited with
+  # SSH_ERROR_CODE (which ssh uses when it can't reach the remote machine).
+  RETRY_TRANSIENT = "transient"
+
+
+  # A retry policy that never tries a failed command again.
+  RETRY_NEVER = "never"
+
+
+  # The exit code that ssh returns when it can't connect to (or loses its
+  # connection to) the remote machine, as opposed to the exit code of the
+  # remote command.
+  SSH_ERROR_CODE = 255
+
+
+  # The maximum number of bytes of standard output (and, separately, of
+  # standard error) that we keep from a command executed via run. Anything
+  # past this is read and thrown away, so that a chatty command can't use up
+  # all of our memory.
+  MAX_OUTPUT_SIZE = 1024 * 1024
+
+
+  # The number of bytes that we read from a command's output pipes at a time.
+  OUTPUT_CHUNK_SIZE = 4096
+
+
+  # The number of seconds to keep reading a command's output after it exits.
+  # Programs that it started in the background (e.g., an ssh master
+  # connection) can hold its pipes open long after it's done.
+  OUTPUT_GRACE_PERIOD = 1
+
+
+  # The number of seconds to wait between checks on whether a command that
+  # has a timeout has exited yet.
+  POLL_INTERVAL = 0.1
+
+
   # The path on the local filesystem where we can read and write
   # AppScale deployment metadata.
   LOCAL_APPSCALE_PATH = os.path.expanduser("~") + os.sep + ".appscale" + os.sep
 
 
+  # The str that application manifests use in place of a digest to indicate
+  # that a path is a directory.
+  DIRECTORY_DIGEST = "directory"
+
+
   # The length of the randomly generated secret that is used to authenticate
   # AppScale services.
   SECRET_KEY_LENGTH = 32
@@ -61,6 +118,11 @@ class LocalState():
   DEFAULT_PASSWORD = "aaaaaa"
 
 
+  # A dict that maps each keyname to the DeploymentMetadata that caches its
+  # metadata files.
+  deployment_metadata = {}
+
+
   @classmethod
   def make_appscale_directory(cls):
     """Creates a ~/.appscale directory, if it doesn't already exist.
@@ -105,6 +167,7 @@ class LocalState():
     key = str(uuid.uuid4()).replace('-', '')[:cls.SECRET_KEY_LENGTH]
     with open(cls.get_secret_key_location(keyname), 'w') as file_handle:
       file_handle.write(key)
+    cls.get_metadata(keyname).invalidate()
     return key
 
 
@@ -133,8 +196,27 @@ class LocalState():
     Returns:
       A str containing the secret key.
     """
-    with open(cls.get_secret_key_location(keyname), 'r') as file_handle:
-      return file_handle.read()
+    return cls.get_metadata(keyname).get_secret()
+
+
+  @classmethod
+  def get_metadata(cls, keyname):
+    """Returns the object that caches the metadata files for the given
+    AppScale deployment, creating it if this is the first time we've asked
+    for it.
+
+    Args:
+      keyname: A str representing the SSH keypair name used for this AppScale
+        deployment.
+    Returns:
+      A DeploymentMetadata for this AppScale deployment.
+    """
+    if keyname not in cls.deployment_metadata:
+      cls.deployment_metadata[keyname] = DeploymentMetadata(
+        cls.get_locations_yaml_location(keyname),
+        cls.get_locations_json_location(keyname),
+        cls.get_secret_key_location(keyname))
+    return cls.deployment_metadata[keyname]
 
 
   @classmethod
@@ -247,7 +329,7 @@ class LocalState():
         deployment.
     """
     # lifted from http://sheogora.blogspot.com/2012/03/m2crypto-for-python-x509-certificates.html
-    key = M2Crypto.RSA.gen_key(2048, 65537)
+    key = KeyPool.get_key()
 
     pkey = M2Crypto.EVP.PKey()
     pkey.assign_rsa(key)
@@ -326,6 +408,17 @@ class LocalState():
     return cls.LOCAL_APPSCALE_PATH + keyname + "-cert.pem"
 
 
+  @classmethod
+  def get_spare_key_directory(cls):
+    """Determines the location where pre-generated RSA keys that haven't been
+    used yet are cached, if the user asks us to keep them.
+
+    Returns:
+      A str that indicates where spare keys are cached.
+    """
+    return cls.LOCAL_APPSCALE_PATH + "spare-keys"
+
+
   @classmethod
   def get_locations_yaml_location(cls, keyname):
     """Determines the location where the YAML file can be found that contains
@@ -356,6 +449,135 @@ class LocalState():
     return cls.LOCAL_APPSCALE_PATH + "locations-" + keyname + ".json"
 
 
+  @classmethod
+  def get_timing_report_location(cls, keyname):
+    """Determines the location where the JSON file can be found that contains
+    how long each phase of starting an AppScale deployment took.
+
+    Args:
+      keyname: A str that indicates the name of the SSH keypair that
+        uniquely identifies this AppScale deployment.
+    Returns:
+      A str that indicates where the timing report can be found.
+    """
+    return cls.LOCAL_APPSCALE_PATH + "timing-" + keyname + ".json"
+
+
+  @classmethod
+  def get_app_manifest_location(cls, keyname, app_id):
+    """Determines the location where the JSON file can be found that contains
+    the manifest of the named application, as it was when we last uploaded it
+    to this AppScale deployment.
+
+    Args:
+      keyname: A str that indicates the name of the SSH keypair that
+        uniquely identifies this AppScale deployment.
+      app_id: A str that indicates which application the manifest is for.
+    Returns:
+      A str that indicates where the manifest file can be found.
+    """
+    return cls.LOCAL_APPSCALE_PATH + "manifest-" + keyname + "-" + app_id + \
+      ".json"
+
+
+  @classmethod
+  def generate_app_manifest(cls, app_location):
+    """Walks the given application's directory, and hashes the contents of
+    every file in it, so that we can tell which files have changed since the
+    application was last uploaded.
+
+    As with 'tar -czf app.tar.gz *', hidden files at the top of the
+    application's directory are not included.
+
+    Args:
+      app_location: The location on the local filesystem where the application
+        can be found.
+    Returns:
+      A dict that maps the path of each file, directory, and symbolic link in
+      the application (relative to app_location) to a str identifying its
+      contents.
+    """
+    manifest = {}
+    for root, dirs, files in os.walk(app_location):
+      relative_root = os.path.relpath(root, app_location)
+      if relative_root == os.curdir:
+        dirs[:] = [name for name in dirs if not name.startswith('.')]
+        files = [name for name in files if not name.startswith('.')]
+
+      for name in dirs + files:
+        path = os.path.join(root, name)
+        relative_path = os.path.normpath(os.path.join(relative_root, name))
+        if os.path.islink(path):
+          manifest[relative_path] = "link:" + os.readlink(path)
+        elif os.path.isdir(path):
+          manifest[relative_path] = cls.DIRECTORY_DIGEST
+        else:
+          manifest[relative_path] = cls.get_file_digest(path)
+    return manifest
+
+
+  @classmethod
+  def get_file_digest(cls, path):
+    """Computes the SHA-1 digest of the named file's contents, without reading
+    the whole file into memory at once.
+
+    Args:
+      path: A str representing the location of the file on the local
+        filesystem.
+    Returns:
+      A str containing the hex-encoded SHA-1 digest of the file.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file_handle:
+      while True:
+        chunk = file_handle.read(1024 * 1024)
+        if not chunk:
+          break
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+  @classmethod
+  def get_app_manifest(cls, keyname, app_id):
+    """Reads the manifest of the named application, as it was when we last
+    uploaded it to this AppScale deployment.
+
+    Args:
+      keyname: A str that indicates the name of the SSH keypair that
+        uniquely identifies this AppScale deployment.
+      app_id: A str that indicates which application the manifest is for.
+    Returns:
+      A dict in the format returned by generate_app_manifest, or an empty dict
+      if we have never uploaded this application to this deployment.
+    """
+    manifest_location = cls.get_app_manifest_location(keyname, app_id)
+    if not os.path.exists(manifest_location):
+      return {}
+
+    with open(manifest_location, 'r') as file_handle:
+      try:
+        return json.loads(file_handle.read())
+      except ValueError:
+        return {}
+
+
+  @classmethod
+  def update_app_manifest(cls, keyname, app_id, manifest_contents):
+    """Writes the manifest of the named application to the local filesystem,
+    so that the next time we upload it we know what has changed.
+
+    Args:
+      keyname: A str that indicates the name of the SSH keypair that
+        uniquely identifies this AppScale deployment.
+      app_id: A str that indicates which application the manifest is for.
+      manifest_contents: A str containing the JSON-encoded manifest, exactly
+        as it was written to the remote machine.
+    """
+    with open(cls.get_app_manifest_location(keyname, app_id), 'w') as \
+      file_handle:
+      file_handle.write(manifest_contents)
+
+
   @classmethod
   def update_local_metadata(cls, options, node_layout, host, instance_id):
     """Writes a locations.yaml and locations.json file to the local filesystem,
@@ -372,8 +594,8 @@ class LocalState():
     """
     # find out every machine's IP address and what they're doing
     acc = AppControllerClient(host, cls.get_secret_key(options.keyname))
-    all_ips = [str(ip) for ip in acc.get_all_public_ips()]
-    role_info = acc.get_role_info()
+    all_ips, role_info = acc.batch(['get_all_public_ips', 'get_role_info'])
+    all_ips = [str(ip) for ip in all_ips]
 
     infrastructure = options.infrastructure or 'xen'
 
@@ -394,6 +616,8 @@ class LocalState():
     # and now we can write the json metadata file
     with open(cls.get_locations_json_location(options.keyname), 'w') as file_handle:
       file_handle.write(json.dumps(role_info))
+
+    cls.get_metadata(options.keyname).invalidate()
   
 
   @classmethod
@@ -406,9 +630,7 @@ class LocalState():
         uniquely identifies this AppScale deployment.
       tag: A str that indicates what we should look for in the YAML file.
     """
-    with open(cls.get_locations_yaml_location(keyname), 'r') as file_handle:
-      locations_yaml = yaml.safe_load(file_handle.read())
-      return locations_yaml[tag]
+    return cls.get_metadata(keyname).get_yaml()[tag]
 
 
   @classmethod
@@ -426,19 +648,53 @@ class LocalState():
       BadConfigurationException: If there is no JSON-encoded metadata file
         named after the given keyname.
     """
+    return cls.get_nodes_metadata(keyname).get_nodes()
+
+
+  @classmethod
+  def get_nodes_metadata(cls, keyname):
+    """Returns the object that caches the metadata files for the given
+    AppScale deployment, after making sure that it has a JSON-encoded metadata
+    file to describe its machines.
+
+    Args:
+      keyname: A str that represents an SSH keypair name, uniquely identifying
+        this AppScale deployment.
+    Returns:
+      A DeploymentMetadata for this AppScale deployment.
+    Raises:
+      BadConfigurationException: If there is no JSON-encoded metadata file
+        named after the given keyname.
+    """
     if not os.path.exists(cls.get_locations_json_location(keyname)):
       raise BadConfigurationException("AppScale does not appear to be " + \
         "running with keyname {0}".format(keyname))
+    return cls.get_metadata(keyname)
 
-    with open(cls.get_locations_json_location(keyname), 'r') as file_handle:
-      return json.loads(file_handle.read())
+
+  @classmethod
+  def get_role_index(cls, keyname):
+    """Returns an index of the machines in this AppScale deployment, which
+    callers can use to find the machines that run a role (or a combination of
+    roles), and to map between public and private IP addresses.
+
+    Args:
+      keyname: A str that represents an SSH keypair name, uniquely identifying
+        this AppScale deployment.
+    Returns:
+      A RoleIndex over this AppScale deployment's machines.
+    Raises:
+      BadConfigurationException: If there is no JSON-encoded metadata file
+        named after the given keyname.
+    """
+    return cls.get_nodes_metadata(keyname).get_role_index()
 
 
   @classmethod
   def get_host_for_role(cls, keyname, role):
-    for node in cls.get_local_nodes_info(keyname):
-      if role in node["jobs"]:
-          return node["public_ip"]
+    hosts = cls.get_nodes_metadata(keyname).get_hosts_with_role(role)
+    if hosts:
+      return hosts[0]
 
 
   @classmethod
@@ -481,11 +737,10 @@ class LocalState():
     Returns:
       A str containing the host that runs the specified service.
     """
-    nodes = cls.get_local_nodes_info(keyname)
-    for node in nodes:
-      if role in node['jobs']:
-        return node['public_ip']
-    raise AppScaleException("Couldn't find a {0} node.".format(role))
+    hosts = cls.get_nodes_metadata(keyname).get_hosts_with_role(role)
+    if not hosts:
+      raise AppScaleException("Couldn't find a {0} node.".format(role))
+    return hosts[0]
 
 
   @classmethod
@@ -581,8 +836,7 @@ class LocalState():
       The name of the cloud infrastructure that AppScale is running over, or
       'xen' if running over a virtualized cluster.
     """
-    with open(cls.get_locations_yaml_location(keyname), 'r') as file_handle:
-      return yaml.safe_load(file_handle.read())["infrastructure"]
+    return cls.get_from_yaml(keyname, "infrastructure")
 
 
   @classmethod
@@ -596,8 +850,7 @@ class LocalState():
     Returns:
       The name of the security group used for this AppScale deployment.
     """
-    with open(cls.get_locations_yaml_location(keyname), 'r') as file_handle:
-      return yaml.safe_load(file_handle.read())["group"]
+    return cls.get_from_yaml(keyname, "group")
 
 
   @classmethod
@@ -611,11 +864,17 @@ class LocalState():
     os.remove(LocalState.get_locations_yaml_location(keyname))
     os.remove(LocalState.get_locations_json_location(keyname))
     os.remove(LocalState.get_secret_key_location(keyname))
+    cls.get_metadata(keyname).invalidate()
 
 
   @classmethod
-  def shell(cls, command, is_verbose, num_retries=DEFAULT_NUM_RETRIES):
-    """Executes a command on this machine, retrying it if it initially fails.
+  def shell(cls, command, is_verbose, num_retries=DEFAULT_NUM_RETRIES,
+    stdin=None, retry_policy=RETRY_ALWAYS):
+    """Executes a command on this machine via /bin/sh, retrying it if it
+    initially fails.
+
+    Commands that don't need a shell's redirection, pipes, or other features
+    should use run instead.
 
     Args:
       command: A str representing the command to execute.
@@ -623,28 +882,244 @@ class LocalState():
         executing to stdout.
       num_retries: The number of times we should try to execute the given
         command before aborting.
+      stdin: A str that, if provided, is fed to the command as its standard
+        input (and fed again each time the command is retried).
+      retry_policy: A str (one of the RETRY_ constants) that indicates which
+        failures are worth trying the command again for.
     Returns:
       The standard output and standard error produced when the command executes.
     Raises:
-      ShellException: If, after five attempts, executing the named command
-      failed.
+      ShellException: If executing the named command failed, and either we
+        ran out of retries or the retry policy says not to try again. Its
+        returncode and output describe the last attempt.
     """
     tries_left = num_retries
-    while tries_left:
+    while True:
       AppScaleLogger.verbose("shell> {0}".format(command), is_verbose)
       the_temp_file = tempfile.TemporaryFile()
-      result = subprocess.Popen(command, shell=True, stdout=the_temp_file,
-        stderr=subprocess.STDOUT)
-      result.wait()
+      if stdin is None:
+        result = subprocess.Popen(command, shell=True, stdout=the_temp_file,
+          stderr=subprocess.STDOUT)
+        result.wait()
+      else:
+        result = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE,
+          stdout=the_temp_file, stderr=subprocess.STDOUT)
+        result.communicate(stdin)
+      the_temp_file.seek(0)
+      output = the_temp_file.read()
+      the_temp_file.close()
       if result.returncode == 0:
-        output = the_temp_file.read()
-        the_temp_file.close()
         return output
-      AppScaleLogger.verbose("Command failed. Trying again momentarily." \
-        .format(command), is_verbose)
+
+      tries_left -= 1
+      if tries_left <= 0 or not cls.should_retry(retry_policy,
+        result.returncode):
+        raise ShellException('Could not execute command: {0}'.format(command),
+          returncode=result.returncode, output=output)
+
+      AppScaleLogger.verbose("Command failed. Trying again momentarily.",
+        is_verbose)
+      time.sleep(cls.RETRY_DELAY)
+
+
+  @classmethod
+  def run(cls, argv, is_verbose, timeout=None, num_retries=DEFAULT_NUM_RETRIES,
+    retry_policy=RETRY_NEVER, stdin=None, max_output=MAX_OUTPUT_SIZE,
+    success_codes=(0,), output_path=None):
+    """Executes a command on this machine directly, without a shell in
+    between, retrying it if it fails in a way that the retry policy allows.
+
+    Since no shell interprets the command, its arguments reach it exactly as
+    given, and never need to be quoted. Its standard output and standard error
+    are read separately through pipes while it runs.
+
+    Args:
+      argv: A list of strs, the program to execute followed by its arguments.
+      is_verbose: A bool that indicates if we should print the command we are
+        executing to stdout.
+      timeout: The number of seconds that each attempt may take before we kill
+        it, or None to wait for as long as it takes.
+      num_retries: The maximum number of times we should try to execute the
+        given command.
+      retry_policy: A str (one of the RETRY_ constants) that indicates which
+        failures are worth trying the command again for.
+      stdin: A str that, if provided, is fed to the command as its standard
+        input (and fed again each time the command is retried).
+      max_output: The maximum number of bytes of standard output and of
+        standard error to keep.
+      success_codes: A tuple of ints, the exit codes that indicate that the
+        command succeeded.
+      output_path: A str that, if provided, names a local file that the
+        command's standard output is written to (in full, and from scratch
+        on each attempt) instead of being kept in memory.
+    Returns:
+      A tuple containing the int that the command exited with, and strs
+        containing its standard output (empty if output_path was given) and
+        its standard error.
+    Raises:
+      ShellException: If executing the named command failed, and either we
+        ran out of retries or the retry policy says not to try again. Its
+        returncode (None if the command timed out), output, and error describe
+        the last attempt.
+    """
+    command = " ".join([pipes.quote(arg) for arg in argv])
+    tries_left = num_retries
+    while True:
+      AppScaleLogger.verbose("run> {0}".format(command), is_verbose)
+      returncode, output, error = cls.run_once(argv, timeout, stdin,
+        max_output, output_path)
+      if returncode in success_codes:
+        return returncode, output, error
+
       tries_left -= 1
-      time.sleep(1)
-    raise ShellException('Could not execute command: {0}'.format(command))
+      if tries_left <= 0 or not cls.should_retry(retry_policy, returncode):
+        if returncode is None:
+          message = 'Command timed out after {0} seconds: {1}'.format(timeout,
+            command)
+        else:
+          message = 'Command exited with {0}: {1}'.format(returncode, command)
+        raise ShellException(message, returncode=returncode, output=output,
+          error=error)
+
+      AppScaleLogger.verbose("Command failed. Trying again momentarily.",
+        is_verbose)
+      time.sleep(cls.RETRY_DELAY)
+
+
+  @classmethod
+  def run_once(cls, argv, timeout, stdin, max_output, output_path=None):
+    """Executes a command on this machine once, without a shell in between.
+
+    Args:
+      argv: A list of strs, the program to execute followed by its arguments.
+      timeout: The number of seconds that the command may take before we kill
+        it, or None to wait for as long as it takes.
+      stdin: A str to feed to the command as its standard input, or None.
+      max_output: The maximum number of bytes of standard output and of
+        standard error to keep.
+      output_path: A str naming a local file to write the command's standard
+        output to, or None to keep it in memory.
+    Returns:
+      A tuple containing the int that the command exited with (or None if we
+        killed it), and strs containing its standard output and its standard
+        error.
+    """
+    if output_path is None:
+      output_file = None
+      stdout = subprocess.PIPE
+    else:
+      output_file = open(output_path, 'wb')
+      stdout = output_file
+
+    try:
+      process = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=stdout,
+        stderr=subprocess.PIPE, close_fds=True)
+    finally:
+      if output_file is not None:
+        output_file.close()
+
+    output, error = [], []
+    threads = [threading.Thread(target=cls.read_output,
+      args=(process.stderr, max_output, error))]
+    if output_file is None:
+      threads.append(threading.Thread(target=cls.read_output,
+        args=(process.stdout, max_output, output)))
+    # Feed standard input from its own thread, so that a command that never
+    # reads it can't keep us from noticing that it's timed out.
+    threads.append(threading.Thread(target=cls.write_input,
+      args=(process.stdin, stdin or '')))
+    for thread in threads:
+      thread.daemon = True
+      thread.start()
+
+    killed = False
+    if timeout is None:
+      process.wait()
+    else:
+      deadline = time.time() + timeout
+      while process.poll() is None:
+        if time.time() >= deadline:
+          # The command hasn't been reaped yet (poll just said so), so its
+          # process id can't have been handed to anything else.
+          try:
+            process.kill()
+            killed = True
+          except OSError:
+            pass
+          process.wait()
+          break
+        time.sleep(cls.POLL_INTERVAL)
+
+    for thread in threads:
+      thread.join(cls.OUTPUT_GRACE_PERIOD)
+
+    # Only report a timeout if our kill is what ended the command, and not if
+    # it exited on its own just before we got to it.
+    if killed and process.returncode == -signal.SIGKILL:
+      returncode = None
+    else:
+      returncode = process.returncode
+    return returncode, "".join(output), "".join(error)
+
+
+  @classmethod
+  def read_output(cls, pipe, max_output, chunks):
+    """Reads everything from one of a command's output pipes, keeping at most
+    max_output bytes of it.
+
+    Args:
+      pipe: A file-like object to read from until it runs out.
+      max_output: The maximum number of bytes to keep.
+      chunks: A list that the strs we keep are appended to.
+    """
+    kept = 0
+    while True:
+      chunk = pipe.read(cls.OUTPUT_CHUNK_SIZE)
+      if not chunk:
+        break
+      if kept < max_output:
+        chunks.append(chunk[:max_output - kept])
+        kept += len(chunks[-1])
+    pipe.close()
+
+
+  @classmethod
+  def write_input(cls, pipe, data):
+    """Writes everything to a command's standard input pipe, and then closes
+    it so that the command knows that there's nothing more to read.
+
+    Args:
+      pipe: A file-like object to write to.
+      data: A str to write.
+    """
+    try:
+      if data:
+        pipe.write(data)
+      pipe.close()
+    except IOError:
+      # The command exited (or closed its standard input) before reading
+      # all of it, which is its business, not ours.
+      pass
+
+
+  @classmethod
+  def should_retry(cls, retry_policy, returncode):
+    """Decides if a failed command is worth trying again.
+
+    Args:
+      retry_policy: A str (one of the RETRY_ constants) that indicates which
+        failures are worth trying the command again for.
+      returncode: The int that the command exited with, or None if it timed
+        out.
+    Returns:
+      True if the command should be tried again, and False otherwise.
+    """
+    if retry_policy == cls.RETRY_ALWAYS:
+      return True
+    elif retry_policy == cls.RETRY_TRANSIENT:
+      return returncode is None or returncode == cls.SSH_ERROR_CODE
+    else:
+      return False
 
 
   @classmethod
@@ -661,13 +1136,14 @@ class LocalState():
       BadConfigurationException: If any of the required commands aren't present
         on this machine.
     """
-    required_commands = ['ssh-keygen', 'ssh-copy-id']
+    required_commands = ['ssh-copy-id']
     if needs_expect:
       required_commands.append('expect')
 
     for command in required_commands:
       try:
-        cls.shell("hash {0}".format(command), is_verbose)
+        cls.shell("hash {0}".format(command), is_verbose,
+          retry_policy=cls.RETRY_NEVER)
       except ShellException:
         raise BadConfigurationException("Couldn't find {0} in your PATH."
           .format(command))
@@ -681,44 +1157,43 @@ class LocalState():
     Args:
       keyname: The SSH keypair name that uniquely identifies this AppScale
         deployment.
-      is_verbose: A bool that indicates if we should print the ssh-keygen
-        command to stdout.
+      is_verbose: A bool that indicates if we should print where we write the
+        keypair to stdout.
+    Returns:
+      A tuple containing the locations of the public and private keys.
     """
     private_key = cls.LOCAL_APPSCALE_PATH + keyname
     public_key = private_key + ".pub"
 
-    if os.path.exists(public_key):
-      os.remove(public_key)
+    for location in [public_key, private_key, private_key + ".key"]:
+      if os.path.exists(location):
+        os.remove(location)
 
-    if os.path.exists(private_key):
-      os.remove(private_key)
-
-    cls.shell("ssh-keygen -t rsa -N '' -f {0}".format(private_key), is_verbose)
+    AppScaleLogger.verbose("Writing new keypair to {0}".format(private_key),
+      is_verbose)
+    key = KeyPool.get_key()
+    KeyPool.write_key(key, private_key)
+    KeyPool.write_key(key, private_key + ".key")
+    with open(public_key, 'w') as file_handle:
+      file_handle.write(cls.get_ssh_public_key(key, keyname))
     os.chmod(public_key, 0600)
-    os.chmod(private_key, 0600)
-    shutil.copy(private_key, private_key + ".key")
     return public_key, private_key
 
 
   @classmethod
-  def extract_app_to_dir(cls, tar_location, is_verbose):
-    """Extracts the given tar.gz file to a randomly generated location and
-    returns that location.
+  def get_ssh_public_key(cls, key, comment):
+    """Formats the public half of an RSA key the way that OpenSSH expects to
+    find it in a .pub or authorized_keys file.
 
     Args:
-      tar_location: The location on the local filesystem where the tar.gz file
-        to extract can be found.
-      is_verbose: A bool that indicates if we should print the tar command we
-        execute to stdout.
+      key: The M2Crypto.RSA.RSA key whose public half should be formatted.
+      comment: A str that identifies the key to people reading the file.
     Returns:
-      The location on the local filesystem where the tar.gz file was extracted
-        to.
+      A str containing the public key, on a single line.
     """
-    extracted_location = "/tmp/appscale-app-{0}".format(str(uuid.uuid4()) \
-      .replace('-', '')[:8])
-
-    os.mkdir(extracted_location)
-    cls.shell("cd {0} && tar zxvf {1}".format(extracted_location, tar_location),
-      is_verbose)
-
-    return extracted_location
+    # M2Crypto gives us the exponent and modulus already encoded as SSH
+    # mpints, so we only have to prefix them with the key type.
+    exponent, modulus = key.pub()
+    key_type = "ssh-rsa"
+    blob = struct.pack('>I', len(key_type)) + key_type + exponent + modulus
+    return "{0} {1} {2}\n".format(key_type, base64.b64encode(blob), comment)
@@ -9,6 +9,7 @@ import yaml
 
 # AppScale-specific imports
 from agents.factory import InfrastructureAgentFactory
+from role_index import RoleIndex
 
 
 class NodeLayout():
@@ -36,9 +37,7 @@ class NodeLayout():
   # A tuple containing all of the roles (simple and advanced) that the
   # AppController recognizes. These include _master and _slave roles, which
   # the user may not be able to specify directly.
-  VALID_ROLES = ('master', 'appengine', 'database', 'shadow', 'open',
-    'load_balancer', 'login', 'db_master', 'db_slave', 'zookeeper', 'memcache',
-    'rabbitmq', 'rabbitmq_master', 'rabbitmq_slave')
+  VALID_ROLES = ('master',) + RoleIndex.JOB_ROLES
 
 
   # A regular expression that matches IP addresses, used in ips.yaml files for
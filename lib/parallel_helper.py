@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import Queue
+import sys
+import threading
+import time
+
+
+# AppScale-specific imports
+from appscale_logger import AppScaleLogger
+from custom_exceptions import AppScaleException
+
+
+class ParallelHelper():
+  """ParallelHelper provides a simple way to run the same operation against
+  many machines at once (e.g., every machine in an AppScale deployment), so
+  that the time it takes is governed by the slowest machine instead of the sum
+  of all of them.
+  """
+
+
+  # The maximum number of machines that we operate on at once, by default.
+  DEFAULT_MAX_THREADS = 10
+
+
+  # The number of seconds to wait for a machine to finish before we check
+  # whether any of the other machines have run out of time.
+  POLL_INTERVAL = 0.5
+
+
+  @classmethod
+  def run_on_hosts(cls, hosts, function, max_threads=DEFAULT_MAX_THREADS,
+    timeout=None, description=None):
+    """Calls the given function once per host, with at most max_threads calls
+    running at any given time.
+
+    Args:
+      hosts: A list of strs, representing the machines to operate on.
+      function: A function that takes a single argument (the host to operate
+        on) and returns the result of operating on it.
+      max_threads: An int that indicates how many hosts we should operate on
+        at once.
+      timeout: The number of seconds that we should let the function run on a
+        single host before giving up on it, or None to wait forever.
+      description: A str that, if provided, describes what we're doing to each
+        host, and causes us to log our progress as each host finishes.
+    Returns:
+      A tuple of two dicts. The first maps each host that the function
+      succeeded on to the value it returned, and the second maps each host
+      that the function failed on (or timed out on) to the Exception it raised.
+    """
+    hosts = list(hosts)
+    results = {}
+    errors = {}
+    if not hosts:
+      return results, errors
+
+    pending = Queue.Queue()
+    for host in hosts:
+      pending.put(host)
+    finished = Queue.Queue()
+    start_times = {}
+    start_times_lock = threading.Lock()
+
+    def worker():
+      """Operates on hosts until there are none left to operate on."""
+      while True:
+        try:
+          host = pending.get_nowait()
+        except Queue.Empty:
+          return
+
+        with start_times_lock:
+          start_times[host] = time.time()
+        try:
+          finished.put((host, function(host), None))
+        except Exception as exception:
+          finished.put((host, None, exception))
+
+    def start_worker():
+      """Starts a new thread that operates on hosts. Since we can't kill
+      threads that are stuck on a host, they are daemon threads, so that they
+      can't keep this process alive once we've given up on them."""
+      thread = threading.Thread(target=worker)
+      thread.daemon = True
+      thread.start()
+
+    for _ in range(min(max_threads, len(hosts))):
+      start_worker()
+
+    while len(results) + len(errors) < len(hosts):
+      try:
+        host, result, exception = finished.get(timeout=cls.POLL_INTERVAL)
+        if host not in results and host not in errors:
+          if exception is None:
+            results[host] = result
+          else:
+            errors[host] = exception
+          cls.log_progress(description, host, exception, len(results) +
+            len(errors), len(hosts))
+      except Queue.Empty:
+        pass
+
+      if timeout is None:
+        continue
+
+      now = time.time()
+      with start_times_lock:
+        timed_out = [host for host, start_time in start_times.items()
+          if now - start_time > timeout and host not in results and
+          host not in errors]
+      for host in timed_out:
+        errors[host] = AppScaleException("Timed out after {0} seconds " \
+          "waiting for {1}".format(timeout, host))
+        cls.log_progress(description, host, errors[host], len(results) +
+          len(errors), len(hosts))
+
+        # The thread working on this host is stuck, so start up a new one to
+        # take its place.
+        start_worker()
+
+    return results, errors
+
+
+  @classmethod
+  def run_task_graph(cls, tasks):
+    """Runs a set of tasks that depend on one another, starting each task as
+    soon as every task that it depends on has finished, so that tasks that
+    don't depend on each other run at the same time.
+
+    Args:
+      tasks: A dict that maps the name of each task to a tuple containing the
+        function that performs it and a list of the names of the tasks that
+        must finish before it starts. Each function takes a single argument:
+        a dict that maps the name of each task that has finished to the value
+        that it returned.
+    Returns:
+      A dict that maps the name of each task to the value that it returned.
+    Raises:
+      AppScaleException: If a task depends on a task that doesn't exist, or
+        if tasks depend on each other in a cycle.
+      Exception: The exception raised by the first task that failed. Tasks
+        that depend on a failed task are never started, but we wait for the
+        tasks that are already running to finish before raising it.
+    """
+    for name, (_, dependencies) in tasks.items():
+      for dependency in dependencies:
+        if dependency not in tasks:
+          raise AppScaleException("Task {0} depends on unknown task {1}" \
+            .format(name, dependency))
+
+    waiting = dict(tasks)
+    results = {}
+    running = set()
+    failure = None
+    finished = Queue.Queue()
+
+    def worker(name, function, finished_results):
+      """Performs a single task, and reports how it went."""
+      try:
+        finished.put((name, function(finished_results), None))
+      except Exception:
+        finished.put((name, None, sys.exc_info()))
+
+    while True:
+      if failure is None:
+        ready = [name for name, (_, dependencies) in waiting.items()
+          if all(dependency in results for dependency in dependencies)]
+        for name in sorted(ready):
+          function, _ = waiting.pop(name)
+          running.add(name)
+          thread = threading.Thread(target=worker, args=(name, function,
+            dict(results)))
+          thread.daemon = True
+          thread.start()
+
+      if not running:
+        break
+
+      try:
+        name, result, exc_info = finished.get(timeout=cls.POLL_INTERVAL)
+      except Queue.Empty:
+        continue
+      running.remove(name)
+      if exc_info is None:
+        results[name] = result
+      elif failure is None:
+        failure = exc_info
+
+    if failure is not None:
+      raise failure[0], failure[1], failure[2]
+    if waiting:
+      raise AppScaleException("Tasks {0} depend on each other, so they " \
+        "can't be run".format(", ".join(sorted(waiting.keys()))))
+    return results
+
+
+  @classmethod
+  def log_progress(cls, description, host, exception, num_done, num_hosts):
+    """Tells the user that we've finished operating on a host, and how many
+    hosts are left.
+
+    Args:
+      description: A str that describes what we're doing to each host, or
+        None if we shouldn't log our progress.
+      host: A str representing the host that we just finished operating on.
+      exception: The Exception raised while operating on the host, or None if
+        the operation succeeded.
+      num_done: An int indicating how many hosts we've finished operating on.
+      num_hosts: An int indicating how many hosts we're operating on in total.
+    """
+    if description is None:
+      return
+
+    if exception is None:
+      AppScaleLogger.log("[{0}/{1}] Finished {2} on {3}".format(num_done,
+        num_hosts, description, host))
+    else:
+      AppScaleLogger.warn("[{0}/{1}] Failed {2} on {3}: {4}".format(num_done,
+        num_hosts, description, host, str(exception)))
+
+
+  @classmethod
+  def raise_if_any_failed(cls, errors, description):
+    """Aborts if operating on any host failed.
+
+    Args:
+      errors: A dict that maps each host that an operation failed on to the
+        Exception it raised.
+      description: A str that describes the operation that was performed.
+    Raises:
+      AppScaleException: If errors is not empty.
+    """
+    if not errors:
+      return
+
+    raise AppScaleException("Failed {0} on {1} machine(s): {2}".format(
+      description, len(errors), ", ".join(["{0} ({1})".format(host,
+      str(exception)) for host, exception in sorted(errors.items())])))
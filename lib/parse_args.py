@@ -16,6 +16,7 @@ import local_state
 from custom_exceptions import BadConfigurationException
 from agents.base_agent import BaseAgent
 from agents.factory import InfrastructureAgentFactory
+from role_index import RoleIndex
 
 
 class ParseArgs():
@@ -82,6 +83,25 @@ class ParseArgs():
   DEFAULT_KEYNAME = "appscale"
 
 
+  # The default number of machines that we should copy logs from at once.
+  DEFAULT_LOG_CONCURRENCY = 10
+
+
+  # The ways that describe-instances can report on each machine: as the
+  # AppController's own status text, as a table, or as JSON.
+  DESCRIBE_FORMATS = ["text", "table", "json"]
+
+
+  # The default number of seconds that describe-instances waits for each
+  # machine to report its status.
+  DEFAULT_DESCRIBE_TIMEOUT = 30
+
+
+  # The default number of machines that describe-instances asks for their
+  # status at once.
+  DEFAULT_DESCRIBE_CONCURRENCY = 50
+
+
   def __init__(self, argv, function):
     """Creates a new ParseArgs for a set of acceptable flags.
 
@@ -150,6 +170,9 @@ class ParseArgs():
         help="the security group to use")
       self.parser.add_argument('--keyname', '-k', default=self.DEFAULT_KEYNAME,
         help="the keypair name to use")
+      self.parser.add_argument('--zone', '-z', action='append', dest='zones',
+        help="an availability zone to start VMs in (can be given more " +
+        "than once, to spread VMs across zones)")
 
       # flags relating to the datastore used
       self.parser.add_argument('--table',
@@ -172,6 +195,9 @@ class ParseArgs():
         help="forces tools to continue if keyname or group exist")
       self.parser.add_argument('--scp',
         help="the location to copy a local AppScale branch from")
+      self.parser.add_argument('--keep_spare_keys', action='store_true',
+        default=False,
+        help="keeps a pre-generated key on disk for the next deployment")
       self.parser.add_argument('--test', action='store_true',
         default=False,
         help="uses a default username and password for cloud admin")
@@ -184,6 +210,19 @@ class ParseArgs():
         help="the keypair name to use")
       self.parser.add_argument('--location',
         help="the location to store the collected logs")
+      self.parser.add_argument('--concurrency', type=int,
+        default=self.DEFAULT_LOG_CONCURRENCY,
+        help="the number of machines to copy logs from at once")
+      self.parser.add_argument('--roles',
+        help="only copy logs from machines matching this role query " + \
+          "(e.g., 'memcache+database,appengine')")
+      self.parser.add_argument('--compressed', action='store_true',
+        default=False,
+        help="keep each machine's logs as a tarball instead of unpacking them")
+      self.parser.add_argument('--incremental', action='store_true',
+        default=False,
+        help="only copy logs written since the last time we copied logs " + \
+          "to this location")
     elif function == "appscale-add-keypair":
       # flags relating to how many VMs we should spawn
       self.parser.add_argument('--ips',
@@ -237,6 +276,17 @@ class ParseArgs():
     elif function == "appscale-describe-instances":
       self.parser.add_argument('--keyname', '-k', default=self.DEFAULT_KEYNAME,
         help="the keypair name to use")
+      self.parser.add_argument('--format', choices=self.DESCRIBE_FORMATS,
+        default="text", help="how to report on each machine")
+      self.parser.add_argument('--timeout', type=int,
+        default=self.DEFAULT_DESCRIBE_TIMEOUT,
+        help="the number of seconds to wait for each machine to respond")
+      self.parser.add_argument('--concurrency', type=int,
+        default=self.DEFAULT_DESCRIBE_CONCURRENCY,
+        help="the number of machines to query at once")
+      self.parser.add_argument('--roles',
+        help="only report on machines matching this role query " + \
+          "(e.g., 'memcache+database,appengine')")
     else:
       raise SystemExit
 
@@ -269,6 +319,12 @@ class ParseArgs():
     elif function == "appscale-gather-logs":
       if not self.args.location:
         self.args.location = "/tmp/{0}-logs/".format(self.args.keyname)
+      if self.args.concurrency < 1:
+        raise BadConfigurationException("Concurrency must be at least 1.")
+      if self.args.incremental and self.args.compressed:
+        raise BadConfigurationException("Cannot keep logs compressed when " + \
+          "copying them incrementally.")
+      self.validate_roles_flag()
     elif function == "appscale-terminate-instances":
       pass
     elif function == "appscale-remove-app":
@@ -277,7 +333,11 @@ class ParseArgs():
     elif function == "appscale-reset-pwd":
       pass
     elif function == "appscale-describe-instances":
-      pass
+      if self.args.timeout < 1:
+        raise BadConfigurationException("Timeout must be at least 1.")
+      if self.args.concurrency < 1:
+        raise BadConfigurationException("Concurrency must be at least 1.")
+      self.validate_roles_flag()
     elif function == "appscale-add-instances":
       if 'ips' in self.args:
         with open(self.args.ips, 'r') as file_handle:
@@ -326,6 +386,18 @@ class ParseArgs():
       self.args.ips = yaml.safe_load(base64.b64decode(self.args.ips_layout))
 
 
+  def validate_roles_flag(self):
+    """Makes sure that the role query given to us via the roles flag (if any)
+    only names roles that machines in a deployment can run.
+
+    Raises:
+      BadConfigurationException: If the role query is empty or names a role
+        that no machine runs.
+    """
+    if self.args.roles is not None:
+      RoleIndex.validate_query(self.args.roles)
+
+
   def validate_infrastructure_flags(self):
     """Validates flags corresponding to cloud infrastructures.
 
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+# AppScale-specific imports
+from appscale_logger import AppScaleLogger
+
+
+class PhaseTimer():
+  """PhaseTimer records how long each phase of a long-running operation (e.g.,
+  starting an AppScale deployment) takes, so that we can tell which phases
+  dominate it, and notice when one of them gets slower.
+
+  Each phase is timed with a span. Spans can contain other spans, and are
+  named after every span they're in (e.g., 'start_head_node.ssl_cert').
+  Spans started in other threads are only placed inside a span if the
+  function they time was wrapped (with wrap) inside that span.
+  """
+
+
+  # The number of seconds that two timestamps can differ by and still be
+  # treated as the same moment, when working out the critical path.
+  CLOCK_SLACK = 0.01
+
+
+  # The time (in seconds since the epoch) that we started timing at.
+  started = None
+
+
+  # A list of dicts, one per finished span, each containing the span's 'name',
+  # the 'start' and 'end' times (in seconds since we started timing), and the
+  # 'thread' it ran in.
+  spans = []
+
+
+  # A lock that protects spans.
+  lock = threading.Lock()
+
+
+  # Keeps track of the spans that each thread is currently in.
+  local = threading.local()
+
+
+  @classmethod
+  def reset(cls):
+    """Forgets every span recorded so far, and starts timing from now."""
+    with cls.lock:
+      cls.started = time.time()
+      cls.spans = []
+
+
+  @classmethod
+  def get_current_path(cls):
+    """Returns the names of the spans that this thread is in.
+
+    Returns:
+      A list of strs, from the outermost span to the innermost one.
+    """
+    return list(getattr(cls.local, 'path', []))
+
+
+  @classmethod
+  @contextlib.contextmanager
+  def span(cls, name, parent=None):
+    """Times the code run in a with block, as a span with the given name.
+
+    Args:
+      name: A str naming the phase being timed.
+      parent: A list of strs naming the spans that this span is in, or None
+        if it's in the spans that this thread is in.
+    """
+    if cls.started is None:
+      cls.reset()
+    if parent is None:
+      parent = cls.get_current_path()
+
+    path = parent + [name]
+    old_path = cls.get_current_path()
+    cls.local.path = path
+    start = time.time()
+    try:
+      yield
+    finally:
+      end = time.time()
+      cls.local.path = old_path
+      with cls.lock:
+        cls.spans.append({
+          'name' : ".".join(path),
+          'start' : start - cls.started,
+          'end' : end - cls.started,
+          'thread' : threading.current_thread().name
+        })
+
+
+  @classmethod
+  def wrap(cls, name, function):
+    """Wraps a function so that calling it is timed as a span, inside the
+    spans that we're in right now (even if it's called in another thread).
+
+    Args:
+      name: A str naming the phase that the function performs.
+      function: The function to time.
+    Returns:
+      A function that calls the given function inside a span.
+    """
+    parent = cls.get_current_path()
+
+    def timed(*args, **kwargs):
+      with cls.span(name, parent=parent):
+        return function(*args, **kwargs)
+
+    return timed
+
+
+  @classmethod
+  def get_spans(cls):
+    """Returns every finished span, in the order that they started.
+
+    Returns:
+      A list of dicts, one per span, each containing the span's 'name',
+      'start' and 'end' times (in seconds since we started timing), 'duration'
+      (in seconds), and 'thread'.
+    """
+    with cls.lock:
+      spans = [dict(span) for span in cls.spans]
+    for span in spans:
+      span['duration'] = span['end'] - span['start']
+    return sorted(spans, key=lambda span: (span['start'], span['name']))
+
+
+  @classmethod
+  def get_critical_path(cls, spans):
+    """Finds the chain of phases that the whole operation had to wait on:
+    starting with the phase that finished last, each phase in the chain is
+    the one that finished last before the next one started. Only the
+    innermost spans are considered, since the spans they're in just add
+    them up.
+
+    Args:
+      spans: A list of dicts, as returned by get_spans.
+    Returns:
+      A list of dicts, the spans on the critical path, in the order they ran.
+    """
+    names = [span['name'] for span in spans]
+    leaves = [span for span in spans if not [name for name in names
+      if name.startswith(span['name'] + ".")]]
+
+    path = []
+    remaining = leaves
+    until = None
+    while remaining:
+      if until is not None:
+        remaining = [span for span in remaining
+          if span['end'] <= until + cls.CLOCK_SLACK]
+      if not remaining:
+        break
+      latest = max(remaining, key=lambda span: span['end'])
+      path.append(latest)
+      remaining = [span for span in remaining if span is not latest]
+      until = latest['start']
+    path.reverse()
+    return path
+
+
+  @classmethod
+  def write_report(cls, location):
+    """Writes every finished span, and the critical path through them, to the
+    given file as JSON.
+
+    Args:
+      location: A str naming the file to write the report to.
+    """
+    spans = cls.get_spans()
+    report = {
+      'started' : cls.started,
+      'total' : max([span['end'] for span in spans] or [0]),
+      'spans' : spans,
+      'critical_path' : [span['name'] for span in
+        cls.get_critical_path(spans)]
+    }
+
+    directory = os.path.dirname(location)
+    if directory and not os.path.exists(directory):
+      os.makedirs(directory)
+    with open(location, 'w') as file_handle:
+      file_handle.write(json.dumps(report, indent=2, sort_keys=True))
+
+
+  @classmethod
+  def log_summary(cls):
+    """Tells the user how long each phase took, and which phases were on the
+    critical path."""
+    spans = cls.get_spans()
+    if not spans:
+      return
+
+    total = max([span['end'] for span in spans])
+    for span in spans:
+      AppScaleLogger.log("TIMING: {0} took {1:.1f} seconds ({2:.0f}% of " \
+        "{3:.1f})".format(span['name'], span['duration'],
+        100 * span['duration'] / max(total, cls.CLOCK_SLACK), total))
+
+    AppScaleLogger.log("TIMING: Critical path: {0}".format(" -> ".join([
+      "{0} ({1:.1f}s)".format(span['name'], span['duration'])
+      for span in cls.get_critical_path(spans)])))
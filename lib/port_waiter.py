@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import errno
+import os
+import random
+import select
+import socket
+import time
+
+
+# AppScale-specific imports
+from appscale_logger import AppScaleLogger
+from custom_exceptions import AppScaleException
+
+
+class PortWaiter():
+  """PortWaiter waits for ports on many machines to start accepting
+  connections, without letting a single slow (or unreachable) machine hold up
+  any of the others.
+
+  Instead of blocking on each connection attempt, we start non-blocking
+  connections to every port at once and use select to find out which of them
+  have been accepted.
+  """
+
+
+  # The number of seconds that we give a single connection attempt to succeed
+  # before giving up on it and trying again later.
+  CONNECT_TIMEOUT = 5
+
+
+  # The number of seconds that we wait before retrying a port that refused
+  # our first connection attempt. This doubles after each failed attempt.
+  INITIAL_BACKOFF = 1
+
+
+  # The maximum number of seconds that we wait between connection attempts to
+  # the same port.
+  MAX_BACKOFF = 20
+
+
+  # The errno values that connect_ex returns when a non-blocking connection
+  # attempt has started, but hasn't finished yet.
+  IN_PROGRESS = [errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY]
+
+
+  @classmethod
+  def wait_for_ports(cls, endpoints, is_verbose, timeout=None,
+    connect_timeout=CONNECT_TIMEOUT, on_ready=None):
+    """Waits until every one of the given ports accepts connections.
+
+    Args:
+      endpoints: A list of (host, port) tuples, where each host is a str and
+        each port is an int, that should eventually be open.
+      is_verbose: A bool that indicates if we should print failure messages to
+        stdout (e.g., connection refused messages that can occur when we wait
+        for services to come up).
+      timeout: The number of seconds that we should wait for all of the ports
+        to open, or None to wait forever.
+      connect_timeout: The number of seconds that we give a single connection
+        attempt to succeed before trying again.
+      on_ready: A function that, if provided, is called with the host and port
+        of each endpoint as soon as it opens.
+    Raises:
+      AppScaleException: If any of the ports haven't opened by the time the
+        timeout expires.
+    """
+    pending = {}
+    for endpoint in endpoints:
+      pending[endpoint] = {
+        'socket' : None,
+        'started' : None,
+        'retry_at' : 0,
+        'backoff' : cls.INITIAL_BACKOFF
+      }
+
+    if timeout is None:
+      deadline = None
+    else:
+      deadline = time.time() + timeout
+
+    try:
+      while pending:
+        now = time.time()
+        if deadline is not None and now >= deadline:
+          raise AppScaleException("Timed out after {0} seconds waiting for " \
+            "{1} to open".format(timeout, ", ".join(["{0}:{1}".format(host,
+            port) for host, port in sorted(pending.keys())])))
+
+        ready = []
+        for endpoint, state in pending.items():
+          if state['socket'] is None and state['retry_at'] <= now:
+            if cls.start_connecting(endpoint, state, is_verbose):
+              ready.append(endpoint)
+
+        connecting = {}
+        for endpoint, state in pending.items():
+          if state['socket'] is not None:
+            connecting[state['socket']] = endpoint
+
+        if ready:
+          wait_time = 0
+        else:
+          wait_time = cls.get_wait_time(pending.values(), deadline,
+            connect_timeout)
+
+        if connecting:
+          _, writable, _ = select.select([], connecting.keys(), [], wait_time)
+        else:
+          writable = []
+          time.sleep(wait_time)
+
+        for sock in writable:
+          endpoint = connecting[sock]
+          error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+          if error == 0:
+            ready.append(endpoint)
+          else:
+            cls.retry_later(endpoint, pending[endpoint], os.strerror(error),
+              is_verbose)
+
+        now = time.time()
+        for endpoint, state in pending.items():
+          if state['socket'] is not None and endpoint not in ready and \
+            now - state['started'] > connect_timeout:
+            cls.retry_later(endpoint, state, "timed out after {0} " \
+              "seconds".format(connect_timeout), is_verbose)
+
+        for endpoint in ready:
+          cls.close_socket(pending.pop(endpoint))
+          AppScaleLogger.verbose("{0}:{1} is now open".format(endpoint[0],
+            endpoint[1]), is_verbose)
+          if on_ready:
+            on_ready(endpoint[0], endpoint[1])
+    finally:
+      for state in pending.values():
+        cls.close_socket(state)
+
+
+  @classmethod
+  def start_connecting(cls, endpoint, state, is_verbose):
+    """Starts a non-blocking connection attempt to the given endpoint.
+
+    Args:
+      endpoint: A (host, port) tuple that we should connect to.
+      state: A dict that keeps track of our connection attempts to this
+        endpoint, which we update with the socket we're connecting with (or
+        when we should try again, if connecting fails right away).
+      is_verbose: A bool that indicates if we should print failure messages to
+        stdout.
+    Returns:
+      True if the connection succeeded right away, and False otherwise.
+    """
+    try:
+      sock = socket.socket()
+    except socket.error as exception:
+      cls.retry_later(endpoint, state, str(exception), is_verbose)
+      return False
+
+    try:
+      sock.setblocking(0)
+      error = sock.connect_ex(endpoint)
+    except socket.error as exception:
+      # Raised if the hostname can't be resolved (e.g., if DNS hasn't
+      # caught up with a machine we just started).
+      sock.close()
+      cls.retry_later(endpoint, state, str(exception), is_verbose)
+      return False
+
+    if error in [0, errno.EISCONN]:
+      sock.close()
+      return True
+
+    if error in cls.IN_PROGRESS:
+      state['socket'] = sock
+      state['started'] = time.time()
+      return False
+
+    sock.close()
+    cls.retry_later(endpoint, state, os.strerror(error), is_verbose)
+    return False
+
+
+  @classmethod
+  def retry_later(cls, endpoint, state, reason, is_verbose):
+    """Gives up on the current connection attempt to the given endpoint, and
+    schedules another one after a randomized, exponentially growing delay, so
+    that we don't hammer machines that are still starting up.
+
+    Args:
+      endpoint: A (host, port) tuple that we failed to connect to.
+      state: A dict that keeps track of our connection attempts to this
+        endpoint.
+      reason: A str that explains why the connection attempt failed.
+      is_verbose: A bool that indicates if we should print failure messages to
+        stdout.
+    """
+    cls.close_socket(state)
+    state['retry_at'] = time.time() + cls.get_retry_delay(state['backoff'])
+    state['backoff'] = min(state['backoff'] * 2, cls.MAX_BACKOFF)
+    AppScaleLogger.verbose("Waiting for {0}:{1} to open ({2})".format(
+      endpoint[0], endpoint[1], reason), is_verbose)
+
+
+  @classmethod
+  def get_retry_delay(cls, backoff):
+    """Picks how long to wait before our next connection attempt. Adding
+    jitter keeps us from retrying every machine at the exact same time.
+
+    Args:
+      backoff: The number of seconds that we would wait without jitter.
+    Returns:
+      A float between half of backoff and backoff.
+    """
+    return random.uniform(backoff / 2.0, backoff)
+
+
+  @classmethod
+  def get_wait_time(cls, states, deadline, connect_timeout):
+    """Determines how long we can wait before something needs our attention:
+    a connection attempt to retry, a connection attempt to time out, or the
+    overall deadline to pass.
+
+    Args:
+      states: A list of dicts, one per endpoint that hasn't opened yet.
+      deadline: The time at which we give up on all endpoints, or None if we
+        never give up.
+      connect_timeout: The number of seconds that we give a single connection
+        attempt to succeed.
+    Returns:
+      The number of seconds that we can wait for, which is never negative.
+    """
+    events = []
+    if deadline is not None:
+      events.append(deadline)
+    for state in states:
+      if state['socket'] is None:
+        events.append(state['retry_at'])
+      else:
+        events.append(state['started'] + connect_timeout)
+
+    if not events:
+      return 0
+    return max(min(events) - time.time(), 0)
+
+
+  @classmethod
+  def close_socket(cls, state):
+    """Closes the socket that a connection attempt was using, if any.
+
+    Args:
+      state: A dict that keeps track of our connection attempts to a single
+        endpoint.
+    """
+    if state['socket'] is not None:
+      state['socket'].close()
+      state['socket'] = None
@@ -3,14 +3,22 @@
 
 
 # General-purpose Python library imports
+import atexit
+import cStringIO
+import hashlib
+import json
 import os
+import pipes
 import re
+import shutil
 import socket
 import subprocess
 import sys
+import tarfile
 import tempfile
 import threading
 import time
+import zlib
 
 
 # AppScale-specific imports
@@ -23,6 +31,9 @@ from custom_exceptions import BadConfigurationException
 from custom_exceptions import ShellException
 from local_state import APPSCALE_VERSION
 from local_state import LocalState
+from parallel_helper import ParallelHelper
+from phase_timer import PhaseTimer
+from port_waiter import PortWaiter
 from user_app_client import UserAppClient
 
 
@@ -47,19 +58,107 @@ class RemoteHelper():
 
 
   # The options that should be used when making ssh and scp calls.
-  SSH_OPTIONS = "-o LogLevel=quiet -o NumberOfPasswordPrompts=0 " + \
-    "-o StrictHostkeyChecking=no -o UserKnownHostsFile=/dev/null"
+  SSH_OPTIONS = ["-o", "LogLevel=quiet", "-o", "NumberOfPasswordPrompts=0",
+    "-o", "StrictHostkeyChecking=no", "-o", "UserKnownHostsFile=/dev/null"]
+
+
+  # The number of seconds that a multiplexed SSH connection should stay open
+  # in the background once the last ssh or scp call using it has finished.
+  SSH_CONTROL_PERSIST_TIME = 600
+
+
+  # A set of (user, host) tuples that we have opened multiplexed SSH
+  # connections to, so that we can close them when we're done with them.
+  ssh_connections = set()
+
+
+  # A lock that protects ssh_connections, since ssh and scp calls can be made
+  # from multiple threads at once.
+  ssh_connections_lock = threading.Lock()
+
+
+  # A bool that indicates if we have already asked the interpreter to close
+  # all open multiplexed SSH connections when this process exits.
+  ssh_cleanup_registered = False
+
+
+  # The number of bytes at the start of each remote file that we compute a
+  # digest of, to tell if a file has been replaced (e.g., by log rotation)
+  # since we last copied it.
+  FILE_HEAD_SIZE = 1024
+
+
+  # A regular expression that matches each line of output from the command
+  # that list_remote_files runs, which contains a file's size, the digest of
+  # its first FILE_HEAD_SIZE bytes, and its path.
+  REMOTE_FILE_REGEX = re.compile('\A(\d+) ([0-9a-f]{32}) (.+)\Z')
+
+
+  # A regular expression that matches file paths that can be placed in double
+  # quotes and safely passed to a remote shell.
+  SAFE_PATH_REGEX = re.compile('\A[\w./@+,:= -]+\Z')
+
+
+  # The number of bytes we read at a time when receiving data from a remote
+  # machine.
+  STREAM_CHUNK_SIZE = 64 * 1024
+
+
+  # The directory on the machine running the Login service where we keep an
+  # unpacked copy of each application uploaded to it, so that later uploads of
+  # the same application only need to send over the files that changed.
+  REMOTE_APP_CACHE_DIR = "/var/cache/appscale/uploads"
+
+
+  # The command that waits for god to start answering requests (checking
+  # every 0.2 seconds, for up to 30 seconds), and then has it start the
+  # AppController.
+  GOD_LOAD_COMMAND = "for i in $(seq 1 150); do " + \
+    "god status > /dev/null 2>&1 && break; sleep 0.2; done; " + \
+    "god load /tmp/appcontroller.god"
 
 
   TEMPLATE_GOD_CONFIG_FILE = os.path.dirname(__file__) + os.sep + ".." + \
     os.sep + "templates" + os.sep + "appcontroller.god"
 
 
-  # The amount of time to wait when waiting for all API services to start on
-  # a machine.
+  # The maximum number of seconds to wait for a machine to stop AppScale's
+  # API services when terminating a virtualized cluster, after which we give
+  # up on it and ask the user to stop it manually.
+  MAX_SHUTDOWN_TIME = 300
+
+
+  # The fewest seconds we give an ssh call that is limited by a deadline, so
+  # that one that starts just before the deadline still has time to finish.
+  MIN_SSH_TIMEOUT = 10
+
+
+  # The maximum amount of time to wait in between asking a machine if all of
+  # its API services have started.
   WAIT_TIME = 10
 
 
+  # The amount of time to wait before asking a machine again if all of its API
+  # services have started, the first time it says they haven't. This doubles
+  # each time we ask, up to WAIT_TIME.
+  INITIAL_WAIT_TIME = 1
+
+
+  # The maximum number of machines that we ask at once if all of their API
+  # services have started.
+  MAX_LOADING_POLLERS = 100
+
+
+  # The maximum number of machines that we list by name when telling the user
+  # which machines we're still waiting on.
+  MAX_MACHINES_TO_SUMMARIZE = 5
+
+
+  # The line that our host probing script prints once it has finished, so
+  # that we can tell a complete report apart from a truncated one.
+  PROBE_DONE_MARKER = "appscale-probe-done"
+
+
   @classmethod
   def start_head_node(cls, options, node_layout):
     """Starts the first node in an AppScale deployment and instructs it to start
@@ -82,6 +181,73 @@ class RemoteHelper():
     AppScaleLogger.verbose("Secret key is {0}".format(secret_key),
       options.verbose)
 
+    # Instead of doing each step one after another, run every step as soon as
+    # the steps it needs are done, so that work that doesn't need the head
+    # node (like generating our certificate) happens while it boots.
+    tasks = {
+      'head_node' : (lambda results: cls.acquire_head_node(options,
+        node_layout), []),
+      'cloud_credentials' : (lambda results: cls.get_cloud_credentials(
+        options), []),
+      'ssl_cert' : (lambda results: LocalState.generate_ssl_cert(
+        options.keyname), []),
+      'deployment_params' : (lambda results:
+        LocalState.generate_deployment_params(options, node_layout,
+        results['head_node'][1], results['cloud_credentials']),
+        ['head_node', 'cloud_credentials']),
+      'compatibility' : (lambda results: cls.ensure_machine_is_compatible(
+        results['head_node'][1], options.keyname, options.table,
+        options.verbose), ['head_node']),
+      'deployment_credentials' : (lambda results:
+        cls.copy_deployment_credentials(results['head_node'][1], options),
+        ['head_node', 'ssl_cert', 'compatibility'])
+    }
+
+    appcontroller_dependencies = ['compatibility', 'deployment_credentials']
+    if options.scp:
+      tasks['rsync'] = (lambda results: cls.rsync_local_copy(
+        results['head_node'][1], options), ['compatibility'])
+      appcontroller_dependencies.append('rsync')
+
+    tasks['appcontroller'] = (lambda results: cls.start_remote_appcontroller(
+      results['head_node'][1], options.keyname, options.verbose),
+      appcontroller_dependencies)
+
+    timed_tasks = {}
+    for name, (function, dependencies) in tasks.items():
+      timed_tasks[name] = (PhaseTimer.wrap(name, function), dependencies)
+
+    results = ParallelHelper.run_task_graph(timed_tasks)
+    instance_id, public_ip, private_ip = results['head_node']
+    deployment_params = results['deployment_params']
+    AppScaleLogger.verbose(str(LocalState.obscure_dict(deployment_params)),
+      options.verbose)
+    AppScaleLogger.log("Head node successfully initialized at {0}. It is now starting up {1}.".format(public_ip, options.table))
+    AppScaleLogger.remote_log_tools_state(options, "started head node")
+
+    acc = AppControllerClient(public_ip, secret_key)
+    locations = ["{0}:{1}:{2}:{3}:cloud1".format(public_ip, private_ip,
+      ":".join(node_layout.head_node().roles), instance_id)]
+    with PhaseTimer.span('set_parameters'):
+      acc.set_parameters(locations, LocalState.map_to_array(deployment_params))
+
+    return public_ip, instance_id
+
+
+  @classmethod
+  def acquire_head_node(cls, options, node_layout):
+    """Starts the first node in a cloud deployment, or finds it in a
+    virtualized cluster deployment, returning once we can log into it.
+
+    Args:
+      options: A Namespace that indicates which cloud infrastructure (if any)
+        to use, and how to interact with it.
+      node_layout: A NodeLayout that describes the placement strategy that
+        should be used for this AppScale deployment.
+    Returns:
+      The instance ID (a dummy value in non-cloud deployments), public IP
+        address, and private IP address of the head node.
+    """
     if options.infrastructure:
       instance_id, public_ip, private_ip = cls.spawn_node_in_cloud(options)
     else:
@@ -91,39 +257,41 @@ class RemoteHelper():
 
     AppScaleLogger.log("Log in to your head node: ssh -i {0} root@{1}".format(
       LocalState.get_key_path_from_name(options.keyname), public_ip))
+    return instance_id, public_ip, private_ip
 
-    cls.ensure_machine_is_compatible(public_ip, options.keyname, options.table,
-      options.verbose)
-    if options.scp:
-      AppScaleLogger.log("Copying over local copy of AppScale from {0}".format(
-        options.scp))
-      cls.rsync_files(public_ip, options.keyname, options.scp, options.verbose)
 
-    if options.infrastructure:
-      agent = InfrastructureAgentFactory.create_agent(options.infrastructure)
-      params = agent.get_params_from_args(options)
-      additional_params = params[agent.PARAM_CREDENTIALS]
-    else:
-      additional_params = {}
+  @classmethod
+  def get_cloud_credentials(cls, options):
+    """Finds the credentials that the AppController needs to start more
+    machines in the cloud infrastructure that we're deploying over.
 
-    deployment_params = LocalState.generate_deployment_params(options,
-      node_layout, public_ip, additional_params)
-    AppScaleLogger.verbose(str(LocalState.obscure_dict(deployment_params)),
-      options.verbose)
-    AppScaleLogger.log("Head node successfully initialized at {0}. It is now starting up {1}.".format(public_ip, options.table))
+    Args:
+      options: A Namespace that indicates which cloud infrastructure (if any)
+        to use.
+    Returns:
+      A dict mapping the name of each credential to its value, which is empty
+        in non-cloud deployments.
+    """
+    if not options.infrastructure:
+      return {}
 
-    AppScaleLogger.remote_log_tools_state(options, "started head node")
-    time.sleep(10)  # gives machines in cloud extra time to boot up
+    agent = InfrastructureAgentFactory.create_agent(options.infrastructure)
+    params = agent.get_params_from_args(options)
+    return params[agent.PARAM_CREDENTIALS]
 
-    cls.copy_deployment_credentials(public_ip, options)
-    cls.start_remote_appcontroller(public_ip, options.keyname, options.verbose)
 
-    acc = AppControllerClient(public_ip, secret_key)
-    locations = ["{0}:{1}:{2}:{3}:cloud1".format(public_ip, private_ip,
-      ":".join(node_layout.head_node().roles), instance_id)]
-    acc.set_parameters(locations, LocalState.map_to_array(deployment_params))
+  @classmethod
+  def rsync_local_copy(cls, host, options):
+    """Copies the user's local copy of AppScale over to the given machine.
 
-    return public_ip, instance_id
+    Args:
+      host: A str representing the machine to copy AppScale to.
+      options: A Namespace that indicates where the local copy of AppScale is
+        (its scp field), and which SSH keypair to use.
+    """
+    AppScaleLogger.log("Copying over local copy of AppScale from {0}".format(
+      options.scp))
+    cls.rsync_files(host, options.keyname, options.scp, options.verbose)
 
 
   @classmethod
@@ -143,19 +311,24 @@ class RemoteHelper():
     """
     agent = InfrastructureAgentFactory.create_agent(options.infrastructure)
     params = agent.get_params_from_args(options)
-    agent.configure_instance_security(params)
-    instance_ids, public_ips, private_ips = agent.run_instances(count=1,
-      parameters=params, security_configured=True)
+    with PhaseTimer.span('provision_vm'):
+      agent.configure_instance_security(params)
+      instance_ids, public_ips, private_ips = agent.run_instances(count=1,
+        parameters=params, security_configured=True)
     AppScaleLogger.log("Please wait for your instance to boot up.")
-    cls.sleep_until_port_is_open(public_ips[0], cls.SSH_PORT, options.verbose)
-    cls.enable_root_login(public_ips[0], options.keyname, options.infrastructure,
-      options.verbose)
-    cls.copy_ssh_keys_to_node(public_ips[0], options.keyname, options.verbose)
+    with PhaseTimer.span('ssh_wait'):
+      cls.sleep_until_port_is_open(public_ips[0], cls.SSH_PORT,
+        options.verbose)
+    with PhaseTimer.span('ssh_setup'):
+      cls.enable_root_login(public_ips[0], options.keyname,
+        options.infrastructure, options.verbose)
+      cls.copy_ssh_keys_to_node(public_ips[0], options.keyname,
+        options.verbose)
     return instance_ids[0], public_ips[0], private_ips[0]
 
 
   @classmethod
-  def sleep_until_port_is_open(cls, host, port, is_verbose):
+  def sleep_until_port_is_open(cls, host, port, is_verbose, timeout=None):
     """Queries the given host to see if the named port is open, and if not,
     waits until it is.
 
@@ -165,13 +338,33 @@ class RemoteHelper():
       verbose: A bool that indicates if we should print failure messages to
         stdout (e.g., connection refused messages that can occur when we wait
         for services to come up).
+      timeout: The number of seconds that we should wait for the port to
+        open, or None to wait forever.
+    Raises:
+      AppScaleException: If the port doesn't open before the timeout expires.
     """
-    sleep_time = 1
-    while not cls.is_port_open(host, port, is_verbose):
-      AppScaleLogger.verbose("Waiting for {0}:{1} to open".format(host, port),
-        is_verbose)
-      time.sleep(sleep_time)
-      sleep_time = min(sleep_time * 2, 20)
+    PortWaiter.wait_for_ports([(host, port)], is_verbose, timeout=timeout)
+
+
+  @classmethod
+  def sleep_until_ports_are_open(cls, endpoints, is_verbose, timeout=None,
+    on_ready=None):
+    """Waits until every one of the given ports is open, checking all of them
+    at the same time.
+
+    Args:
+      endpoints: A list of (host, port) tuples that should eventually be open.
+      is_verbose: A bool that indicates if we should print failure messages to
+        stdout.
+      timeout: The number of seconds that we should wait for all of the ports
+        to open, or None to wait forever.
+      on_ready: A function that, if provided, is called with the host and port
+        of each endpoint as soon as it opens.
+    Raises:
+      AppScaleException: If any port doesn't open before the timeout expires.
+    """
+    PortWaiter.wait_for_ports(endpoints, is_verbose, timeout=timeout,
+      on_ready=on_ready)
 
 
   @classmethod
@@ -187,13 +380,16 @@ class RemoteHelper():
     Returns:
       True if the port is open, False otherwise.
     """
+    sock = socket.socket()
     try:
-      sock = socket.socket()
+      sock.settimeout(PortWaiter.CONNECT_TIMEOUT)
       sock.connect((host, port))
       return True
     except Exception as exception:
       AppScaleLogger.verbose(str(exception), is_verbose)
       return False
+    finally:
+      sock.close()
 
 
   @classmethod
@@ -221,9 +417,16 @@ class RemoteHelper():
 
 
   @classmethod
-  def ssh(cls, host, keyname, command, is_verbose, user='root'):
+  def ssh(cls, host, keyname, command, is_verbose, user='root', stdin=None,
+    timeout=None):
     """Logs into the named host and executes the given command.
 
+    We only try the command again if ssh couldn't reach the host (or timed
+    out), since a remote command that fails will usually fail the same way
+    the next time. ssh is run without a local shell, so the command reaches
+    the remote machine exactly as given, even if it contains quotes of its
+    own.
+
     Args:
       host: A str representing the machine that we should log into.
       keyname: A str representing the name of the SSH keypair to log in with.
@@ -231,17 +434,25 @@ class RemoteHelper():
       is_verbose: A bool indicating if we should print the ssh command to
         stdout.
       user: A str representing the user to log in as.
+      stdin: A str that, if provided, is sent to the remote command as its
+        standard input.
+      timeout: The number of seconds that each attempt may take before we
+        give up on it, or None to wait for as long as it takes.
     Returns:
-      A str representing the standard output of the remote command and a str
-        representing the standard error of the remote command.
+      A str representing the standard output of the remote command.
+    Raises:
+      ShellException: If the remote command failed, or if we couldn't reach
+        the host (or timed out) on every attempt.
     """
-    ssh_key = LocalState.get_key_path_from_name(keyname)
-    return LocalState.shell("ssh -i {0} {1} {2}@{3} '{4}'".format(ssh_key,
-      cls.SSH_OPTIONS, user, host, command), is_verbose)
+    _, output, _ = LocalState.run(cls.get_ssh_argv(host, keyname, command,
+      user), is_verbose, timeout=timeout, stdin=stdin,
+      retry_policy=LocalState.RETRY_TRANSIENT)
+    return output
 
 
   @classmethod
-  def scp(cls, host, keyname, source, dest, is_verbose, user='root'):
+  def scp(cls, host, keyname, source, dest, is_verbose, user='root',
+    timeout=None):
     """Securely copies a file from this machine to the named machine.
 
     Args:
@@ -254,18 +465,24 @@ class RemoteHelper():
       is_verbose: A bool that indicates if we should print the scp command to
         stdout.
       user: A str representing the user to log in as.
+      timeout: The number of seconds that each attempt may take before we
+        give up on it, or None to wait for as long as it takes.
     Returns:
-      A str representing the standard output of the secure copy and a str
-        representing the standard error of the secure copy.
+      A str representing the standard output of the secure copy.
+    Raises:
+      ShellException: If we couldn't copy the file after several attempts.
     """
     ssh_key = LocalState.get_key_path_from_name(keyname)
-    return LocalState.shell("scp -i {0} {1} {2} {3}@{4}:{5}".format(ssh_key,
-      cls.SSH_OPTIONS, source, user, host, dest), is_verbose)
+    _, output, _ = LocalState.run(["scp", "-i", ssh_key] +
+      cls.get_ssh_options(host, user) + [source, "{0}@{1}:{2}".format(user,
+      host, dest)], is_verbose, timeout=timeout,
+      retry_policy=LocalState.RETRY_ALWAYS)
+    return output
 
 
   @classmethod
   def scp_remote_to_local(cls, host, keyname, source, dest, is_verbose,
-    user='root'):
+    user='root', timeout=None):
     """Securely copies a file from a remote machine to this machine.
 
     Args:
@@ -278,13 +495,346 @@ class RemoteHelper():
       is_verbose: A bool that indicates if we should print the scp command to
         stdout.
       user: A str representing the user to log in as.
+      timeout: The number of seconds that each attempt may take before we
+        give up on it, or None to wait for as long as it takes.
+    Returns:
+      A str representing the standard output of the secure copy.
+    Raises:
+      ShellException: If we couldn't copy the file after several attempts.
+    """
+    ssh_key = LocalState.get_key_path_from_name(keyname)
+    _, output, _ = LocalState.run(["scp", "-r", "-i", ssh_key] +
+      cls.get_ssh_options(host, user) + ["{0}@{1}:{2}".format(user, host,
+      source), dest], is_verbose, timeout=timeout,
+      retry_policy=LocalState.RETRY_ALWAYS)
+    return output
+
+
+  @classmethod
+  def copy_remote_dir_as_tarball(cls, host, keyname, source, dest, is_verbose,
+    user='root'):
+    """Tars and gzips a directory on a remote machine, streaming the resulting
+    tarball back to this machine as it is made. Since the tarball is never
+    written to the remote machine's disk, this works even if that disk is full,
+    and since it is compressed, it copies much faster than 'scp -r' for text
+    files like logs.
+
+    Args:
+      host: A str representing the machine that we should log into.
+      keyname: A str representing the name of the SSH keypair to log in with.
+      source: A str representing the path on the remote machine of the
+        directory that should be copied.
+      dest: A str representing the path on the local machine where the
+        tarball should be written to.
+      is_verbose: A bool that indicates if we should print the ssh command to
+        stdout.
+      user: A str representing the user to log in as.
+    Returns:
+      A str representing the standard error of the remote tar command.
+    """
+    # tar exits with status 1 if files changed while it read them, which is
+    # expected when they're being written to (e.g., logs). Only worse errors
+    # should count as failures.
+    source = source.rstrip('/')
+    tar_command = "tar -czf - -C {0} {1}; test $? -le 1".format(
+      os.path.dirname(source) or '/', os.path.basename(source))
+    _, _, error = LocalState.run(cls.get_ssh_argv(host, keyname, tar_command,
+      user), is_verbose, retry_policy=LocalState.RETRY_TRANSIENT,
+      output_path=dest)
+    return error
+
+
+  @classmethod
+  def list_remote_files(cls, host, keyname, remote_dir, is_verbose,
+    user='root'):
+    """Finds every file in a directory on a remote machine, along with how big
+    it is and a digest of its first few bytes (so that callers can tell if the
+    file has been replaced since they last looked at it).
+
+    Files whose names contain characters that the shell would interpret
+    (e.g., quotes) are skipped.
+
+    Args:
+      host: A str representing the machine that we should log into.
+      keyname: A str representing the name of the SSH keypair to log in with.
+      remote_dir: A str representing the path on the remote machine of the
+        directory whose files we should find.
+      is_verbose: A bool that indicates if we should print the ssh command to
+        stdout.
+      user: A str representing the user to log in as.
+    Returns:
+      A dict that maps the path of each file (relative to remote_dir) to a
+      tuple containing its size (an int) and the MD5 digest of its first
+      FILE_HEAD_SIZE bytes (a str).
+    """
+    output = cls.ssh(host, keyname, 'cd {0} && find . -type f | ' \
+      'while IFS= read -r f; do echo "$(stat -c %s "$f") ' \
+      '$(head -c {1} "$f" | md5sum | cut -c1-32) ${{f#./}}"; done'.format(
+      remote_dir, cls.FILE_HEAD_SIZE), is_verbose, user=user)
+
+    files = {}
+    for line in output.split("\n"):
+      match = cls.REMOTE_FILE_REGEX.match(line)
+      if not match:
+        continue
+      size, head_digest, path = match.groups()
+      if cls.SAFE_PATH_REGEX.match(path):
+        files[path] = (int(size), head_digest)
+      else:
+        AppScaleLogger.verbose("Skipping {0}:{1}/{2}, since its name is " \
+          "unsafe to use in a shell".format(host, remote_dir, path), is_verbose)
+    return files
+
+
+  @classmethod
+  def copy_remote_file_ranges(cls, host, keyname, remote_dir, ranges,
+    local_dir, is_verbose, user='root',
+    num_retries=LocalState.DEFAULT_NUM_RETRIES):
+    """Copies byte ranges of files in a directory on a remote machine into the
+    files with the same paths in a local directory. All of the ranges are sent
+    over a single gzip-compressed ssh connection.
+
+    Each range is written into the local file at the same offset that it was
+    read from, and anything after it in the local file is thrown away. If a
+    remote file shrinks before we can copy it (e.g., it's truncated), the
+    bytes it no longer has are filled in with NUL bytes, so that the ranges
+    after it still line up.
+
+    Args:
+      host: A str representing the machine that we should log into.
+      keyname: A str representing the name of the SSH keypair to log in with.
+      remote_dir: A str representing the path on the remote machine of the
+        directory that the files can be found in.
+      ranges: A list of tuples, where each tuple contains the path of a file
+        (relative to remote_dir), the offset in that file to start copying
+        from, and the number of bytes to copy.
+      local_dir: A str representing the path on the local machine of the
+        directory that the files should be copied into.
+      is_verbose: A bool that indicates if we should print the ssh command to
+        stdout.
+      user: A str representing the user to log in as.
+      num_retries: The number of times we should try to copy the files before
+        aborting.
+    Returns:
+      An int indicating how many bytes were copied.
+    Raises:
+      ShellException: If the remote command failed, or if, after num_retries
+        attempts, we still couldn't reach the host to copy the files.
+    """
+    if not ranges:
+      return 0
+
+    remote_command = "cd {0} && ({1}) | gzip -c".format(remote_dir, "; ".join([
+      '{{ tail -c +{1} "./{0}" 2>/dev/null | head -c {2}; ' \
+      'head -c {2} /dev/zero; }} | head -c {2}'.format(path, offset + 1, length)
+      for path, offset, length in ranges]))
+    argv = cls.get_ssh_argv(host, keyname, remote_command, user)
+    command = " ".join([pipes.quote(arg) for arg in argv])
+
+    tries_left = num_retries
+    while True:
+      AppScaleLogger.verbose("run> {0}".format(command), is_verbose)
+      the_temp_file = tempfile.TemporaryFile()
+      process = subprocess.Popen(argv, stdout=subprocess.PIPE,
+        stderr=the_temp_file, close_fds=True)
+      copied_everything = False
+      try:
+        cls.write_file_ranges(process.stdout, ranges, local_dir)
+        copied_everything = True
+      except (IOError, OSError, zlib.error) as exception:
+        AppScaleLogger.verbose(str(exception), is_verbose)
+      finally:
+        process.stdout.close()
+      process.wait()
+      the_temp_file.close()
+
+      if copied_everything and process.returncode == 0:
+        return sum([length for _, _, length in ranges])
+
+      # A remote command that failed will fail the same way next time, but
+      # a dropped connection (which also cuts the data short) may not.
+      tries_left -= 1
+      if tries_left <= 0 or not LocalState.should_retry(
+        LocalState.RETRY_TRANSIENT, process.returncode):
+        raise ShellException("Command exited with {0}: {1}".format(
+          process.returncode, command), returncode=process.returncode)
+      AppScaleLogger.verbose("Copying files from {0} failed. Trying again " \
+        "momentarily.".format(host), is_verbose)
+      time.sleep(LocalState.RETRY_DELAY)
+
+
+  @classmethod
+  def write_file_ranges(cls, stream, ranges, local_dir):
+    """Reads gzip-compressed data from the given stream, and writes it into
+    the local files named by the given ranges, in order.
+
+    Args:
+      stream: A file-like object that the compressed data can be read from.
+      ranges: A list of tuples, where each tuple contains the path of a file
+        (relative to local_dir), the offset in that file to start writing at,
+        and the number of bytes to write.
+      local_dir: A str representing the path on the local machine of the
+        directory that the files should be written into.
+    Raises:
+      IOError: If the stream ends before every range has been written.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = ''
+    for path, offset, length in ranges:
+      local_path = os.path.join(local_dir, path)
+      if not os.path.exists(os.path.dirname(local_path)):
+        os.makedirs(os.path.dirname(local_path))
+
+      if offset and os.path.exists(local_path):
+        mode = 'r+b'
+      else:
+        mode = 'wb'
+      with open(local_path, mode) as file_handle:
+        file_handle.seek(offset)
+        file_handle.truncate()
+        while length:
+          if not data:
+            compressed = stream.read(cls.STREAM_CHUNK_SIZE)
+            if not compressed:
+              raise IOError("Connection closed before we received all of " \
+                "{0}".format(path))
+            data = decompressor.decompress(compressed)
+            continue
+
+          file_handle.write(data[:length])
+          num_written = min(length, len(data))
+          data = data[num_written:]
+          length -= num_written
+
+
+  @classmethod
+  def copy_files_in_bundle(cls, host, keyname, files, is_verbose, user='root'):
+    """Securely copies a number of (small) files from this machine to the named
+    machine in a single round trip.
+
+    Rather than running scp once per file, we pack the files into a tarball in
+    memory, with the paths and permissions that they should have on the remote
+    machine, and unpack it there via a single ssh call.
+
+    Args:
+      host: A str representing the machine that we should log into.
+      keyname: A str representing the name of the SSH keypair to log in with.
+      files: A list of tuples, where each tuple contains the path on the local
+        filesystem of a file to copy, the absolute path on the remote machine
+        that it should be copied to, and an int representing the permissions
+        it should have there.
+      is_verbose: A bool that indicates if we should print the ssh command to
+        stdout.
+      user: A str representing the user to log in as.
     Returns:
-      A str representing the standard output of the secure copy and a str
-        representing the standard error of the secure copy.
+      A str representing the standard output of the remote tar command.
+    """
+    bundle = cStringIO.StringIO()
+    tar = tarfile.open(fileobj=bundle, mode='w')
+    for local_path, remote_path, permissions in files:
+      with open(local_path, 'r') as file_handle:
+        contents = file_handle.read()
+      tar_info = tarfile.TarInfo(remote_path.lstrip('/'))
+      tar_info.size = len(contents)
+      tar_info.mode = permissions
+      tar_info.mtime = time.time()
+      tar.addfile(tar_info, cStringIO.StringIO(contents))
+    tar.close()
+
+    return cls.ssh(host, keyname, 'tar -xf - -C /', is_verbose, user=user,
+      stdin=bundle.getvalue())
+
+
+  @classmethod
+  def get_control_path(cls, host, user='root'):
+    """Determines where the control socket for a multiplexed SSH connection to
+    the named host should be placed on the local filesystem.
+
+    Args:
+      host: A str representing the machine that we should log into.
+      user: A str representing the user to log in as.
+    Returns:
+      A str indicating where the control socket can be found.
+    """
+    return "{0}ssh-{1}@{2}".format(LocalState.LOCAL_APPSCALE_PATH, user, host)
+
+
+  @classmethod
+  def get_ssh_options(cls, host, user='root'):
+    """Constructs the options that ssh, scp, and rsync should use to log into
+    the named host.
+
+    In addition to the standard SSH_OPTIONS, we ask OpenSSH to open a single
+    master connection to each host and share it among all later calls to that
+    host, so that we only pay for the TCP and key-exchange handshakes once.
+    The master connection is remembered so that we can close it when this
+    process exits (or when the deployment is terminated).
+
+    Args:
+      host: A str representing the machine that we should log into.
+      user: A str representing the user to log in as.
+    Returns:
+      A list of strs containing the options to pass to ssh or scp.
+    """
+    with cls.ssh_connections_lock:
+      cls.ssh_connections.add((user, host))
+      if not cls.ssh_cleanup_registered:
+        atexit.register(cls.close_ssh_connections)
+        cls.ssh_cleanup_registered = True
+
+    return cls.SSH_OPTIONS + ["-o", "ControlMaster=auto",
+      "-o", "ControlPath={0}".format(cls.get_control_path(host, user)),
+      "-o", "ControlPersist={0}".format(cls.SSH_CONTROL_PERSIST_TIME)]
+
+
+  @classmethod
+  def get_ssh_argv(cls, host, keyname, command, user='root'):
+    """Constructs the arguments that run the given command on the named host
+    via ssh, without a local shell in between.
+
+    Args:
+      host: A str representing the machine that we should log into.
+      keyname: A str representing the name of the SSH keypair to log in with.
+      command: A str representing what to execute on the remote host.
+      user: A str representing the user to log in as.
+    Returns:
+      A list of strs, suitable for passing to LocalState.run or
+        subprocess.Popen.
     """
     ssh_key = LocalState.get_key_path_from_name(keyname)
-    return LocalState.shell("scp -r -i {0} {1} {2}@{3}:{4} {5}".format(ssh_key,
-      cls.SSH_OPTIONS, user, host, source, dest), is_verbose)
+    return ["ssh", "-i", ssh_key] + cls.get_ssh_options(host, user) + \
+      ["{0}@{1}".format(user, host), command]
+
+
+  @classmethod
+  def close_ssh_connections(cls, hosts=None, is_verbose=False):
+    """Closes the multiplexed SSH connections that we have opened.
+
+    Args:
+      hosts: A list of strs representing the machines whose connections should
+        be closed. If None, the connections to all machines are closed.
+      is_verbose: A bool that indicates if we should print the hosts whose
+        connections we close to stdout.
+    """
+    with cls.ssh_connections_lock:
+      if hosts is None:
+        to_close = list(cls.ssh_connections)
+      else:
+        to_close = [(user, host) for user, host in cls.ssh_connections
+          if host in hosts]
+      cls.ssh_connections.difference_update(to_close)
+
+    for user, host in to_close:
+      control_path = cls.get_control_path(host, user)
+      if not os.path.exists(control_path):
+        continue
+
+      AppScaleLogger.verbose("Closing SSH connection to {0}@{1}".format(user,
+        host), is_verbose)
+      with open(os.devnull, 'w') as devnull:
+        subprocess.call(["ssh", "-O", "exit", "-o", "ControlPath={0}".format(
+          control_path), "{0}@{1}".format(user, host)], stdout=devnull,
+          stderr=devnull)
 
 
   @classmethod
@@ -301,10 +851,11 @@ class RemoteHelper():
         needed to copy the SSH keys over to stdout.
     """
     ssh_key = LocalState.get_key_path_from_name(keyname)
-    cls.scp(host, keyname, ssh_key, '/root/.ssh/id_dsa', is_verbose)
-    cls.scp(host, keyname, ssh_key, '/root/.ssh/id_rsa', is_verbose)
-    cls.scp(host, keyname, ssh_key, '/root/.appscale/{0}.key'.format(keyname),
-      is_verbose)
+    cls.copy_files_in_bundle(host, keyname, [
+      (ssh_key, '/root/.ssh/id_dsa', 0600),
+      (ssh_key, '/root/.ssh/id_rsa', 0600),
+      (ssh_key, '/root/.appscale/{0}.key'.format(keyname), 0600)
+    ], is_verbose)
 
 
   @classmethod
@@ -328,27 +879,108 @@ class RemoteHelper():
         has the wrong version of AppScale installed, or does not have the
         correct database installed.
     """
+    version_dir = '/etc/appscale/{0}'.format(APPSCALE_VERSION)
+    database_dir = '{0}/{1}'.format(version_dir, database)
+    report = cls.probe_host(host, keyname, ['/etc/appscale', version_dir,
+      database_dir], is_verbose)
+    AppScaleLogger.verbose("The machine at {0} runs kernel {1} and has {2} KB "
+      "of free disk space".format(host, report['kernel'],
+      report['free_disk_kb']), is_verbose)
+
     # first, make sure the image is an appscale image
-    if not cls.does_host_have_location(host, keyname, '/etc/appscale',
-      is_verbose):
-      raise AppScaleException("The machine at {0} does not have AppScale " + \
+    if not report['locations']['/etc/appscale']:
+      raise AppScaleException("The machine at {0} does not have AppScale " \
         "installed. Please install AppScale on it and try again.".format(host))
 
     # next, make sure it has the same version of appscale installed as the tools
-    if not cls.does_host_have_location(host, keyname,
-      '/etc/appscale/{0}'.format(APPSCALE_VERSION), is_verbose):
-      raise AppScaleException("The machine at {0} does not have AppScale " + \
+    if not report['locations'][version_dir]:
+      raise AppScaleException("The machine at {0} does not have AppScale " \
         "{1} installed. Please install AppScale {1} on it and try again." \
           .format(host, APPSCALE_VERSION))
 
     # finally, make sure it has the database installed that the user requests
-    if not cls.does_host_have_location(host, keyname,
-      '/etc/appscale/{0}/{1}'.format(APPSCALE_VERSION, database), is_verbose):
-      raise AppScaleException("The machine at {0} does not have support for" + \
-        " {1} installed. Please provide a machine image that does and try " + \
+    if not report['locations'][database_dir]:
+      raise AppScaleException("The machine at {0} does not have support for" \
+        " {1} installed. Please provide a machine image that does and try " \
         "again.".format(host, database))
 
 
+  @classmethod
+  def probe_host(cls, host, keyname, locations, is_verbose):
+    """Logs into the specified host once and reports on which of the named
+    locations exist there, as well as on its kernel version and free disk
+    space.
+
+    Since all of the checks are done by a single remote script that always
+    succeeds when it runs, a missing location never causes the ssh call to be
+    retried - only failing to log into the machine does.
+
+    Args:
+      host: A str representing a host that should be accessible from this
+        machine.
+      keyname: A str representing the name of the SSH keypair that can log into
+        the specified machine.
+      locations: A list of strs, each of which is a path on the remote
+        filesystem that we should be checking for.
+      is_verbose: A bool that indicates if we should print the command we
+        execute to probe the remote host to stdout.
+    Returns:
+      A dict that maps 'locations' to a dict indicating whether or not each of
+      the given locations exists, 'kernel' to a str containing the remote
+      kernel's release, and 'free_disk_kb' to an int indicating how much disk
+      space is free on the remote root partition (or None if it couldn't be
+      determined).
+    Raises:
+      AppScaleException: If we could not log into the specified host, or if the
+        probe did not run to completion there.
+    """
+    script = []
+    for location in locations:
+      script.append('if [ -e {0} ]; then echo "present {0}"; ' \
+        'else echo "missing {0}"; fi'.format(location))
+    script.append('echo "kernel $(uname -r)"')
+    script.append('echo "disk $(df -Pk / | tail -n 1)"')
+    script.append('echo "{0}"'.format(cls.PROBE_DONE_MARKER))
+
+    try:
+      output = cls.ssh(host, keyname, '; '.join(script), is_verbose)
+    except ShellException:
+      raise AppScaleException("Couldn't log into the machine at {0}. Please " \
+        "make sure that it is running and that your SSH key can log into " \
+        "it.".format(host))
+
+    report = {
+      'locations' : {},
+      'kernel' : None,
+      'free_disk_kb' : None
+    }
+    finished = False
+    for line in output.split('\n'):
+      fields = line.strip().split(None, 1)
+      if not fields:
+        continue
+      elif fields[0] == cls.PROBE_DONE_MARKER:
+        finished = True
+      elif len(fields) < 2:
+        continue
+      elif fields[0] in ['present', 'missing']:
+        report['locations'][fields[1]] = fields[0] == 'present'
+      elif fields[0] == 'kernel':
+        report['kernel'] = fields[1]
+      elif fields[0] == 'disk':
+        # df -P prints the filesystem, its size, used and available space.
+        disk_info = fields[1].split()
+        if len(disk_info) > 3 and disk_info[3].isdigit():
+          report['free_disk_kb'] = int(disk_info[3])
+
+    if not finished or set(locations) - set(report['locations'].keys()):
+      raise AppScaleException("Couldn't determine if the machine at {0} is " \
+        "compatible with AppScale - it returned an incomplete report: {1}" \
+        .format(host, output))
+
+    return report
+
+
   @classmethod
   def does_host_have_location(cls, host, keyname, location, is_verbose):
     """Logs into the specified host with the given keyname and checks to see if
@@ -402,12 +1034,13 @@ class RemoteHelper():
           "from, {0}, doesn't contain a {1} folder.".format(local_appscale_dir,
           local_path))
       LocalState.shell("rsync -e 'ssh -i {0} {1}' -arv {2}/* root@{3}:/root/appscale/{4}" \
-        .format(ssh_key, cls.SSH_OPTIONS, local_path, host, dir_name), is_verbose)
+        .format(ssh_key, " ".join(cls.get_ssh_options(host)), local_path, host,
+        dir_name), is_verbose)
 
     # Rsync AppDB separately, as it has a lot of paths we may need to exclude
     # (e.g., built database binaries).
     local_app_db = os.path.expanduser(local_appscale_dir) + os.sep + "AppDB/*"
-    LocalState.shell("rsync -e 'ssh -i {0} {1}' -arv --exclude='logs/*' --exclude='hadoop-*' --exclude='hbase/hbase-*' --exclude='voldemort/voldemort/*' --exclude='cassandra/cassandra/*' {2} root@{3}:/root/appscale/AppDB".format(ssh_key, cls.SSH_OPTIONS, local_app_db, host), is_verbose)
+    LocalState.shell("rsync -e 'ssh -i {0} {1}' -arv --exclude='logs/*' --exclude='hadoop-*' --exclude='hbase/hbase-*' --exclude='voldemort/voldemort/*' --exclude='cassandra/cassandra/*' {2} root@{3}:/root/appscale/AppDB".format(ssh_key, " ".join(cls.get_ssh_options(host)), local_app_db, host), is_verbose)
 
 
   @classmethod
@@ -419,19 +1052,9 @@ class RemoteHelper():
       host: A str representing the machine (reachable from this computer) to
         copy our deployment credentials to.
       options: A Namespace that indicates which SSH keypair to use, and whether
-        or not we are running in a cloud infrastructure.
+        or not we are running in a cloud infrastructure. Our self-signed
+        certificate for that keypair must have already been generated.
     """
-    cls.scp(host, options.keyname, LocalState.get_secret_key_location(
-      options.keyname), '/etc/appscale/secret.key', options.verbose)
-    cls.scp(host, options.keyname, LocalState.get_key_path_from_name(
-      options.keyname), '/etc/appscale/ssh.key', options.verbose)
-
-    LocalState.generate_ssl_cert(options.keyname)
-    cls.scp(host, options.keyname, LocalState.get_certificate_location(
-      options.keyname), '/etc/appscale/certs/mycert.pem', options.verbose)
-    cls.scp(host, options.keyname, LocalState.get_private_key_location(
-      options.keyname), '/etc/appscale/certs/mykey.pem', options.verbose)
-
     AppScaleLogger.log("Copying over deployment credentials")
     if options.infrastructure:
       cert = os.environ["EC2_CERT"]
@@ -440,12 +1063,18 @@ class RemoteHelper():
       cert = LocalState.get_certificate_location(options.keyname)
       private_key = LocalState.get_private_key_location(options.keyname)
 
-    cls.ssh(host, options.keyname, 'mkdir -p /etc/appscale/keys/cloud1',
-      options.verbose)
-    cls.scp(host, options.keyname, cert, "/etc/appscale/keys/cloud1/mycert.pem",
-      options.verbose)
-    cls.scp(host, options.keyname, private_key,
-      "/etc/appscale/keys/cloud1/mykey.pem", options.verbose)
+    cls.copy_files_in_bundle(host, options.keyname, [
+      (LocalState.get_secret_key_location(options.keyname),
+        '/etc/appscale/secret.key', 0600),
+      (LocalState.get_key_path_from_name(options.keyname),
+        '/etc/appscale/ssh.key', 0600),
+      (LocalState.get_certificate_location(options.keyname),
+        '/etc/appscale/certs/mycert.pem', 0644),
+      (LocalState.get_private_key_location(options.keyname),
+        '/etc/appscale/certs/mykey.pem', 0600),
+      (cert, '/etc/appscale/keys/cloud1/mycert.pem', 0644),
+      (private_key, '/etc/appscale/keys/cloud1/mykey.pem', 0600)
+    ], options.verbose)
 
 
   @classmethod
@@ -466,17 +1095,17 @@ class RemoteHelper():
     cls.ssh(host, keyname, 'rm -rf /etc/appscale/appcontroller-state.json',
       is_verbose)
 
+    # scp over the config file that tells god how to start the appcontroller
+    cls.scp(host, keyname, cls.TEMPLATE_GOD_CONFIG_FILE,
+      '/tmp/appcontroller.god', is_verbose)
+
     # start up god, who will start up the appcontroller once we give it the
     # right config file
     cls.ssh(host, keyname, 'god &', is_verbose)
-    time.sleep(1)
-
-    # scp over that config file
-    cls.scp(host, keyname, cls.TEMPLATE_GOD_CONFIG_FILE,
-      '/tmp/appcontroller.god', is_verbose)
 
-    # finally, tell god to start the appcontroller and then wait for it to start
-    cls.ssh(host, keyname, 'god load /tmp/appcontroller.god', is_verbose)
+    # finally, tell god to start the appcontroller as soon as it's up, and then
+    # wait for it to start
+    cls.ssh(host, keyname, cls.GOD_LOAD_COMMAND, is_verbose)
 
     AppScaleLogger.log("Please wait for the AppController to finish " + \
       "pre-processing tasks.")
@@ -496,19 +1125,19 @@ class RemoteHelper():
       is_verbose: A bool that indicates if we should print the SCP commands we
         exec to stdout.
     """
-    # copy the metadata files for AppScale itself to use
-    cls.scp(host, keyname, LocalState.get_locations_yaml_location(keyname),
-      '/etc/appscale/locations-{0}.yaml'.format(keyname), is_verbose)
-    cls.scp(host, keyname, LocalState.get_locations_json_location(keyname),
-      '/etc/appscale/locations-{0}.json'.format(keyname), is_verbose)
-
-    # and copy the json file if the tools on that box wants to use it
-    cls.scp(host, keyname, LocalState.get_locations_json_location(keyname),
-      '/root/.appscale/locations-{0}.json'.format(keyname), is_verbose)
-
-    # and copy the secret file if the tools on that box wants to use it
-    cls.scp(host, keyname, LocalState.get_secret_key_location(keyname),
-      '/root/.appscale/', is_verbose)
+    cls.copy_files_in_bundle(host, keyname, [
+      # the metadata files for AppScale itself to use
+      (LocalState.get_locations_yaml_location(keyname),
+        '/etc/appscale/locations-{0}.yaml'.format(keyname), 0644),
+      (LocalState.get_locations_json_location(keyname),
+        '/etc/appscale/locations-{0}.json'.format(keyname), 0644),
+
+      # the json and secret files, if the tools on that box want to use them
+      (LocalState.get_locations_json_location(keyname),
+        '/root/.appscale/locations-{0}.json'.format(keyname), 0644),
+      (LocalState.get_secret_key_location(keyname),
+        '/root/.appscale/{0}.secret'.format(keyname), 0600)
+    ], is_verbose)
 
   
   @classmethod
@@ -546,27 +1175,108 @@ class RemoteHelper():
 
 
   @classmethod
-  def wait_for_machines_to_finish_loading(cls, host, keyname):
+  def wait_for_machines_to_finish_loading(cls, host, keyname, timeout=None):
     """Queries all of the AppControllers in this AppScale deployment to see if
     they have started all of the API services on their machine, and if not,
     waits until they have.
 
+    We first wait for every AppController to start accepting connections, so
+    that we don't poll machines that haven't started theirs yet. Then every
+    machine is queried at the same time, and each one is asked again after a
+    delay that grows the longer it takes to load, so that we're done waiting
+    as soon as the slowest machine finishes loading.
+
     Args:
       host: The location where an AppController can be found, who will then have
         the locations of all the other AppControllers in this AppScale
         deployment.
       keyname: The name of the SSH keypair used for this AppScale deployment.
+      timeout: The number of seconds that we should wait for all of the
+        machines to finish loading, or None to wait forever.
+    Raises:
+      AppScaleException: If any machine hasn't finished loading by the time
+        the timeout expires.
     """
-    acc = AppControllerClient(host, LocalState.get_secret_key(keyname))
+    secret = LocalState.get_secret_key(keyname)
+    acc = AppControllerClient(host, secret)
     all_ips = acc.get_all_public_ips()
 
+    clients = {}
     for ip in all_ips:
-      while True:
-        acc = AppControllerClient(ip, LocalState.get_secret_key(keyname))
-        if acc.is_initialized():
-          break
+      if ip == host:
+        clients[ip] = acc
+      else:
+        clients[ip] = AppControllerClient(ip, secret)
+
+    if timeout is None:
+      deadline = None
+    else:
+      deadline = time.time() + timeout
+
+    started = []
+
+    def log_appcontroller_started(ip, port):
+      """Tells the user how many AppControllers have started so far."""
+      started.append(ip)
+      AppScaleLogger.log("{0}/{1} AppControllers started".format(
+        len(started), len(all_ips)))
+
+    cls.sleep_until_ports_are_open([(ip, AppControllerClient.PORT)
+      for ip in all_ips], False, timeout=timeout,
+      on_ready=log_appcontroller_started)
+
+    waiting_on = set(all_ips)
+    waiting_on_lock = threading.Lock()
+
+    def wait_for_machine(ip):
+      """Asks the AppController on the given machine if it has finished
+      loading until it says it has, or until we run out of time."""
+      wait_time = cls.INITIAL_WAIT_TIME
+      while not clients[ip].is_initialized():
+        if deadline is None:
+          time.sleep(wait_time)
         else:
-          time.sleep(cls.WAIT_TIME)
+          remaining = deadline - time.time()
+          if remaining <= 0:
+            raise AppScaleException("Timed out after {0} seconds waiting " \
+              "for {1} to finish loading".format(timeout, ip))
+          time.sleep(min(wait_time, remaining))
+        wait_time = min(wait_time * 2, cls.WAIT_TIME)
+
+      with waiting_on_lock:
+        waiting_on.discard(ip)
+        cls.log_loading_progress(len(all_ips), waiting_on)
+
+    _, errors = ParallelHelper.run_on_hosts(all_ips, wait_for_machine,
+      max_threads=cls.MAX_LOADING_POLLERS)
+    ParallelHelper.raise_if_any_failed(errors,
+      "waiting for machines to finish loading")
+
+
+  @classmethod
+  def log_loading_progress(cls, num_machines, waiting_on):
+    """Tells the user how many machines have finished loading, and which ones
+    we're still waiting on.
+
+    Args:
+      num_machines: An int indicating how many machines are in this AppScale
+        deployment.
+      waiting_on: A set of strs, the public IPs of the machines that haven't
+        finished loading yet.
+    """
+    num_loaded = num_machines - len(waiting_on)
+    if not waiting_on:
+      AppScaleLogger.log("{0}/{1} nodes initialized".format(num_loaded,
+        num_machines))
+      return
+
+    machines = sorted(waiting_on)
+    summary = ", ".join(machines[:cls.MAX_MACHINES_TO_SUMMARIZE])
+    if len(machines) > cls.MAX_MACHINES_TO_SUMMARIZE:
+      summary += " and {0} more".format(len(machines) -
+        cls.MAX_MACHINES_TO_SUMMARIZE)
+    AppScaleLogger.log("{0}/{1} nodes initialized, waiting on {2}".format(
+      num_loaded, num_machines, summary))
 
 
   @classmethod
@@ -614,31 +1324,36 @@ class RemoteHelper():
     acc = AppControllerClient(shadow_host, LocalState.get_secret_key(keyname))
     all_ips = acc.get_all_public_ips()
 
-    threads = []
-    for ip in all_ips:
-      thread = threading.Thread(target=cls.stop_remote_appcontroller, args=(ip,
-        keyname, is_verbose))
-      thread.start()
-      threads.append(thread)
-
-    for thread in threads:
-      thread.join()
-
-    boxes_shut_down = 0
     is_running_regex = re.compile("appscale-controller stop")
-    for ip in all_ips:
+
+    def shut_down(ip):
+      """Stops the AppController on the given machine, and waits (for up to
+      MAX_SHUTDOWN_TIME seconds) for it to finish shutting down AppScale's API
+      services there."""
+      deadline = time.time() + cls.MAX_SHUTDOWN_TIME
+      cls.stop_remote_appcontroller(ip, keyname, is_verbose)
       AppScaleLogger.log("Shutting down AppScale API services at {0}".format(ip))
       while True:
-        remote_output = cls.ssh(ip, keyname, 'ps x', is_verbose)
-        AppScaleLogger.log(remote_output)
-        if not is_running_regex.match(remote_output):
+        remote_output = cls.ssh(ip, keyname, 'ps x', is_verbose,
+          timeout=max(deadline - time.time(), cls.MIN_SSH_TIMEOUT))
+        AppScaleLogger.verbose(remote_output, is_verbose)
+        if not is_running_regex.search(remote_output):
           break
+        if time.time() > deadline:
+          raise AppScaleException("Timed out after {0} seconds waiting for " \
+            "AppScale to stop at {1}".format(cls.MAX_SHUTDOWN_TIME, ip))
         time.sleep(0.3)
-      boxes_shut_down += 1
+
+    # A stuck ssh call could keep a machine from ever reaching the deadline
+    # above, so we also give up on machines that take too long overall.
+    results, errors = ParallelHelper.run_on_hosts(all_ips, shut_down,
+      timeout=cls.MAX_SHUTDOWN_TIME)
+    boxes_shut_down = len(results)
 
     if boxes_shut_down != len(all_ips):
       raise AppScaleException("Couldn't terminate your AppScale deployment " + \
-        "on all machines - please do so manually.")
+        "on all machines - please do so manually. The machines we couldn't " + \
+        "terminate are: {0}".format(", ".join(sorted(errors.keys()))))
 
     AppScaleLogger.log("Terminated AppScale on {0} machines."
       .format(boxes_shut_down))
@@ -667,6 +1382,13 @@ class RemoteHelper():
     """Copies the given application to a machine running the Login service within
     an AppScale deployment.
 
+    The Login machine keeps an unpacked copy of every application uploaded to
+    it, along with a manifest of that copy's contents. If that manifest
+    matches the one we saved locally the last time we uploaded this
+    application, then we only send over the files that have changed since
+    then, and have the Login machine build the application's tarball from its
+    updated copy.
+
     Args:
       app_location: The location on the local filesystem where the application
         can be found.
@@ -679,21 +1401,208 @@ class RemoteHelper():
       A str corresponding to the location on the remote filesystem where the
         application was copied to.
     """
-    AppScaleLogger.log("Creating remote directory to copy app into")
     app_id = AppEngineHelper.get_app_id_from_app_config(app_location)
+    host = LocalState.get_login_host(keyname)
     remote_app_dir = "/var/apps/{0}/app".format(app_id)
-    cls.ssh(LocalState.get_login_host(keyname), keyname,
-      'mkdir -p {0}'.format(remote_app_dir), is_verbose)
+    remote_app_tar = "{0}/{1}.tar.gz".format(remote_app_dir, app_id)
+    remote_cache_dir = "{0}/{1}".format(cls.REMOTE_APP_CACHE_DIR, app_id)
+    remote_manifest = "{0}.json".format(remote_cache_dir)
+    remote_staging_dir = "{0}.staging".format(remote_cache_dir)
 
-    AppScaleLogger.log("Tarring application")
-    local_tarred_app = "/tmp/appscale-app-{0}.tar.gz".format(app_id)
-    LocalState.shell("cd {0} && tar -czf {1} *".format(app_location,
-      local_tarred_app), is_verbose)
+    AppScaleLogger.log("Creating remote directory to copy app into")
+    remote_digest = cls.ssh(host, keyname,
+      "mkdir -p {0} && (sha1sum {1} 2>/dev/null || true)".format(
+      remote_app_dir, remote_manifest), is_verbose).split()
+
+    old_manifest = LocalState.get_app_manifest(keyname, app_id)
+    old_digest = hashlib.sha1(json.dumps(old_manifest, sort_keys=True)) \
+      .hexdigest()
+    if not remote_digest or remote_digest[0] != old_digest:
+      # The Login machine doesn't have the copy of the app we think it does
+      # (e.g., it was never uploaded, or AppScale was restarted), so send the
+      # whole app over.
+      old_manifest = {}
+
+    new_manifest = LocalState.generate_app_manifest(app_location)
+    changed = sorted([path for path, digest in new_manifest.items()
+      if old_manifest.get(path) != digest])
+
+    # Files that were deleted need to be removed from the remote copy, as do
+    # files that turned into directories (or vice-versa), since tar can't
+    # extract one over the other.
+    removed = sorted([path for path, digest in old_manifest.items()
+      if path not in new_manifest or (path in changed and
+      LocalState.DIRECTORY_DIGEST in (digest, new_manifest[path]))])
+
+    if old_manifest:
+      AppScaleLogger.log("Copying over {0} changed file(s) and removing {1} " \
+        "file(s)".format(len(changed), len(removed)))
+      clear_cache = ""
+    else:
+      AppScaleLogger.log("Copying over application")
+      clear_cache = "rm -rf {0} && ".format(remote_cache_dir)
+
+    new_manifest_contents = json.dumps(new_manifest, sort_keys=True)
+    remote_command = clear_cache + "rm -rf {0} {1} && mkdir -p {1}/files {2} && " \
+      "tar -xzf - -C {1} && cd {2} && xargs -0 rm -rf < {1}/removed && " \
+      "cp -a {1}/files/. . && tar -czf {3} * && " \
+      "mv {1}/manifest.json {0} && rm -rf {1}".format(remote_manifest,
+      remote_staging_dir, remote_cache_dir, remote_app_tar)
+    cls.stream_tarball_to_host(host, keyname,
+      [(os.path.join(app_location, path), "files/" + path) for path in changed],
+      remote_command, is_verbose, generated_files=[
+        ("removed", "".join([path + "\0" for path in removed])),
+        ("manifest.json", new_manifest_contents)
+      ])
+
+    LocalState.update_app_manifest(keyname, app_id, new_manifest_contents)
+    return remote_app_tar
 
-    AppScaleLogger.log("Copying over application")
+
+  @classmethod
+  def copy_app_tarball_to_host(cls, tar_location, app_id, keyname, is_verbose):
+    """Copies the given application, which has already been packaged as a
+    tar.gz file, to a machine running the Login service within an AppScale
+    deployment.
+
+    The tarball is streamed straight into place on the Login machine, without
+    being extracted or rebuilt on either machine. Since the Login machine's
+    unpacked copy of the application (see copy_app_to_host) no longer matches
+    what it's running, we throw that copy away.
+
+    Args:
+      tar_location: The location on the local filesystem where the tar.gz
+        file can be found.
+      app_id: A str containing the application's ID.
+      keyname: The name of the SSH keypair that uniquely identifies this
+        AppScale deployment.
+      is_verbose: A bool that indicates if we should print the commands we exec
+        to copy the app to the remote host to stdout.
+    Returns:
+      A str corresponding to the location on the remote filesystem where the
+        application was copied to.
+    """
+    host = LocalState.get_login_host(keyname)
+    remote_app_dir = "/var/apps/{0}/app".format(app_id)
     remote_app_tar = "{0}/{1}.tar.gz".format(remote_app_dir, app_id)
-    cls.scp(LocalState.get_login_host(keyname), keyname, local_tarred_app,
-      remote_app_tar, is_verbose)
+    remote_cache_dir = "{0}/{1}".format(cls.REMOTE_APP_CACHE_DIR, app_id)
+
+    def send_tarball(stdin):
+      """Writes the application's tarball to the remote command."""
+      with open(tar_location, 'rb') as tarball:
+        shutil.copyfileobj(tarball, stdin)
 
-    os.remove(local_tarred_app)
+    AppScaleLogger.log("Copying over application")
+    cls.stream_to_host(host, keyname, "mkdir -p {0} && rm -rf {1} {1}.json " \
+      "&& cat > {2}".format(remote_app_dir, remote_cache_dir, remote_app_tar),
+      send_tarball, is_verbose)
     return remote_app_tar
+
+
+  @classmethod
+  def stream_tarball_to_host(cls, host, keyname, local_files, remote_command,
+    is_verbose, generated_files=None, user='root',
+    num_retries=LocalState.DEFAULT_NUM_RETRIES):
+    """Tars and gzips the given files, writing the resulting tarball directly
+    into the standard input of a command run on the named host. This way, each
+    file is read once, and no temporary copy of the tarball is ever made on
+    either machine.
+
+    Args:
+      host: A str representing the machine that we should log into.
+      keyname: A str representing the name of the SSH keypair to log in with.
+      local_files: A list of tuples, where each tuple contains a str naming a
+        file on the local filesystem and a str naming where it should be
+        placed in the tarball. Directories are added without their contents.
+      remote_command: A str representing the command to execute on the remote
+        host, which reads the tarball from its standard input.
+      is_verbose: A bool indicating if we should print the ssh command to
+        stdout.
+      generated_files: A list of tuples, where each tuple contains a str naming
+        where a file should be placed in the tarball and a str containing that
+        file's contents.
+      user: A str representing the user to log in as.
+      num_retries: The number of times we should try to copy the files before
+        aborting.
+    Raises:
+      ShellException: If the remote command failed, or if, after num_retries
+        attempts, we still couldn't reach the host to copy the files.
+    """
+    def send_tarball(stdin):
+      """Tars and gzips the files into the remote command."""
+      tar = tarfile.open(fileobj=stdin, mode='w|gz')
+      for arcname, contents in generated_files or []:
+        tar_info = tarfile.TarInfo(arcname)
+        tar_info.size = len(contents)
+        tar_info.mtime = time.time()
+        tar.addfile(tar_info, cStringIO.StringIO(contents))
+      for local_path, arcname in local_files:
+        tar.add(local_path, arcname=arcname, recursive=False)
+      tar.close()
+
+    cls.stream_to_host(host, keyname, remote_command, send_tarball, is_verbose,
+      user=user, num_retries=num_retries)
+
+
+  @classmethod
+  def stream_to_host(cls, host, keyname, remote_command, send_input,
+    is_verbose, user='root', num_retries=LocalState.DEFAULT_NUM_RETRIES):
+    """Runs a command on the named host, and writes its standard input as we
+    produce it, instead of building all of it in memory first.
+
+    Args:
+      host: A str representing the machine that we should log into.
+      keyname: A str representing the name of the SSH keypair to log in with.
+      remote_command: A str representing the command to execute on the remote
+        host, which reads from its standard input.
+      send_input: A function that takes a file-like object (the remote
+        command's standard input), and writes everything the remote command
+        needs to it. It is called once per attempt.
+      is_verbose: A bool indicating if we should print the ssh command to
+        stdout.
+      user: A str representing the user to log in as.
+      num_retries: The number of times we should try to run the command before
+        aborting.
+    Raises:
+      ShellException: If the remote command failed, or if, after num_retries
+        attempts, we still couldn't reach the host to run it.
+    """
+    argv = cls.get_ssh_argv(host, keyname, remote_command, user)
+    command = " ".join([pipes.quote(arg) for arg in argv])
+
+    tries_left = num_retries
+    while True:
+      AppScaleLogger.verbose("run> {0}".format(command), is_verbose)
+      the_temp_file = tempfile.TemporaryFile()
+      process = subprocess.Popen(argv, stdin=subprocess.PIPE,
+        stdout=the_temp_file, stderr=subprocess.STDOUT, close_fds=True)
+      sent_everything = False
+      try:
+        send_input(process.stdin)
+        sent_everything = True
+      except (IOError, OSError) as exception:
+        # Either ssh exited early (and writing to it failed with a broken
+        # pipe), or we couldn't read a local file. In both cases, the remote
+        # command didn't get everything it needed, so try again.
+        AppScaleLogger.verbose(str(exception), is_verbose)
+      finally:
+        process.stdin.close()
+      process.wait()
+      the_temp_file.seek(0)
+      output = the_temp_file.read(LocalState.MAX_OUTPUT_SIZE)
+      the_temp_file.close()
+
+      if sent_everything and process.returncode == 0:
+        return
+
+      # A remote command that failed will fail the same way next time, but
+      # a dropped connection (which also cuts its input short) may not.
+      tries_left -= 1
+      if tries_left <= 0 or not LocalState.should_retry(
+        LocalState.RETRY_TRANSIENT, process.returncode):
+        raise ShellException("Command exited with {0}: {1}".format(
+          process.returncode, command), returncode=process.returncode,
+          output=output)
+      AppScaleLogger.verbose("Copying files to {0} failed. Trying again " \
+        "momentarily.".format(host), is_verbose)
+      time.sleep(LocalState.RETRY_DELAY)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# AppScale-specific imports
+from custom_exceptions import BadConfigurationException
+
+
+class RoleIndex():
+  """RoleIndex indexes the machines in an AppScale deployment by the roles
+  they run and by their IP addresses, so that callers can quickly find the
+  subset of a (potentially large) deployment that they want to work with.
+
+  Besides looking up a single role, callers can ask for the machines that
+  match a role query, which combines roles with the following operators:
+    a+b: machines that run both role a and role b.
+    a,b: machines that run either role a or role b (or both).
+  '+' binds more tightly than ',', so 'memcache+db_slave,appengine' finds the
+  machines that run both memcache and db_slave, plus the appengine machines.
+  """
+
+
+  # The str that separates alternatives in a role query, any of which a
+  # machine can match.
+  ANY_OF_SEPARATOR = ","
+
+
+  # The str that separates roles in a role query that a machine must all run.
+  ALL_OF_SEPARATOR = "+"
+
+
+  # The roles that machines can be listed with in a deployment's
+  # locations.json, and so the only roles worth asking for in a role query.
+  # NodeLayout builds its list of valid roles from this one, adding 'master',
+  # which it expands into 'shadow' and 'load_balancer' before any machine
+  # starts.
+  JOB_ROLES = ('appengine', 'database', 'shadow', 'open', 'load_balancer',
+    'login', 'db_master', 'db_slave', 'zookeeper', 'memcache', 'rabbitmq',
+    'rabbitmq_master', 'rabbitmq_slave')
+
+
+  def __init__(self, nodes):
+    """Creates a new RoleIndex.
+
+    Args:
+      nodes: A list of dicts, where each dict contains information on a single
+        machine in an AppScale deployment (as found in locations.json).
+    """
+    self.hosts = []
+    self.hosts_by_role = {}
+    self.roles_by_host = {}
+    self.private_ips = {}
+    self.public_ips = {}
+
+    for node in nodes:
+      public_ip = node['public_ip']
+      self.hosts.append(public_ip)
+      self.roles_by_host[public_ip] = list(node.get('jobs', []))
+      for role in self.roles_by_host[public_ip]:
+        self.hosts_by_role.setdefault(role, []).append(public_ip)
+
+      if 'private_ip' in node:
+        self.private_ips[public_ip] = node['private_ip']
+        self.public_ips[node['private_ip']] = public_ip
+
+
+  def get_all_hosts(self):
+    """Returns the public IP of every machine, in the order they were given.
+
+    Returns:
+      A list of strs, one per machine.
+    """
+    return list(self.hosts)
+
+
+  def get_hosts_with_role(self, role):
+    """Finds every machine that runs the given role.
+
+    Args:
+      role: A str naming the role to search for.
+    Returns:
+      A list of strs, the public IPs of the machines that run the role, in the
+      order they were given.
+    """
+    return list(self.hosts_by_role.get(role, []))
+
+
+  def get_hosts_with_roles(self, roles, match_all=True):
+    """Finds the machines that run all (or any) of the given roles.
+
+    Args:
+      roles: A list of strs naming the roles to search for.
+      match_all: A bool that indicates if machines must run every one of the
+        roles (True), or just one of them (False).
+    Returns:
+      A list of strs, the public IPs of the matching machines, in the order
+      they were given.
+    """
+    if not roles:
+      return []
+
+    role_sets = [set(self.hosts_by_role.get(role, [])) for role in roles]
+    if match_all:
+      matches = set.intersection(*role_sets)
+    else:
+      matches = set.union(*role_sets)
+    return [host for host in self.hosts if host in matches]
+
+
+  def get_roles_for_host(self, host):
+    """Finds every role that the given machine runs.
+
+    Args:
+      host: A str containing the public IP of the machine.
+    Returns:
+      A list of strs, the roles that the machine runs.
+    """
+    return list(self.roles_by_host.get(host, []))
+
+
+  def get_private_ip(self, public_ip):
+    """Finds the private IP of the machine with the given public IP.
+
+    Args:
+      public_ip: A str containing the machine's public IP.
+    Returns:
+      A str containing the machine's private IP, or None if we don't know it.
+    """
+    return self.private_ips.get(public_ip)
+
+
+  def get_public_ip(self, private_ip):
+    """Finds the public IP of the machine with the given private IP.
+
+    Args:
+      private_ip: A str containing the machine's private IP.
+    Returns:
+      A str containing the machine's public IP, or None if we don't know it.
+    """
+    return self.public_ips.get(private_ip)
+
+
+  def query(self, role_query):
+    """Finds the machines that match the given role query.
+
+    Args:
+      role_query: A str containing a role query (e.g., 'memcache+db_slave').
+    Returns:
+      A list of strs, the public IPs of the matching machines, in the order
+      they were given.
+    """
+    matches = set()
+    for roles in self.parse_query(role_query):
+      matches.update(self.get_hosts_with_roles(roles))
+    return [host for host in self.hosts if host in matches]
+
+
+  @classmethod
+  def parse_query(cls, role_query):
+    """Splits a role query into the sets of roles that it matches machines
+    with.
+
+    Args:
+      role_query: A str containing a role query (e.g., 'memcache+db_slave').
+    Returns:
+      A list of lists of strs. A machine matches the query if it runs every
+      role in any one of the inner lists.
+    """
+    alternatives = []
+    for alternative in role_query.split(cls.ANY_OF_SEPARATOR):
+      roles = [role.strip() for role in alternative.split(cls.ALL_OF_SEPARATOR)
+        if role.strip()]
+      if roles:
+        alternatives.append(roles)
+    return alternatives
+
+
+  @classmethod
+  def get_roles_in_query(cls, role_query):
+    """Lists every role that the given role query mentions, so that callers
+    can make sure that they are all valid roles.
+
+    Args:
+      role_query: A str containing a role query (e.g., 'memcache+db_slave').
+    Returns:
+      A list of strs, the roles that the query mentions.
+    """
+    return [role for roles in cls.parse_query(role_query) for role in roles]
+
+
+  @classmethod
+  def validate_query(cls, role_query):
+    """Makes sure that the given role query names at least one role, and
+    only names roles that machines can run.
+
+    Args:
+      role_query: A str containing a role query (e.g., 'memcache+db_slave').
+    Raises:
+      BadConfigurationException: If the role query names no roles, or names
+        a role that no machine runs.
+    """
+    roles = cls.get_roles_in_query(role_query)
+    if not roles:
+      raise BadConfigurationException("The role query {0} doesn't name any " \
+        "roles.".format(role_query))
+
+    for role in roles:
+      if role not in cls.JOB_ROLES:
+        raise BadConfigurationException("{0} is not a role that machines " \
+          "run. Valid roles are: {1}".format(role, ", ".join(cls.JOB_ROLES)))
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import httplib
+import socket
+import threading
+
+
+# Third-party imports
+import SOAPpy
+
+
+class PooledTransport(SOAPpy.HTTPTransport):
+  """PooledTransport sends SOAP requests over HTTP(S) connections that are
+  kept alive and shared between every SOAP client in this process, instead of
+  opening (and handshaking) a new connection for every request, as SOAPpy's
+  default transport does.
+
+  Connections are pooled per host, and are only ever used by one request at a
+  time, so that clients running in different threads can safely share them.
+  """
+
+
+  # The number of seconds that we wait to connect to a remote host before
+  # giving up on it.
+  CONNECT_TIMEOUT = 10
+
+
+  # The number of seconds that we wait for a remote host to respond to a
+  # request once we've connected to it.
+  READ_TIMEOUT = 300
+
+
+  # The maximum number of idle connections that we keep open to any one host.
+  MAX_IDLE_CONNECTIONS_PER_HOST = 4
+
+
+  # A dict that maps each (protocol, host) tuple to the list of idle
+  # connections that we have open to it.
+  idle_connections = {}
+
+
+  # A lock that protects idle_connections.
+  idle_connections_lock = threading.Lock()
+
+
+  def call(self, addr, data, namespace, soapaction=None, encoding=None,
+    http_proxy=None, config=SOAPpy.Config, timeout=None):
+    """Sends a SOAP request to a remote host, and returns its response.
+
+    This is called by SOAPpy.SOAPProxy, and takes the same arguments as
+    SOAPpy's own HTTPTransport.call, except that http_proxy is ignored.
+
+    Args:
+      addr: A str or SOAPpy.SOAPAddress indicating where to send the request.
+      data: A str containing the SOAP request.
+      namespace: The namespace that the request was made in.
+      soapaction: A str that, if provided, is sent as the SOAPAction header.
+      encoding: A str that, if provided, is sent as the request's charset.
+      http_proxy: Ignored.
+      config: The SOAPpy configuration to use when parsing addr.
+      timeout: The number of seconds to wait for a response, or None to use
+        READ_TIMEOUT.
+    Returns:
+      A tuple containing the SOAP response (a str) and its namespace.
+    Raises:
+      SOAPpy.HTTPError: If the remote host responds with an HTTP error.
+      socket.error: If we can't talk to the remote host.
+    """
+    if not isinstance(addr, SOAPpy.SOAPAddress):
+      addr = SOAPpy.SOAPAddress(addr, config)
+
+    content_type = 'text/xml'
+    if encoding is not None:
+      content_type += '; charset={0}'.format(encoding)
+
+    if soapaction:
+      soapaction = '"{0}"'.format(soapaction)
+    else:
+      soapaction = ''
+
+    headers = {
+      'Host' : addr.host,
+      'User-agent' : SOAPpy.SOAPUserAgent(),
+      'Content-type' : content_type,
+      'Content-length' : str(len(data)),
+      'SOAPAction' : soapaction,
+      'Connection' : 'keep-alive'
+    }
+
+    status, reason, response_type, response = self.post(addr.proto,
+      addr.host, addr.path, data, headers, timeout or self.READ_TIMEOUT)
+
+    if status == 500 and not (response_type.startswith('text/xml') and
+      response):
+      raise SOAPpy.HTTPError(status, reason)
+    if status not in (200, 500):
+      raise SOAPpy.HTTPError(status, reason)
+
+    if namespace is None:
+      return response, None
+    return response, self.getNS(namespace, response)
+
+
+  def post(self, protocol, host, path, data, headers, read_timeout):
+    """POSTs the given data to a remote host over a pooled connection.
+
+    If a connection that we've kept open has since been closed by the remote
+    host, we retry the request once over a new connection. We only do so if
+    sending the request failed, or if the remote host closed the connection
+    without saying anything, since otherwise it may have already acted on
+    the request (and requests like upload_app shouldn't be acted on twice).
+
+    Args:
+      protocol: A str that is either 'http' or 'https'.
+      host: A str containing the host (and optionally port) to connect to.
+      path: A str containing the path to POST to.
+      data: A str containing the body of the request.
+      headers: A dict containing the headers to send with the request.
+      read_timeout: The number of seconds to wait for a response.
+    Returns:
+      A tuple containing the response's status code (an int), reason (a
+      str), content type (a str), and body (a str).
+    """
+    while True:
+      connection, is_reused = self.get_connection(protocol, host)
+      try:
+        connection.sock.settimeout(read_timeout)
+        connection.request('POST', path, data, headers)
+      except socket.timeout:
+        connection.close()
+        raise
+      except (socket.error, httplib.HTTPException):
+        connection.close()
+        if is_reused:
+          continue
+        raise
+
+      try:
+        response = connection.getresponse()
+        body = response.read()
+      except (socket.error, httplib.HTTPException) as exception:
+        connection.close()
+        if is_reused and self.is_empty_response(exception):
+          continue
+        raise
+
+      if response.will_close:
+        connection.close()
+      else:
+        self.release_connection(protocol, host, connection)
+      return response.status, response.reason, \
+        response.getheader('content-type', 'text/xml'), body
+
+
+  @classmethod
+  def is_empty_response(cls, exception):
+    """Decides if the given exception means that the remote host closed the
+    connection without sending a response at all, which is how a host that
+    closed an idle keep-alive connection answers the next request sent on it.
+
+    Args:
+      exception: The exception raised while reading a response.
+    Returns:
+      True if no response was received, and False otherwise.
+    """
+    if not isinstance(exception, httplib.BadStatusLine):
+      return False
+    # Older versions of httplib report the empty status line as "''".
+    return exception.line in ("", "''") or \
+      exception.line.startswith("No status line received")
+
+
+  @classmethod
+  def get_connection(cls, protocol, host):
+    """Finds an idle connection to the given host, or opens a new one if
+    there aren't any.
+
+    Args:
+      protocol: A str that is either 'http' or 'https'.
+      host: A str containing the host (and optionally port) to connect to.
+    Returns:
+      A tuple containing the connection (an httplib.HTTPConnection) and a
+      bool that indicates whether or not it has been used before.
+    """
+    with cls.idle_connections_lock:
+      idle = cls.idle_connections.get((protocol, host))
+      if idle:
+        return idle.pop(), True
+
+    if protocol == 'https':
+      connection = httplib.HTTPSConnection(host,
+        timeout=cls.CONNECT_TIMEOUT)
+    else:
+      connection = httplib.HTTPConnection(host, timeout=cls.CONNECT_TIMEOUT)
+    connection.connect()
+    return connection, False
+
+
+  @classmethod
+  def release_connection(cls, protocol, host, connection):
+    """Returns a connection to the pool, so that the next request to the same
+    host can use it.
+
+    Args:
+      protocol: A str that is either 'http' or 'https'.
+      host: A str containing the host (and optionally port) connected to.
+      connection: The httplib.HTTPConnection to return to the pool.
+    """
+    with cls.idle_connections_lock:
+      idle = cls.idle_connections.setdefault((protocol, host), [])
+      if len(idle) < cls.MAX_IDLE_CONNECTIONS_PER_HOST:
+        idle.append(connection)
+        return
+    connection.close()
+
+
+  @classmethod
+  def close_all(cls):
+    """Closes every idle connection in the pool."""
+    with cls.idle_connections_lock:
+      for connections in cls.idle_connections.values():
+        for connection in connections:
+          connection.close()
+      cls.idle_connections.clear()
@@ -16,6 +16,7 @@ import SOAPpy
 from appscale_logger import AppScaleLogger
 from custom_exceptions import AppScaleException
 from local_state import LocalState
+from soap_transport import PooledTransport
 
 
 class UserAppClient():
@@ -63,6 +64,10 @@ class UserAppClient():
     """
     self.host = host
     self.server = SOAPpy.SOAPProxy('https://%s:%s' % (host, self.PORT))
+
+    # Reuse connections to this host (and every other host we talk to) across
+    # requests and clients, instead of opening a new one per request.
+    self.server.transport = PooledTransport()
     self.secret = secret
 
 
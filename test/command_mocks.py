@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import cStringIO
+import re
+import subprocess
+import threading
+
+
+# Third party libraries
+from flexmock import flexmock
+
+
+# The keyword arguments that LocalState.run passes to subprocess.Popen.
+RUN_ARGS = {
+  'stdin' : subprocess.PIPE,
+  'stdout' : subprocess.PIPE,
+  'stderr' : subprocess.PIPE,
+  'close_fds' : True
+}
+
+
+class ArgvMatching():
+  """ArgvMatching compares equal to any argument list that, once its
+  arguments are joined together with spaces, matches a regular expression.
+  This lets tests mock out commands that are executed without a shell the
+  same way that they mock out commands executed via a shell.
+  """
+
+
+  def __init__(self, pattern):
+    """Creates a new ArgvMatching.
+
+    Args:
+      pattern: A str or compiled regular expression that the joined-together
+        argument list should match.
+    """
+    self.regex = re.compile(pattern)
+
+
+  def __eq__(self, other):
+    return isinstance(other, list) and \
+      self.regex.search(" ".join(other)) is not None
+
+
+  def __ne__(self, other):
+    return not self.__eq__(other)
+
+
+  def __repr__(self):
+    return "ArgvMatching({0!r})".format(self.regex.pattern)
+
+
+def fake_process(returncode, output='', error=''):
+  """Constructs a mocked subprocess.Popen for a command that has already
+  exited.
+
+  Args:
+    returncode: The int that the command exited with.
+    output: A str that the command wrote to its standard output.
+    error: A str that the command wrote to its standard error.
+  Returns:
+    A flexmock that stands in for the command's subprocess.Popen.
+  """
+  process = flexmock(name='fake_process', returncode=returncode,
+    stdin=cStringIO.StringIO(), stdout=cStringIO.StringIO(output),
+    stderr=cStringIO.StringIO(error))
+  process.should_receive('wait').and_return(returncode)
+  process.should_receive('poll').and_return(returncode)
+  process.should_receive('kill').and_return()
+  return process
+
+
+def expect_command(pattern, *results, **popen_args):
+  """Mocks out subprocess.Popen for commands that LocalState.run executes,
+  whose arguments match the given pattern.
+
+  Args:
+    pattern: A str or compiled regular expression that the command's
+      arguments (joined together with spaces) should match.
+    results: The results of each successive attempt to execute the command,
+      each of which is an int that it exits with, or a tuple containing that
+      int and a str that it writes to its standard output. The last result
+      is used for every attempt after it. If none are given, the command
+      succeeds without writing anything.
+    popen_args: Keyword arguments that should be passed to subprocess.Popen
+      in place of the ones in RUN_ARGS.
+
+  Since callers may execute the command from several threads at once, the
+  results are handed out in the order that the attempts start in.
+  Returns:
+    The flexmock expectation, so that callers can also say how many times the
+    command should be executed.
+  """
+  results = list(results) or [0]
+  results_lock = threading.Lock()
+
+  def start_process(*args, **kwargs):
+    """Starts the next fake command in line."""
+    with results_lock:
+      if len(results) > 1:
+        result = results.pop(0)
+      else:
+        result = results[0]
+    if isinstance(result, tuple):
+      return fake_process(*result)
+    return fake_process(result)
+
+  expected_args = dict(RUN_ARGS)
+  expected_args.update(popen_args)
+  flexmock(subprocess)
+  return subprocess.should_receive('Popen').with_args(ArgvMatching(pattern),
+    **expected_args).replace_with(start_process)
@@ -4,6 +4,7 @@
 
 # General-purpose Python library imports
 import base64
+import cStringIO
 import json
 import os
 import shutil
@@ -444,6 +445,164 @@ class TestAppScale(unittest.TestCase):
     appscale.tail(1, "c*")
 
 
+  def mock_tail_from_nodes(self, appscale, ips):
+    """Mocks out the ssh calls that tail logs on the given machines, with each
+    machine sending back two lines of logs.
+
+    Returns:
+      A StringIO that the merged logs are written to.
+    """
+    flexmock(subprocess)
+    for ip in ips:
+      fake_ssh = flexmock(name='fake_ssh', stdout=cStringIO.StringIO(
+        "{0} one\n{0} two\n".format(ip)))
+      fake_ssh.should_receive('poll').and_return(0)
+      subprocess.should_receive('Popen').with_args(["ssh", "-o",
+        "StrictHostkeyChecking=no", "-i", appscale.get_key_location('boo'),
+        "root@" + ip, "tail -f /var/log/appscale/c*"],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT) \
+        .and_return(fake_ssh).once()
+
+    output = cStringIO.StringIO()
+    sys.stdout = output
+    return output
+
+
+  def testTailFromAllNodes(self):
+    # calling 'appscale tail all c*' should tail from every node, and print
+    # each node's lines in order, prefixed with the node they came from
+    appscale = AppScale()
+    self.addMockForAppScalefile(appscale, yaml.dump({ 'keyname' : 'boo' }))
+    nodes_contents = json.dumps([
+      { 'public_ip' : 'blarg', 'jobs' : ['shadow'] },
+      { 'public_ip' : 'blarg2', 'jobs' : ['appengine'] }
+    ])
+    (flexmock(sys.modules['__builtin__']).should_receive('open')
+      .with_args(appscale.get_locations_json_file('boo'))
+      .and_return(flexmock(read=lambda: nodes_contents)))
+
+    stdout = sys.stdout
+    try:
+      output = self.mock_tail_from_nodes(appscale, ['blarg', 'blarg2'])
+      appscale.tail('all', 'c*')
+    finally:
+      sys.stdout = stdout
+
+    lines = output.getvalue().split("\n")
+    self.assertEquals(['[blarg] blarg one', '[blarg] blarg two'],
+      [line for line in lines if line.startswith('[blarg]')])
+    self.assertEquals(['[blarg2] blarg2 one', '[blarg2] blarg2 two'],
+      [line for line in lines if line.startswith('[blarg2]')])
+
+
+  def testTailFromNodesWithRole(self):
+    # calling 'appscale tail appengine c*' should only tail from the nodes
+    # that run the appengine role
+    appscale = AppScale()
+    self.addMockForAppScalefile(appscale, yaml.dump({ 'keyname' : 'boo' }))
+    nodes_contents = json.dumps([
+      { 'public_ip' : 'blarg', 'jobs' : ['shadow'] },
+      { 'public_ip' : 'blarg2', 'jobs' : ['appengine'] }
+    ])
+    (flexmock(sys.modules['__builtin__']).should_receive('open')
+      .with_args(appscale.get_locations_json_file('boo'))
+      .and_return(flexmock(read=lambda: nodes_contents)))
+
+    stdout = sys.stdout
+    try:
+      output = self.mock_tail_from_nodes(appscale, ['blarg2'])
+      appscale.tail('appengine', 'c*')
+    finally:
+      sys.stdout = stdout
+
+    self.assertEquals("[blarg2] blarg2 one\n[blarg2] blarg2 two\n",
+      output.getvalue())
+
+
+  def testTailFromNodesWithRoleThatNoNodesRun(self):
+    # calling 'appscale tail zookeeper c*' when no nodes run the zookeeper
+    # role should throw up and die
+    appscale = AppScale()
+    self.addMockForAppScalefile(appscale, yaml.dump({ 'keyname' : 'boo' }))
+    nodes_contents = json.dumps([
+      { 'public_ip' : 'blarg', 'jobs' : ['shadow'] }
+    ])
+    (flexmock(sys.modules['__builtin__']).should_receive('open')
+      .with_args(appscale.get_locations_json_file('boo'))
+      .and_return(flexmock(read=lambda: nodes_contents)))
+
+    self.assertRaises(AppScaleException, appscale.tail, 'zookeeper', 'c*')
+
+
+  def testTailFromNodesMatchingRoleQuery(self):
+    # calling 'appscale tail memcache+db_slave c*' should only tail from the
+    # nodes that run both memcache and db_slave
+    appscale = AppScale()
+    self.addMockForAppScalefile(appscale, yaml.dump({ 'keyname' : 'boo' }))
+    nodes_contents = json.dumps([
+      { 'public_ip' : 'blarg', 'jobs' : ['shadow', 'memcache'] },
+      { 'public_ip' : 'blarg2', 'jobs' : ['db_slave', 'memcache'] },
+      { 'public_ip' : 'blarg3', 'jobs' : ['db_slave'] }
+    ])
+    (flexmock(sys.modules['__builtin__']).should_receive('open')
+      .with_args(appscale.get_locations_json_file('boo'))
+      .and_return(flexmock(read=lambda: nodes_contents)))
+
+    stdout = sys.stdout
+    try:
+      output = self.mock_tail_from_nodes(appscale, ['blarg2'])
+      appscale.tail('memcache+db_slave', 'c*')
+    finally:
+      sys.stdout = stdout
+
+    self.assertEquals("[blarg2] blarg2 one\n[blarg2] blarg2 two\n",
+      output.getvalue())
+
+
+  def testTailFromNodesMatchingBadRoleQuery(self):
+    # calling 'appscale tail memcache+boo c*' should throw up and die, since
+    # there is no boo role
+    appscale = AppScale()
+    self.addMockForAppScalefile(appscale, yaml.dump({ 'keyname' : 'boo' }))
+    self.assertRaises(TypeError, appscale.tail, 'memcache+boo', 'c*')
+
+
+  def testSshToNodeWithRole(self):
+    # calling 'appscale ssh appengine' should ssh to the first node that runs
+    # the appengine role
+    appscale = AppScale()
+    self.addMockForAppScalefile(appscale, yaml.dump({ 'keyname' : 'boo' }))
+    nodes_contents = json.dumps([
+      { 'public_ip' : 'blarg', 'jobs' : ['shadow'] },
+      { 'public_ip' : 'blarg2', 'jobs' : ['appengine'] },
+      { 'public_ip' : 'blarg3', 'jobs' : ['appengine'] }
+    ])
+    (flexmock(sys.modules['__builtin__']).should_receive('open')
+      .with_args(appscale.get_locations_json_file('boo'))
+      .and_return(flexmock(read=lambda: nodes_contents)))
+
+    flexmock(subprocess)
+    subprocess.should_receive('call').with_args(["ssh", "-o",
+      "StrictHostkeyChecking=no", "-i", appscale.get_key_location('boo'),
+      "root@blarg2"]).and_return().once()
+    appscale.ssh('appengine')
+
+
+  def testSshToNodeWithRoleThatNoNodesRun(self):
+    # calling 'appscale ssh zookeeper' when no nodes run the zookeeper role
+    # should throw up and die
+    appscale = AppScale()
+    self.addMockForAppScalefile(appscale, yaml.dump({ 'keyname' : 'boo' }))
+    nodes_contents = json.dumps([
+      { 'public_ip' : 'blarg', 'jobs' : ['shadow'] }
+    ])
+    (flexmock(sys.modules['__builtin__']).should_receive('open')
+      .with_args(appscale.get_locations_json_file('boo'))
+      .and_return(flexmock(read=lambda: nodes_contents)))
+
+    self.assertRaises(AppScaleException, appscale.ssh, 'zookeeper')
+
+
   def testGetLogsWithNoAppScalefile(self):
     # calling 'appscale logs' with no AppScalefile in the local
     # directory should throw up and die
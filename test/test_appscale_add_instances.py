@@ -24,6 +24,10 @@ import M2Crypto
 import SOAPpy
 
 
+# Test helpers
+from command_mocks import expect_command
+
+
 # AppScale import, the library that we're testing here
 lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
 sys.path.append(lib)
@@ -57,6 +61,7 @@ class TestAppScaleAddInstances(unittest.TestCase):
     # throw some default mocks together for when invoking via shell succeeds
     # and when it fails
     self.fake_temp_file = flexmock(name='fake_temp_file')
+    self.fake_temp_file.should_receive('seek').and_return()
     self.fake_temp_file.should_receive('read').and_return('boo out')
     self.fake_temp_file.should_receive('close').and_return()
 
@@ -123,11 +128,7 @@ appengine: 1.2.3.4
       .and_return(fake_locations_yaml_file)
 
     # say that the ssh key works
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile(
-      'ls'.format(self.keyname)),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    expect_command('ls')
 
     # mock out reading the locations.json file, and slip in our own json
     flexmock(os.path)
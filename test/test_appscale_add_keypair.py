@@ -8,7 +8,6 @@ import httplib
 import json
 import os
 import re
-import shutil
 import socket
 import subprocess
 import sys
@@ -25,12 +24,17 @@ import M2Crypto
 import SOAPpy
 
 
+# Test helpers
+from command_mocks import expect_command
+
+
 # AppScale import, the library that we're testing here
 lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
 sys.path.append(lib)
 from appscale_logger import AppScaleLogger
 from appscale_tools import AppScaleTools
 from custom_exceptions import BadConfigurationException
+from key_pool import KeyPool
 from local_state import APPSCALE_VERSION
 from local_state import LocalState
 from node_layout import NodeLayout
@@ -53,9 +57,14 @@ class TestAppScaleAddKeypair(unittest.TestCase):
     flexmock(time)
     time.should_receive('sleep').and_return()
 
+    # don't generate any keys in the background
+    flexmock(KeyPool)
+    KeyPool.should_receive('start').and_return()
+
     # throw some default mocks together for when invoking via shell succeeds
     # and when it fails
     self.fake_temp_file = flexmock(name='fake_temp_file')
+    self.fake_temp_file.should_receive('seek').and_return()
     self.fake_temp_file.should_receive('read').and_return('boo out')
     self.fake_temp_file.should_receive('close').and_return()
 
@@ -70,12 +79,7 @@ class TestAppScaleAddKeypair(unittest.TestCase):
 
 
   def test_appscale_with_ips_layout_flag_but_no_copy_id(self):
-    # assume that we have ssh-keygen but not ssh-copy-id
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('hash ssh-keygen'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
+    # assume that we don't have ssh-copy-id
     flexmock(subprocess)
     subprocess.should_receive('Popen').with_args(re.compile('hash ssh-copy-id'),
       shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
@@ -100,14 +104,9 @@ appengine:  public3
 
 
   def test_appscale_with_ips_layout_flag_and_success(self):
-    # assume that we have ssh-keygen and ssh-copy-id
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('which ssh-keygen'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
+    # assume that we have ssh-copy-id
     flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('which ssh-copy-id'),
+    subprocess.should_receive('Popen').with_args(re.compile('hash ssh-copy-id'),
       shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
       .and_return(self.success)
 
@@ -124,33 +123,38 @@ appengine:  public3
 
     os.path.should_receive('exists').with_args(public_key).and_return(False)
     os.path.should_receive('exists').with_args(private_key).and_return(False)
-
-    # next, assume that ssh-keygen ran fine
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('ssh-keygen'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    # assume that we can rename the private key
-    flexmock(shutil)
-    shutil.should_receive('copy').with_args(path, private_key).and_return()
-
-    # finally, assume that we can chmod 0600 those files fine
+    os.path.should_receive('exists').with_args(path).and_return(False)
+
+    # next, assume that we can get a key from the pool and write it out fine
+    fake_key = flexmock(name='fake_key')
+    fake_key.should_receive('pub').and_return(('\x00\x00\x00\x01\x03',
+      '\x00\x00\x00\x01\x05'))
+    KeyPool.should_receive('get_key').and_return(fake_key)
+    KeyPool.should_receive('write_key').with_args(fake_key, path) \
+      .and_return().once()
+    KeyPool.should_receive('write_key').with_args(fake_key, private_key) \
+      .and_return().once()
+
+    fake_public_key = flexmock(name='fake_public_key')
+    fake_public_key.should_receive('__enter__').and_return(fake_public_key)
+    fake_public_key.should_receive('__exit__').and_return()
+    fake_public_key.should_receive('write').with_args(
+      'ssh-rsa AAAAB3NzaC1yc2EAAAABAwAAAAEF {0}\n'.format(self.keyname)) \
+      .and_return().once()
+    builtins = flexmock(sys.modules['__builtin__'])
+    builtins.should_call('open')
+    builtins.should_receive('open').with_args(public_key, 'w') \
+      .and_return(fake_public_key)
+
+    # finally, assume that we can chmod 0600 the public key fine
     flexmock(os)
     os.should_receive('chmod').with_args(public_key, 0600).and_return()
-    os.should_receive('chmod').with_args(path, 0600).and_return()
 
     # and assume that we can ssh-copy-id to each of the three IPs below
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('ssh-copy-id'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    expect_command('^ssh-copy-id').times(3)
 
     # also, we should be able to copy over our new public and private keys fine
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('id_rsa[.pub]?'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    expect_command('id_rsa[.pub]?').times(6)
 
     # don't use a 192.168.X.Y IP here, since sometimes we set our virtual
     # machines to boot with those addresses (and that can mess up our tests).
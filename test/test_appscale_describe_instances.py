@@ -30,12 +30,14 @@ sys.path.append(lib)
 from appcontroller_client import AppControllerClient
 from appscale_logger import AppScaleLogger
 from appscale_tools import AppScaleTools
+from custom_exceptions import AppScaleException
 from custom_exceptions import BadConfigurationException
 from local_state import APPSCALE_VERSION
 from local_state import LocalState
 from node_layout import NodeLayout
 from parse_args import ParseArgs
 from remote_helper import RemoteHelper
+from role_index import RoleIndex
 from user_app_client import UserAppClient
 
 
@@ -57,6 +59,7 @@ class TestAppScaleDescribeInstances(unittest.TestCase):
     # throw some default mocks together for when invoking via shell succeeds
     # and when it fails
     self.fake_temp_file = flexmock(name='fake_temp_file')
+    self.fake_temp_file.should_receive('seek').and_return()
     self.fake_temp_file.should_receive('read').and_return('boo out')
     self.fake_temp_file.should_receive('close').and_return()
 
@@ -87,10 +90,14 @@ class TestAppScaleDescribeInstances(unittest.TestCase):
     fake_appcontroller = flexmock(name='fake_appcontroller')
     fake_appcontroller.should_receive('get_all_public_ips').with_args('the secret') \
       .and_return(json.dumps(['public1', 'public2']))
+    fake_appcontroller.should_receive('get_role_info').with_args('the secret') \
+      .and_return(json.dumps([]))
     fake_appcontroller.should_receive('status').with_args('the secret') \
       .and_return('nothing interesting here') \
       .and_return('Database is at not-up-yet') \
       .and_return('Database is at 1.2.3.4')
+    fake_appcontroller.should_receive('is_done_initializing') \
+      .with_args('the secret').and_return(True)
     flexmock(SOAPpy)
     SOAPpy.should_receive('SOAPProxy').with_args('https://public1:17443') \
       .and_return(fake_appcontroller)
@@ -126,3 +133,221 @@ class TestAppScaleDescribeInstances(unittest.TestCase):
     ]
     options = ParseArgs(argv, self.function).args
     AppScaleTools.describe_instances(options)
+
+
+  def test_describe_instances_with_unreachable_node(self):
+    # mock out reading the secret key
+    builtins = flexmock(sys.modules['__builtin__'])
+    builtins.should_call('open')  # set the fall-through
+
+    secret_key_location = LocalState.get_secret_key_location(self.keyname)
+    fake_secret = flexmock(name="fake_secret")
+    fake_secret.should_receive('read').and_return('the secret')
+    builtins.should_receive('open').with_args(secret_key_location, 'r') \
+      .and_return(fake_secret)
+
+    # mock out reading the locations.json file, and slip in our own json
+    flexmock(os.path)
+    os.path.should_call('exists')  # set the fall-through
+    os.path.should_receive('exists').with_args(
+      LocalState.get_locations_json_location(self.keyname)).and_return(True)
+
+    fake_nodes_json = flexmock(name="fake_nodes_json")
+    fake_nodes_json.should_receive('read').and_return(json.dumps([{
+      "public_ip" : "public1",
+      "private_ip" : "private1",
+      "jobs" : ["shadow", "login"]
+    }]))
+    builtins.should_receive('open').with_args(
+      LocalState.get_locations_json_location(self.keyname), 'r') \
+      .and_return(fake_nodes_json)
+
+    # let's say that the first node responds, but the second one doesn't
+    fake_public1 = flexmock(name='fake_public1')
+    fake_public1.should_receive('get_all_public_ips').with_args('the secret') \
+      .and_return(json.dumps(['public1', 'public2']))
+    fake_public1.should_receive('get_role_info').with_args('the secret') \
+      .and_return(json.dumps([]))
+    fake_public1.should_receive('status').with_args('the secret') \
+      .and_return('Database is at 1.2.3.4')
+    fake_public1.should_receive('is_done_initializing') \
+      .with_args('the secret').and_return(True)
+
+    fake_public2 = flexmock(name='fake_public2')
+    fake_public2.should_receive('status').with_args('the secret') \
+      .and_raise(socket.error)
+
+    flexmock(SOAPpy)
+    SOAPpy.should_receive('SOAPProxy').with_args('https://public1:17443') \
+      .and_return(fake_public1)
+    SOAPpy.should_receive('SOAPProxy').with_args('https://public2:17443') \
+      .and_return(fake_public2)
+
+    # and make sure that we report on both of them
+    AppScaleLogger.should_receive('log').with_args(
+      'Database is at 1.2.3.4').once()
+    AppScaleLogger.should_receive('warn').with_args(
+      re.compile('Unable to contact machine')).once()
+
+    argv = [
+      "--keyname", self.keyname
+    ]
+    options = ParseArgs(argv, self.function).args
+    nodes = AppScaleTools.describe_instances(options)
+    self.assertEquals(['public1', 'public2'], [node['ip'] for node in nodes])
+    self.assertEquals(None, nodes[0]['error'])
+    self.assertNotEquals(None, nodes[1]['error'])
+    self.assertEquals(False, nodes[1]['initialized'])
+
+
+  def test_describe_instances_as_json(self):
+    # mock out reading the secret key
+    builtins = flexmock(sys.modules['__builtin__'])
+    builtins.should_call('open')  # set the fall-through
+
+    secret_key_location = LocalState.get_secret_key_location(self.keyname)
+    fake_secret = flexmock(name="fake_secret")
+    fake_secret.should_receive('read').and_return('the secret')
+    builtins.should_receive('open').with_args(secret_key_location, 'r') \
+      .and_return(fake_secret)
+
+    # mock out reading the locations.json file, and slip in our own json
+    flexmock(os.path)
+    os.path.should_call('exists')  # set the fall-through
+    os.path.should_receive('exists').with_args(
+      LocalState.get_locations_json_location(self.keyname)).and_return(True)
+
+    role_info = [{
+      "public_ip" : "public1",
+      "private_ip" : "private1",
+      "jobs" : ["shadow", "login"]
+    }]
+    fake_nodes_json = flexmock(name="fake_nodes_json")
+    fake_nodes_json.should_receive('read').and_return(json.dumps(role_info))
+    builtins.should_receive('open').with_args(
+      LocalState.get_locations_json_location(self.keyname), 'r') \
+      .and_return(fake_nodes_json)
+
+    # mock out the head node's AppController, which reports on itself
+    fake_appcontroller = flexmock(name='fake_appcontroller')
+    fake_appcontroller.should_receive('get_all_public_ips') \
+      .with_args('the secret').and_return(json.dumps(['public1']))
+    fake_appcontroller.should_receive('get_role_info').with_args('the secret') \
+      .and_return(json.dumps(role_info))
+    fake_appcontroller.should_receive('status').with_args('the secret') \
+      .and_return("Currently using 12.5 Percent CPU and 40.0 Percent " \
+        "Memory\nCurrent State: Done starting up AppScale\n")
+    fake_appcontroller.should_receive('is_done_initializing') \
+      .with_args('the secret').and_return(True)
+    flexmock(SOAPpy)
+    SOAPpy.should_receive('SOAPProxy').with_args('https://public1:17443') \
+      .and_return(fake_appcontroller)
+
+    # make sure we print out valid JSON, and nothing else
+    output = []
+    AppScaleLogger.should_receive('log').replace_with(output.append)
+    AppScaleLogger.should_receive('success').never()
+
+    argv = [
+      "--keyname", self.keyname,
+      "--format", "json"
+    ]
+    options = ParseArgs(argv, self.function).args
+    AppScaleTools.describe_instances(options)
+
+    self.assertEquals(1, len(output))
+    nodes = json.loads(output[0])
+    self.assertEquals(1, len(nodes))
+    self.assertEquals('public1', nodes[0]['ip'])
+    self.assertEquals(['shadow', 'login'], nodes[0]['roles'])
+    self.assertEquals('Done starting up AppScale', nodes[0]['state'])
+    self.assertEquals(12.5, nodes[0]['cpu'])
+    self.assertEquals(40.0, nodes[0]['memory'])
+    self.assertEquals(True, nodes[0]['initialized'])
+    self.assertEquals(None, nodes[0]['error'])
+
+
+  def test_describe_node_times_the_whole_query(self):
+    # let's say that the AppController takes a quarter of a second to report
+    # its status, and another quarter to say if it's initialized
+    clock = [100.0]
+
+    def answer_after_a_while(answer):
+      clock[0] += 0.25
+      return answer
+
+    time.should_receive('time').replace_with(lambda: clock[0])
+    fake_appcontroller = flexmock(name='fake_appcontroller')
+    fake_appcontroller.should_receive('status').with_args('the secret') \
+      .replace_with(lambda secret: answer_after_a_while(
+        "Current State: Done starting up AppScale\n")).once()
+    fake_appcontroller.should_receive('is_done_initializing') \
+      .with_args('the secret') \
+      .replace_with(lambda secret: answer_after_a_while(True)).once()
+    flexmock(SOAPpy)
+    SOAPpy.should_receive('SOAPProxy').with_args('https://public1:17443') \
+      .and_return(fake_appcontroller).once()
+
+    node = AppScaleTools.describe_node('public1', 'the secret')
+    self.assertEquals('Done starting up AppScale', node['state'])
+    self.assertEquals(True, node['initialized'])
+    self.assertEquals(0.5, node['latency'])
+
+
+  def test_format_node_table(self):
+    nodes = [
+      {
+        'ip' : 'public1',
+        'roles' : ['shadow', 'login'],
+        'state' : 'Done starting up AppScale',
+        'cpu' : 12.5,
+        'memory' : 40.0,
+        'initialized' : True,
+        'latency' : 0.042,
+        'error' : None
+      },
+      {
+        'ip' : 'public2',
+        'roles' : [],
+        'state' : None,
+        'cpu' : None,
+        'memory' : None,
+        'initialized' : False,
+        'latency' : None,
+        'error' : 'boo'
+      }
+    ]
+
+    expected = "\n".join([
+      "IP       ROLES         STATE                      CPU    MEMORY  " \
+        "INITIALIZED  LATENCY",
+      "public1  shadow,login  Done starting up AppScale  12.5%  40.0%   " \
+        "yes          42 ms",
+      "public2  -             unreachable (boo)          -      -       " \
+        "no           -"
+    ])
+    self.assertEquals(expected, AppScaleTools.format_node_table(nodes))
+
+
+  def test_get_hosts_matching_roles(self):
+    role_index = RoleIndex([
+      {'public_ip' : 'public1', 'jobs' : ['shadow', 'memcache']},
+      {'public_ip' : 'public2', 'jobs' : ['appengine', 'memcache']},
+      {'public_ip' : 'public3', 'jobs' : ['appengine']}
+    ])
+    flexmock(LocalState)
+    LocalState.should_receive('get_role_index').with_args(self.keyname) \
+      .and_return(role_index)
+
+    # only machines that the AppController knows about should be returned,
+    # in the order that it lists them
+    self.assertEquals(['public2', 'public1'],
+      AppScaleTools.get_hosts_matching_roles(['public2', 'public1', 'public4'],
+      self.keyname, 'memcache'))
+    self.assertEquals(['public2'], AppScaleTools.get_hosts_matching_roles(
+      ['public1', 'public2', 'public3'], self.keyname, 'appengine+memcache'))
+
+    # and if nothing matches, we should fail
+    self.assertRaises(AppScaleException,
+      AppScaleTools.get_hosts_matching_roles, ['public1'], self.keyname,
+      'appengine')
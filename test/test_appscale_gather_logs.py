@@ -8,9 +8,11 @@ import httplib
 import json
 import os
 import re
+import shutil
 import socket
 import subprocess
 import sys
+import tarfile
 import tempfile
 import time
 import unittest
@@ -24,6 +26,10 @@ import M2Crypto
 import SOAPpy
 
 
+# Test helpers
+from command_mocks import expect_command
+
+
 # AppScale import, the library that we're testing here
 lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
 sys.path.append(lib)
@@ -57,6 +63,7 @@ class TestAppScaleGatherLogs(unittest.TestCase):
     # throw some default mocks together for when invoking via shell succeeds
     # and when it fails
     self.fake_temp_file = flexmock(name='fake_temp_file')
+    self.fake_temp_file.should_receive('seek').and_return()
     self.fake_temp_file.should_receive('read').and_return('boo out')
     self.fake_temp_file.should_receive('close').and_return()
 
@@ -70,7 +77,9 @@ class TestAppScaleGatherLogs(unittest.TestCase):
     self.failed.should_receive('wait').and_return(1)
 
 
-  def test_appscale_in_two_node_virt_deployment(self):
+  def mock_two_node_virt_deployment(self):
+    """Mocks out everything we need to find the machines in a two node
+    deployment, and to make a directory for each one's logs."""
     # pretend that the place we're going to put logs into doesn't exist
     flexmock(os.path)
     os.path.should_call('exists')  # set the fall-through
@@ -116,11 +125,35 @@ class TestAppScaleGatherLogs(unittest.TestCase):
     os.should_receive('mkdir').with_args('/tmp/foobaz/public1').and_return()
     os.should_receive('mkdir').with_args('/tmp/foobaz/public2').and_return()
 
-    # finally, fake the copying of the log files
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('/var/log/appscale'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    # fake the compressing and copying of the log files, and say that each
+    # machine sent us a megabyte of logs
+    fake_tarball = flexmock(name='fake_tarball')
+    fake_tarball.should_receive('close').and_return()
+    builtins.should_receive('open').with_args(re.compile(
+      '/tmp/foobaz/public[12]/appscale-logs.tar.gz'), 'wb') \
+      .and_return(fake_tarball).twice()
+    expect_command("root@public[12] tar -czf - -C /var/log appscale; " \
+      "test \$\? -le 1$", stdout=fake_tarball).twice()
+
+    os.path.should_receive('getsize').with_args(re.compile(
+      '/tmp/foobaz/public[12]/appscale-logs.tar.gz')).and_return(1024 * 1024)
+
+
+  def test_appscale_in_two_node_virt_deployment(self):
+    self.mock_two_node_virt_deployment()
+
+    # the logs should be unpacked where 'scp -r' would have put them, and the
+    # tarballs thrown away
+    fake_tar = flexmock(name='fake_tar')
+    fake_tar.should_receive('extractall').with_args(re.compile(
+      '/tmp/foobaz/public[12]')).and_return().twice()
+    fake_tar.should_receive('close').and_return()
+    flexmock(tarfile)
+    tarfile.should_receive('open').with_args(re.compile(
+      '/tmp/foobaz/public[12]/appscale-logs.tar.gz'), 'r:gz') \
+      .and_return(fake_tar)
+    os.should_receive('remove').with_args(re.compile(
+      '/tmp/foobaz/public[12]/appscale-logs.tar.gz')).and_return().twice()
 
     argv = [
       "--keyname", self.keyname,
@@ -128,3 +161,87 @@ class TestAppScaleGatherLogs(unittest.TestCase):
     ]
     options = ParseArgs(argv, self.function).args
     AppScaleTools.gather_logs(options)
+
+
+  def test_appscale_in_two_node_virt_deployment_compressed(self):
+    self.mock_two_node_virt_deployment()
+
+    # since the user wants the logs compressed, we shouldn't unpack them
+    flexmock(tarfile)
+    tarfile.should_receive('open').never()
+
+    argv = [
+      "--keyname", self.keyname,
+      "--location", "/tmp/foobaz",
+      "--concurrency", "1",
+      "--compressed"
+    ]
+    options = ParseArgs(argv, self.function).args
+    AppScaleTools.gather_logs(options)
+
+
+  def test_appscale_incrementally_into_existing_location(self):
+    # let's say that we copied logs from public1 into this location before
+    location = tempfile.mkdtemp()
+    local_dir = os.path.join(location, 'public1')
+    os.makedirs(os.path.join(local_dir, 'appscale'))
+    for name in ['controller.log', 'rotated.log', 'unchanged.log']:
+      with open(os.path.join(local_dir, 'appscale', name), 'w') as file_handle:
+        file_handle.write('12345')
+    state_location = os.path.join(local_dir,
+      AppScaleTools.LOG_SYNC_STATE_NAME)
+    with open(state_location, 'w') as file_handle:
+      file_handle.write(json.dumps({
+        'controller.log' : {'size' : 5, 'head' : 'controller head'},
+        'rotated.log' : {'size' : 5, 'head' : 'old rotated head'},
+        'unchanged.log' : {'size' : 0, 'head' : 'unchanged head'}
+      }))
+
+    # mock out finding the login ip address, the secret, and all machines
+    flexmock(LocalState)
+    LocalState.should_receive('get_login_host').with_args(self.keyname) \
+      .and_return('public1')
+    LocalState.should_receive('get_secret_key').with_args(self.keyname) \
+      .and_return('the secret')
+
+    fake_appcontroller = flexmock(name='fake_appcontroller')
+    fake_appcontroller.should_receive('get_all_public_ips').with_args(
+      'the secret').and_return(json.dumps(['public1']))
+    flexmock(SOAPpy)
+    SOAPpy.should_receive('SOAPProxy').with_args('https://public1:17443') \
+      .and_return(fake_appcontroller)
+
+    # since then, controller.log has grown, rotated.log has been replaced by a
+    # new log, unchanged.log hasn't changed, and new.log showed up
+    flexmock(RemoteHelper)
+    RemoteHelper.should_receive('list_remote_files').with_args('public1',
+      self.keyname, '/var/log/appscale', False).and_return({
+      'controller.log' : (8, 'controller head'),
+      'rotated.log' : (7, 'new rotated head'),
+      'unchanged.log' : (0, 'unchanged head'),
+      'new.log' : (4, 'new head')
+    })
+
+    # so we should only copy what's new
+    RemoteHelper.should_receive('copy_remote_file_ranges').with_args(
+      'public1', self.keyname, '/var/log/appscale', [('controller.log', 5, 3),
+      ('new.log', 0, 4), ('rotated.log', 0, 7)],
+      os.path.join(local_dir, 'appscale'), False).and_return(14).once()
+
+    argv = [
+      "--keyname", self.keyname,
+      "--location", location,
+      "--incremental"
+    ]
+    options = ParseArgs(argv, self.function).args
+    try:
+      AppScaleTools.gather_logs(options)
+      with open(state_location, 'r') as file_handle:
+        state = json.loads(file_handle.read())
+    finally:
+      shutil.rmtree(location)
+
+    self.assertEquals({'size' : 8, 'head' : 'controller head'},
+      state['controller.log'])
+    self.assertEquals(['controller.log', 'new.log', 'rotated.log',
+      'unchanged.log'], sorted(state.keys()))
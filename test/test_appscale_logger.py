@@ -64,13 +64,15 @@ class TestAppScaleLogger(unittest.TestCase):
       "instance_type" : "m1.large",
       "ips" : None,
       "ips_layout" : None,
+      "keep_spare_keys" : False,
       "keyname" : "appscale",
       "replication" : None,
       "scp" : None,
       "table" : "cassandra",
       "test" : False,
       "verbose" : False,
-      "version" : False
+      "version" : False,
+      "zones" : None
     }
 
     # finally, construct a http payload for mocking that the below
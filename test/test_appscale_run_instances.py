@@ -4,6 +4,7 @@
 
 # General-purpose Python library imports
 import base64
+import errno
 import httplib
 import json
 import os
@@ -24,17 +25,25 @@ import M2Crypto
 import SOAPpy
 
 
+# Test helpers
+from command_mocks import expect_command
+
+
 # AppScale import, the library that we're testing here
 lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
 sys.path.append(lib)
 from appcontroller_client import AppControllerClient
 from appscale_logger import AppScaleLogger
 from appscale_tools import AppScaleTools
+from custom_exceptions import AppScaleException
 from custom_exceptions import BadConfigurationException
+from key_pool import KeyPool
 from local_state import APPSCALE_VERSION
 from local_state import LocalState
 from node_layout import NodeLayout
 from parse_args import ParseArgs
+from phase_timer import PhaseTimer
+from port_waiter import PortWaiter
 from remote_helper import RemoteHelper
 from user_app_client import UserAppClient
 
@@ -55,9 +64,23 @@ class TestAppScaleRunInstances(unittest.TestCase):
     flexmock(time)
     time.should_receive('sleep').and_return()
 
+    # generate keys when they're needed, instead of in the background
+    flexmock(KeyPool)
+    KeyPool.should_receive('start').and_return()
+
+    # and don't wait in between attempts to connect to ports that aren't
+    # open yet
+    flexmock(PortWaiter)
+    PortWaiter.should_receive('get_retry_delay').and_return(0)
+
+    # and don't write our timing report to disk
+    flexmock(PhaseTimer)
+    PhaseTimer.should_receive('write_report').and_return()
+
     # throw some default mocks together for when invoking via shell succeeds
     # and when it fails
     self.fake_temp_file = flexmock(name='fake_temp_file')
+    self.fake_temp_file.should_receive('seek').and_return()
     self.fake_temp_file.should_receive('read').and_return('boo out')
     self.fake_temp_file.should_receive('close').and_return()
 
@@ -106,24 +129,15 @@ class TestAppScaleRunInstances(unittest.TestCase):
       .and_return(fake_secret)
 
     # mock out seeing if the image is appscale-compatible, and assume it is
-    # mock out our attempts to find /etc/appscale and presume it does exist
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('/etc/appscale'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    # mock out our attempts to find /etc/appscale/version and presume it does
-    # exist
-    subprocess.should_receive('Popen').with_args(re.compile(
-      '/etc/appscale/{0}'.format(APPSCALE_VERSION)),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    # put in a mock indicating that the database the user wants is supported
-    subprocess.should_receive('Popen').with_args(re.compile(
-      '/etc/appscale/{0}/{1}'.format(APPSCALE_VERSION, 'cassandra')),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    version_dir = '/etc/appscale/{0}'.format(APPSCALE_VERSION)
+    expect_command('/etc/appscale', (0, "\n".join([
+      'present /etc/appscale',
+      'present ' + version_dir,
+      'present ' + version_dir + '/cassandra',
+      'kernel 3.2.0-23-virtual',
+      'disk /dev/xvda1 10321208 4317504 5479416 45% /',
+      RemoteHelper.PROBE_DONE_MARKER
+    ])))
 
     # mock out generating the private key
     flexmock(M2Crypto.RSA)
@@ -151,36 +165,31 @@ class TestAppScaleRunInstances(unittest.TestCase):
     M2Crypto.X509.should_receive('X509').and_return(fake_cert)
 
     # assume that we started god fine
-    subprocess.should_receive('Popen').with_args(re.compile('god &'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    expect_command('god &')
 
     # and that we copied over the AppController's god file
-    subprocess.should_receive('Popen').with_args(re.compile(
-      'appcontroller.god'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    expect_command('appcontroller.god')
 
     # also, that we started the AppController itself
-    subprocess.should_receive('Popen').with_args(re.compile('god load'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    expect_command('god load')
 
     # assume that the AppController comes up on the third attempt
     fake_socket = flexmock(name='fake_socket')
-    fake_socket.should_receive('connect').with_args(('1.2.3.4',
-      AppControllerClient.PORT)).and_raise(Exception).and_raise(Exception) \
-      .and_return(None)
+    fake_socket.should_receive('setblocking').and_return()
+    fake_socket.should_receive('close').and_return()
+    fake_socket.should_receive('connect_ex').with_args(('1.2.3.4',
+      AppControllerClient.PORT)).and_return(errno.ECONNREFUSED) \
+      .and_return(errno.ECONNREFUSED).and_return(0)
 
     # same for the UserAppServer
-    fake_socket.should_receive('connect').with_args(('1.2.3.4',
-      UserAppClient.PORT)).and_raise(Exception).and_raise(Exception) \
-      .and_return(None)
+    fake_socket.should_receive('connect_ex').with_args(('1.2.3.4',
+      UserAppClient.PORT)).and_return(errno.ECONNREFUSED) \
+      .and_return(errno.ECONNREFUSED).and_return(0)
 
     # as well as for the AppLoadBalancer
-    fake_socket.should_receive('connect').with_args(('1.2.3.4',
-      RemoteHelper.APP_LOAD_BALANCER_PORT)).and_raise(Exception) \
-      .and_raise(Exception).and_return(None)
+    fake_socket.should_receive('connect_ex').with_args(('1.2.3.4',
+      RemoteHelper.APP_LOAD_BALANCER_PORT)).and_return(errno.ECONNREFUSED) \
+      .and_return(errno.ECONNREFUSED).and_return(0)
 
     flexmock(socket)
     socket.should_receive('socket').and_return(fake_socket)
@@ -228,17 +237,23 @@ class TestAppScaleRunInstances(unittest.TestCase):
       LocalState.get_locations_json_location(self.keyname), 'w') \
       .and_return(fake_nodes_json)
 
-    # copying over the locations yaml and json files should be fine
-    subprocess.should_receive('Popen').with_args(re.compile(
-      'locations-{0}.[yaml|json]'.format(self.keyname)),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    # mock out reading the yaml file and the credentials that we copy over
+    fake_credential = flexmock(name='fake_credential')
+    fake_credential.should_receive('read').and_return('credential contents')
+    fake_credential.should_receive('write').and_return()
+    for location in [LocalState.get_locations_yaml_location(self.keyname),
+      LocalState.get_key_path_from_name(self.keyname),
+      LocalState.get_certificate_location(self.keyname),
+      LocalState.get_private_key_location(self.keyname)]:
+      builtins.should_receive('open').with_args(location, 'r') \
+        .and_return(fake_credential)
+    builtins.should_receive('open').with_args(
+      LocalState.get_locations_yaml_location(self.keyname), 'w') \
+      .and_return(fake_credential)
 
-    # same for the secret key
-    subprocess.should_receive('Popen').with_args(re.compile(
-      '{0}.secret'.format(self.keyname)),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    # copying over the credentials, the locations yaml and json files, and the
+    # secret key (all bundled into tarballs) should be fine
+    expect_command('tar -xf')
 
     # mock out calls to the UserAppServer and presume that calls to create new
     # users succeed
@@ -276,3 +291,34 @@ appengine:  1.2.3.4
 
   def test_appscale_in_one_node_ec2_deployment(self):
     pass
+
+
+  def test_timing_report_is_written_when_startup_fails(self):
+    flexmock(LocalState)
+    LocalState.should_receive('make_appscale_directory').and_return()
+    LocalState.should_receive('ensure_appscale_isnt_running').and_return()
+    AppScaleLogger.should_receive('remote_log_tools_state').and_return()
+
+    # the head node never comes up, which is when we most want to know how
+    # long each phase took
+    flexmock(RemoteHelper)
+    RemoteHelper.should_receive('start_head_node').and_raise(
+      AppScaleException("the head node didn't start"))
+    PhaseTimer.should_receive('write_report').with_args(
+      LocalState.get_timing_report_location(self.keyname)).and_return().once()
+    PhaseTimer.should_receive('log_summary').and_return().once()
+
+    ips_layout = yaml.safe_load("""
+master : 1.2.3.4
+database: 1.2.3.4
+zookeeper: 1.2.3.4
+appengine:  1.2.3.4
+    """)
+
+    argv = [
+      "--ips_layout", base64.b64encode(yaml.dump(ips_layout)),
+      "--keyname", self.keyname,
+      "--test"
+    ]
+    options = ParseArgs(argv, self.function).args
+    self.assertRaises(AppScaleException, AppScaleTools.run_instances, options)
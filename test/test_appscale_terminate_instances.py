@@ -21,6 +21,10 @@ from flexmock import flexmock
 import SOAPpy
 
 
+# Test helpers
+from command_mocks import expect_command
+
+
 # AppScale import, the library that we're testing here
 lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
 sys.path.append(lib)
@@ -53,6 +57,7 @@ class TestAppScaleTerminateInstances(unittest.TestCase):
     # throw some default mocks together for when invoking via shell succeeds
     # and when it fails
     self.fake_temp_file = flexmock(name='fake_temp_file')
+    self.fake_temp_file.should_receive('seek').and_return()
     self.fake_temp_file.should_receive('read').and_return('boo out')
     self.fake_temp_file.should_receive('close').and_return()
 
@@ -65,6 +70,10 @@ class TestAppScaleTerminateInstances(unittest.TestCase):
     self.failed = flexmock(name='failed', returncode=1)
     self.failed.should_receive('wait').and_return(1)
 
+    # ssh exits with 255 when it can't reach the remote machine
+    self.unreachable = flexmock(name='unreachable', returncode=255)
+    self.unreachable.should_receive('wait').and_return(255)
+
 
   def test_terminate_when_not_running(self):
     # let's say that there's no locations.yaml file, which means appscale isn't
@@ -141,18 +150,12 @@ class TestAppScaleTerminateInstances(unittest.TestCase):
       .and_return(fake_appcontroller)
 
     # and mock out the ssh call to kill the remote appcontroller, assuming that
-    # it fails the first time and passes the second
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('controller stop'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.failed).and_return(self.success)
+    # the first attempt can't reach the machine but the second passes
+    expect_command('controller stop', 255, 0)
 
     # next, mock out our checks to see how the stopping process is going and
     # assume that it has stopped
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('ps x'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    expect_command('ps x')
 
     # finally, mock out removing the yaml file, json file, and secret key from
     # this machine
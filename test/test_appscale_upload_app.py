@@ -4,6 +4,8 @@
 
 # General-purpose Python library imports
 import base64
+import cStringIO
+import errno
 import getpass
 import httplib
 import json
@@ -13,6 +15,7 @@ import shutil
 import socket
 import subprocess
 import sys
+import tarfile
 import tempfile
 import time
 import unittest
@@ -26,6 +29,11 @@ import M2Crypto
 import SOAPpy
 
 
+# Test helpers
+from command_mocks import ArgvMatching
+from command_mocks import expect_command
+
+
 # AppScale import, the library that we're testing here
 lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
 sys.path.append(lib)
@@ -40,6 +48,7 @@ from local_state import APPSCALE_VERSION
 from local_state import LocalState
 from node_layout import NodeLayout
 from parse_args import ParseArgs
+from port_waiter import PortWaiter
 from remote_helper import RemoteHelper
 from user_app_client import UserAppClient
 
@@ -61,9 +70,15 @@ class TestAppScaleUploadApp(unittest.TestCase):
     flexmock(time)
     time.should_receive('sleep').and_return()
 
+    # and don't wait in between attempts to connect to ports that aren't
+    # open yet
+    flexmock(PortWaiter)
+    PortWaiter.should_receive('get_retry_delay').and_return(0)
+
     # throw some default mocks together for when invoking via shell succeeds
     # and when it fails
     self.fake_temp_file = flexmock(name='fake_temp_file')
+    self.fake_temp_file.should_receive('seek').and_return()
     self.fake_temp_file.should_receive('read').and_return('boo out')
     self.fake_temp_file.should_receive('close').and_return()
 
@@ -105,6 +120,25 @@ class TestAppScaleUploadApp(unittest.TestCase):
     self.assertRaises(AppEngineConfigException, AppScaleTools.upload_app, options)
 
 
+  def test_upload_tar_gz_app_with_no_app_yaml_or_appengine_web_xml(self):
+    # the same goes for apps that have been packaged as tarballs
+    tar_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, tar_dir)
+    tar_location = os.path.join(tar_dir, 'baz.tar.gz')
+    tar = tarfile.open(tar_location, 'w:gz')
+    tar_info = tarfile.TarInfo('main.py')
+    tar_info.size = len('print "boo"')
+    tar.addfile(tar_info, cStringIO.StringIO('print "boo"'))
+    tar.close()
+
+    argv = [
+      "--keyname", self.keyname,
+      "--file", tar_location
+    ]
+    options = ParseArgs(argv, self.function).args
+    self.assertRaises(AppEngineConfigException, AppScaleTools.upload_app, options)
+
+
   def test_upload_python25_app_with_no_appid(self):
     # if the user gives us an app with a reserved appid, we should abort
 
@@ -533,32 +567,39 @@ class TestAppScaleUploadApp(unittest.TestCase):
     getpass.should_receive('getpass').and_return('aaaaaa')
 
     # mock out making the remote app directory
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('mkdir -p'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    # and mock out tarring and copying the app
-    subprocess.should_receive('Popen').with_args(re.compile('tar -czf'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    expect_command('mkdir -p')
 
-    subprocess.should_receive('Popen').with_args(re.compile(
-      '/tmp/appscale-app-baz.tar.gz'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    # and mock out tarring the app straight into an ssh connection to the
+    # login node, assuming that we've never uploaded it before
+    os.path.should_receive('exists').with_args(
+      LocalState.get_app_manifest_location(self.keyname, 'baz')) \
+      .and_return(False)
 
-    # as well as removing the tar'ed app once we're done copying it
-    flexmock(os)
-    os.should_receive('remove').with_args('/tmp/appscale-app-baz.tar.gz') \
-      .and_return()
+    fake_manifest = flexmock(name='fake_manifest')
+    fake_manifest.should_receive('write').and_return()
+    builtins.should_receive('open').with_args(
+      LocalState.get_app_manifest_location(self.keyname, 'baz'), 'w') \
+      .and_return(fake_manifest)
+
+    fake_stdin = flexmock(name='fake_stdin')
+    fake_stdin.should_receive('write').and_return()
+    fake_stdin.should_receive('close').and_return()
+    fake_ssh = flexmock(name='fake_ssh', returncode=0, stdin=fake_stdin)
+    fake_ssh.should_receive('wait').and_return(0)
+    subprocess.should_receive('Popen').with_args(ArgvMatching(
+      'tar -xzf - .* tar -czf /var/apps/baz/app/baz.tar.gz'),
+      stdin=subprocess.PIPE, stdout=self.fake_temp_file,
+      stderr=subprocess.STDOUT, close_fds=True) \
+      .and_return(fake_ssh)
 
     # and slap in a mock that says the app comes up after waiting for it
     # three times
     fake_socket = flexmock(name='fake_socket')
-    fake_socket.should_receive('connect').with_args(('public1',
-      8080)).and_raise(Exception).and_raise(Exception) \
-      .and_return(None)
+    fake_socket.should_receive('setblocking').and_return()
+    fake_socket.should_receive('close').and_return()
+    fake_socket.should_receive('connect_ex').with_args(('public1',
+      8080)).and_return(errno.ECONNREFUSED) \
+      .and_return(errno.ECONNREFUSED).and_return(0)
     flexmock(socket)
     socket.should_receive('socket').and_return(fake_socket)
 
@@ -815,32 +856,39 @@ class TestAppScaleUploadApp(unittest.TestCase):
     getpass.should_receive('getpass').and_return('aaaaaa')
 
     # mock out making the remote app directory
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('mkdir -p'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    # and mock out tarring and copying the app
-    subprocess.should_receive('Popen').with_args(re.compile('tar -czf'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    expect_command('mkdir -p')
 
-    subprocess.should_receive('Popen').with_args(re.compile(
-      '/tmp/appscale-app-baz.tar.gz'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    # and mock out tarring the app straight into an ssh connection to the
+    # login node, assuming that we've never uploaded it before
+    os.path.should_receive('exists').with_args(
+      LocalState.get_app_manifest_location(self.keyname, 'baz')) \
+      .and_return(False)
 
-    # as well as removing the tar'ed app once we're done copying it
-    flexmock(os)
-    os.should_receive('remove').with_args('/tmp/appscale-app-baz.tar.gz') \
-      .and_return()
+    fake_manifest = flexmock(name='fake_manifest')
+    fake_manifest.should_receive('write').and_return()
+    builtins.should_receive('open').with_args(
+      LocalState.get_app_manifest_location(self.keyname, 'baz'), 'w') \
+      .and_return(fake_manifest)
+
+    fake_stdin = flexmock(name='fake_stdin')
+    fake_stdin.should_receive('write').and_return()
+    fake_stdin.should_receive('close').and_return()
+    fake_ssh = flexmock(name='fake_ssh', returncode=0, stdin=fake_stdin)
+    fake_ssh.should_receive('wait').and_return(0)
+    subprocess.should_receive('Popen').with_args(ArgvMatching(
+      'tar -xzf - .* tar -czf /var/apps/baz/app/baz.tar.gz'),
+      stdin=subprocess.PIPE, stdout=self.fake_temp_file,
+      stderr=subprocess.STDOUT, close_fds=True) \
+      .and_return(fake_ssh)
 
     # and slap in a mock that says the app comes up after waiting for it
     # three times
     fake_socket = flexmock(name='fake_socket')
-    fake_socket.should_receive('connect').with_args(('public-1',
-      8080)).and_raise(Exception).and_raise(Exception) \
-      .and_return(None)
+    fake_socket.should_receive('setblocking').and_return()
+    fake_socket.should_receive('close').and_return()
+    fake_socket.should_receive('connect_ex').with_args(('public1',
+      8080)).and_return(errno.ECONNREFUSED) \
+      .and_return(errno.ECONNREFUSED).and_return(0)
     flexmock(socket)
     socket.should_receive('socket').and_return(fake_socket)
 
@@ -853,44 +901,30 @@ class TestAppScaleUploadApp(unittest.TestCase):
 
 
   def test_upload_tar_gz_app_successfully(self):
-    # mock out generating a random app dir, for later mocks
-    flexmock(uuid)
-    uuid.should_receive('uuid4').and_return('12345678')
-    app_dir = '/tmp/appscale-app-12345678'
-
-    # add in mocks so that the gzip'ed file gets extracted to /tmp
-    # as well as for removing it later
-    flexmock(os)
-    os.should_receive('mkdir').with_args(app_dir) \
-      .and_return(True)
-    flexmock(shutil)
-    shutil.should_receive('rmtree').with_args(app_dir).and_return()
-
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(
-      re.compile('tar zxvf '),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    # make a tarball with an app.yaml in it, along with the rest of the app
+    tar_dir = tempfile.mkdtemp()
+    tar_location = os.path.join(tar_dir, 'baz.tar.gz')
+    tar = tarfile.open(tar_location, 'w:gz')
+    for name, contents in [('./app.yaml', yaml.dump({'application' : 'baz',
+      'runtime' : 'python'})), ('./main.py', 'print "boo"')]:
+      tar_info = tarfile.TarInfo(name)
+      tar_info.size = len(contents)
+      tar.addfile(tar_info, cStringIO.StringIO(contents))
+    tar.close()
+    with open(tar_location, 'rb') as file_handle:
+      tar_contents = file_handle.read()
+    self.addCleanup(shutil.rmtree, tar_dir)
+
+    # the tarball should be read in-process, and never extracted
+    flexmock(tarfile.TarFile)
+    tarfile.TarFile.should_receive('extract').never()
+    tarfile.TarFile.should_receive('extractall').never()
 
-    # add in mocks so that there is an app.yaml, but with no appid set
     flexmock(os.path)
     os.path.should_call('exists')
-    app_yaml_location = AppEngineHelper.get_app_yaml_location(app_dir)
-    os.path.should_receive('exists').with_args(app_yaml_location) \
-      .and_return(True)
-
-    # mock out reading the app.yaml file
     builtins = flexmock(sys.modules['__builtin__'])
     builtins.should_call('open')  # set the fall-through
 
-    fake_app_yaml = flexmock(name="fake_app_yaml")
-    fake_app_yaml.should_receive('read').and_return(yaml.dump({
-      'application' : 'baz',
-      'runtime' : 'python'
-    }))
-    builtins.should_receive('open').with_args(app_yaml_location, 'r') \
-      .and_return(fake_app_yaml)
-
     # mock out the SOAP call to the AppController and assume it succeeded
     fake_appcontroller = flexmock(name='fake_appcontroller')
     fake_appcontroller.should_receive('status').with_args('the secret') \
@@ -956,39 +990,35 @@ class TestAppScaleUploadApp(unittest.TestCase):
     flexmock(getpass)
     getpass.should_receive('getpass').and_return('aaaaaa')
 
-    # mock out making the remote app directory
+    # and mock out streaming the tarball as-is straight into an ssh
+    # connection to the login node
+    fake_stdin = flexmock(name='fake_stdin')
+    fake_stdin.should_receive('write').with_args(tar_contents).and_return() \
+      .once()
+    fake_stdin.should_receive('close').and_return()
+    fake_ssh = flexmock(name='fake_ssh', returncode=0, stdin=fake_stdin)
+    fake_ssh.should_receive('wait').and_return(0)
     flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('mkdir -p'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    # and mock out tarring and copying the app
-    subprocess.should_receive('Popen').with_args(re.compile('tar -czf'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    subprocess.should_receive('Popen').with_args(re.compile(
-      '/tmp/appscale-app-baz.tar.gz'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    # as well as removing the tar'ed app once we're done copying it
-    flexmock(os)
-    os.should_receive('remove').with_args('/tmp/appscale-app-baz.tar.gz') \
-      .and_return()
+    subprocess.should_receive('Popen').with_args(ArgvMatching(
+      'mkdir -p /var/apps/baz/app .* cat > /var/apps/baz/app/baz.tar.gz'),
+      stdin=subprocess.PIPE, stdout=self.fake_temp_file,
+      stderr=subprocess.STDOUT, close_fds=True) \
+      .and_return(fake_ssh)
 
     # and slap in a mock that says the app comes up after waiting for it
     # three times
     fake_socket = flexmock(name='fake_socket')
-    fake_socket.should_receive('connect').with_args(('public-1',
-      8080)).and_raise(Exception).and_raise(Exception) \
-      .and_return(None)
+    fake_socket.should_receive('setblocking').and_return()
+    fake_socket.should_receive('close').and_return()
+    fake_socket.should_receive('connect_ex').with_args(('public1',
+      8080)).and_return(errno.ECONNREFUSED) \
+      .and_return(errno.ECONNREFUSED).and_return(0)
     flexmock(socket)
     socket.should_receive('socket').and_return(fake_socket)
 
     argv = [
       "--keyname", self.keyname,
-      "--file", self.app_dir + ".tar.gz"
+      "--file", tar_location
     ]
     options = ParseArgs(argv, self.function).args
     AppScaleTools.upload_app(options)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+
+# Third party libraries
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
+sys.path.append(lib)
+from deployment_metadata import DeploymentMetadata
+
+
+class TestDeploymentMetadata(unittest.TestCase):
+
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.yaml_location = os.path.join(self.directory, "locations.yaml")
+    self.json_location = os.path.join(self.directory, "locations.json")
+    self.secret_location = os.path.join(self.directory, "bookey.secret")
+
+    with open(self.yaml_location, 'w') as file_handle:
+      file_handle.write("infrastructure: ec2\ngroup: boogroup\n")
+    self.write_nodes([
+      {'public_ip' : 'public1', 'private_ip' : 'private1',
+        'jobs' : ['shadow', 'login', 'memcache']},
+      {'public_ip' : 'public2', 'private_ip' : 'private2',
+        'jobs' : ['appengine', 'memcache']}
+    ])
+    with open(self.secret_location, 'w') as file_handle:
+      file_handle.write("the secret")
+
+    self.metadata = DeploymentMetadata(self.yaml_location,
+      self.json_location, self.secret_location)
+
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+
+  def write_nodes(self, nodes):
+    with open(self.json_location, 'w') as file_handle:
+      file_handle.write(json.dumps(nodes))
+
+
+  def test_files_are_only_read_once(self):
+    self.assertEquals('ec2', self.metadata.get_yaml()['infrastructure'])
+    self.assertEquals('the secret', self.metadata.get_secret())
+    self.assertEquals(2, len(self.metadata.get_nodes()))
+
+    # now that we've read everything, make sure we don't read it again
+    builtins = flexmock(sys.modules['__builtin__'])
+    builtins.should_receive('open').never()
+
+    self.assertEquals('boogroup', self.metadata.get_yaml()['group'])
+    self.assertEquals('the secret', self.metadata.get_secret())
+    self.assertEquals(['public1'], self.metadata.get_hosts_with_role('login'))
+
+
+  def test_files_are_read_again_once_they_change(self):
+    self.assertEquals(['public2'],
+      self.metadata.get_hosts_with_role('appengine'))
+
+    self.write_nodes([
+      {'public_ip' : 'public1', 'private_ip' : 'private1',
+        'jobs' : ['shadow', 'login', 'appengine']}
+    ])
+    self.metadata.invalidate()
+    self.assertEquals(['public1'],
+      self.metadata.get_hosts_with_role('appengine'))
+
+
+  def test_role_indexes(self):
+    self.assertEquals(['public1', 'public2'],
+      self.metadata.get_hosts_with_role('memcache'))
+    self.assertEquals([], self.metadata.get_hosts_with_role('zookeeper'))
+    self.assertEquals(['appengine', 'memcache'],
+      self.metadata.get_roles_for_host('public2'))
+    self.assertEquals([], self.metadata.get_roles_for_host('public3'))
+
+
+  def test_callers_cant_change_cached_nodes(self):
+    self.metadata.get_nodes()[0]['jobs'].append('zookeeper')
+    self.metadata.get_hosts_with_role('memcache').append('public3')
+
+    self.assertEquals(['shadow', 'login', 'memcache'],
+      self.metadata.get_nodes()[0]['jobs'])
+    self.assertEquals(['public1', 'public2'],
+      self.metadata.get_hosts_with_role('memcache'))
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import os
+import socket
+import sys
+import time
+import unittest
+
+
+# Third party libraries
+import boto
+from boto.exception import EC2ResponseError
+from boto.resultset import ResultSet
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
+sys.path.append(lib)
+from agents.base_agent import AgentRuntimeException
+from agents.ec2_agent import EC2Agent
+from agents.euca_agent import EucalyptusAgent
+
+
+class TestEC2Agent(unittest.TestCase):
+
+
+  def setUp(self):
+    self.params = {
+      EC2Agent.PARAM_CREDENTIALS : {
+        'EC2_ACCESS_KEY' : 'baz',
+        'EC2_SECRET_KEY' : 'baz'
+      },
+      EC2Agent.PARAM_GROUP : 'boogroup',
+      EC2Agent.PARAM_IMAGE_ID : 'ami-ABCDEFG',
+      EC2Agent.PARAM_INSTANCE_TYPE : 'm1.large',
+      EC2Agent.PARAM_KEYNAME : 'bookey',
+      'IS_VERBOSE' : False
+    }
+    self.filters = {
+      'key-name' : 'bookey',
+      'instance.group-name' : 'boogroup',
+      'instance-state-name' : ['running']
+    }
+    self.fake_ec2 = flexmock(name='fake_ec2')
+
+    # don't actually wait between checks on booting instances
+    flexmock(time).should_receive('sleep').and_return()
+
+
+  def make_page(self, instances, next_token=None):
+    page = ResultSet()
+    page.append(flexmock(name='fake_reservation', instances=instances))
+    page.next_token = next_token
+    return page
+
+
+  def make_instance(self, instance_id, state='running', key_name='bookey'):
+    return flexmock(name=instance_id, id=instance_id, state=state,
+      key_name=key_name, public_dns_name='public-' + instance_id,
+      private_dns_name='private-' + instance_id)
+
+
+  def test_describe_instances_pages_through_filtered_results(self):
+    # EC2 should do the filtering for us, and hand us results a page at a time
+    self.fake_ec2.should_receive('get_all_reservations').with_args(
+      filters=self.filters, max_results=EC2Agent.DESCRIBE_INSTANCES_PAGE_SIZE,
+      next_token=None).and_return(self.make_page([
+      self.make_instance('i-ONE')], next_token='page2')).once()
+    self.fake_ec2.should_receive('get_all_reservations').with_args(
+      filters=self.filters, max_results=EC2Agent.DESCRIBE_INSTANCES_PAGE_SIZE,
+      next_token='page2').and_return(self.make_page([
+      self.make_instance('i-TWO'),
+      # clouds that ignore our filters may give us other instances too
+      self.make_instance('i-THREE', key_name='otherkey'),
+      self.make_instance('i-FOUR', state='terminated')])).once()
+
+    agent = EC2Agent()
+    flexmock(agent).should_receive('open_connection').and_return(self.fake_ec2)
+    self.assertEquals((['public-i-ONE', 'public-i-TWO'],
+      ['private-i-ONE', 'private-i-TWO'], ['i-ONE', 'i-TWO']),
+      agent.describe_instances(self.params))
+
+
+  def test_describe_instances_without_paging(self):
+    # Boto 2.6 has no get_all_reservations, so we can't page through results
+    self.fake_ec2.should_receive('get_all_instances').with_args(
+      instance_ids=None, filters=self.filters).and_return(self.make_page([
+      self.make_instance('i-ONE')], next_token='page2')).once()
+
+    agent = EC2Agent()
+    flexmock(agent).should_receive('open_connection').and_return(self.fake_ec2)
+    self.assertEquals((['public-i-ONE'], ['private-i-ONE'], ['i-ONE']),
+      agent.describe_instances(self.params))
+
+
+  def test_describe_specific_instances(self):
+    filters = {'key-name' : 'bookey', 'instance.group-name' : 'boogroup'}
+    self.fake_ec2.should_receive('get_all_instances').with_args(
+      instance_ids=['i-ONE'], filters=filters).and_return(self.make_page([
+      self.make_instance('i-ONE', state='pending')]))
+
+    agent = EC2Agent()
+    flexmock(agent).should_receive('open_connection').and_return(self.fake_ec2)
+    self.assertEquals([{
+      'id' : 'i-ONE',
+      'state' : 'pending',
+      'public_ip' : 'public-i-ONE',
+      'private_ip' : 'private-i-ONE'
+    }], agent.describe_instance_records(self.params, instance_ids=['i-ONE'],
+      states=None))
+
+
+  def test_describe_instances_in_eucalyptus(self):
+    # Eucalyptus doesn't page its results, so we shouldn't ask it to
+    self.fake_ec2.should_receive('get_all_reservations').never()
+    self.fake_ec2.should_receive('get_all_instances').with_args(
+      instance_ids=None, filters=self.filters).and_return(self.make_page([
+      self.make_instance('i-ONE')]))
+
+    agent = EucalyptusAgent()
+    flexmock(agent).should_receive('open_connection').and_return(self.fake_ec2)
+    self.assertEquals((['public-i-ONE'], ['private-i-ONE'], ['i-ONE']),
+      agent.describe_instances(self.params))
+
+
+  def test_connections_are_reused(self):
+    self.fake_ec2.should_receive('get_all_security_groups').and_return([])
+    flexmock(boto).should_receive('connect_ec2').with_args('baz', 'baz') \
+      .and_return(self.fake_ec2).once()
+
+    agent = EC2Agent()
+    agent.open_connection(self.params).get_all_security_groups()
+    agent.open_connection(self.params).get_all_security_groups()
+
+
+  def test_broken_connections_are_replaced(self):
+    broken_ec2 = flexmock(name='broken_ec2')
+    broken_ec2.should_receive('get_all_security_groups').and_raise(
+      socket.error('connection reset'))
+    self.fake_ec2.should_receive('get_all_security_groups').and_return([])
+    flexmock(boto).should_receive('connect_ec2').with_args('baz', 'baz') \
+      .and_return(broken_ec2).and_return(self.fake_ec2).twice()
+
+    agent = EC2Agent()
+    self.assertEquals([], agent.open_connection(self.params)
+      .get_all_security_groups())
+    # the replacement connection should be the one that we use from now on
+    self.assertEquals([], agent.open_connection(self.params)
+      .get_all_security_groups())
+
+
+  def test_broken_connections_dont_repeat_changes(self):
+    # run_instances may have started instances before the connection broke,
+    # so we shouldn't ask for them again
+    broken_ec2 = flexmock(name='broken_ec2')
+    broken_ec2.should_receive('run_instances').and_raise(
+      socket.error('timed out')).once()
+    self.fake_ec2.should_receive('run_instances').never()
+    self.fake_ec2.should_receive('get_all_security_groups').and_return([])
+    flexmock(boto).should_receive('connect_ec2').with_args('baz', 'baz') \
+      .and_return(broken_ec2).and_return(self.fake_ec2).twice()
+
+    agent = EC2Agent()
+    self.assertRaises(socket.error,
+      agent.open_connection(self.params).run_instances, 'ami-ABCDEFG')
+    # but we should still use a new connection from now on
+    self.assertEquals([], agent.open_connection(self.params)
+      .get_all_security_groups())
+
+
+  def test_rejected_credentials_arent_retried(self):
+    auth_failure = EC2ResponseError(401, 'Unauthorized')
+    auth_failure.error_code = 'AuthFailure'
+    self.fake_ec2.should_receive('get_all_security_groups').and_raise(
+      auth_failure).once()
+    flexmock(boto).should_receive('connect_ec2').with_args('baz', 'baz') \
+      .and_return(self.fake_ec2).twice()
+
+    agent = EC2Agent()
+    self.assertRaises(EC2ResponseError,
+      agent.open_connection(self.params).get_all_security_groups)
+
+
+  def test_other_errors_dont_replace_connections(self):
+    self.fake_ec2.should_receive('get_image').and_raise(
+      EC2ResponseError(400, 'Bad Request'))
+    flexmock(boto).should_receive('connect_ec2').with_args('baz', 'baz') \
+      .and_return(self.fake_ec2).once()
+
+    agent = EC2Agent()
+    self.assertRaises(EC2ResponseError,
+      agent.open_connection(self.params).get_image, 'emi-ABCDEFG')
+
+
+  def test_run_instances_only_waits_for_its_own_instances(self):
+    self.fake_ec2.should_receive('run_instances').with_args('ami-ABCDEFG', 1,
+      2, key_name='bookey', security_groups=['boogroup'],
+      instance_type='m1.large', placement=None).and_return(flexmock(
+      name='fake_reservation', instances=[
+      self.make_instance('i-ONE', state='pending'),
+      self.make_instance('i-TWO', state='pending')]))
+
+    # EC2 may not know about our instances right away, and once one has
+    # booted, we should stop asking about it
+    not_found = EC2ResponseError(400, 'Bad Request')
+    not_found.error_code = EC2Agent.INSTANCE_NOT_FOUND_ERROR
+    filters = {'key-name' : 'bookey', 'instance.group-name' : 'boogroup'}
+    self.fake_ec2.should_receive('get_all_instances').with_args(
+      instance_ids=['i-ONE', 'i-TWO'], filters=filters).and_raise(
+      not_found).and_return(self.make_page([
+      self.make_instance('i-ONE', state='pending'),
+      self.make_instance('i-TWO')])).twice()
+    self.fake_ec2.should_receive('get_all_instances').with_args(
+      instance_ids=['i-ONE'], filters=filters).and_return(self.make_page([
+      self.make_instance('i-ONE')])).once()
+
+    agent = EC2Agent()
+    flexmock(agent).should_receive('open_connection').and_return(self.fake_ec2)
+    self.assertEquals((['i-ONE', 'i-TWO'], ['public-i-ONE', 'public-i-TWO'],
+      ['private-i-ONE', 'private-i-TWO']),
+      agent.run_instances(2, self.params, True))
+
+
+  def test_run_instances_terminates_instances_that_fail_to_boot(self):
+    self.fake_ec2.should_receive('run_instances').and_return(flexmock(
+      name='fake_reservation', instances=[
+      self.make_instance('i-ONE', state='pending'),
+      self.make_instance('i-TWO', state='pending')]))
+    self.fake_ec2.should_receive('get_all_instances').and_return(
+      self.make_page([self.make_instance('i-ONE'),
+      self.make_instance('i-TWO', state='terminated')])).once()
+    self.fake_ec2.should_receive('terminate_instances').with_args(['i-TWO']) \
+      .and_return().once()
+
+    # and since we won't ask for more, we should settle for the one we got
+    agent = EC2Agent()
+    agent.MAX_TOP_UPS = 0
+    flexmock(agent).should_receive('open_connection').and_return(self.fake_ec2)
+    self.assertEquals((['i-ONE'], ['public-i-ONE'], ['private-i-ONE']),
+      agent.run_instances(2, self.params, True))
+
+
+  def test_run_instances_in_batches_across_zones(self):
+    filters = {'key-name' : 'bookey', 'instance.group-name' : 'boogroup'}
+    for instance_ids in [['i-ONE'], ['i-TWO', 'i-THREE']]:
+      self.fake_ec2.should_receive('get_all_instances').with_args(
+        instance_ids=instance_ids, filters=filters).and_return(self.make_page(
+        [self.make_instance(instance_id) for instance_id in instance_ids]))
+
+    # the first batch should only be partially filled, and the second not at
+    # all, so we should ask for two more instances afterwards
+    no_capacity = EC2ResponseError(500, 'Server Error')
+    no_capacity.error_code = 'InsufficientInstanceCapacity'
+    no_capacity.error_message = 'no more m1.larges'
+    self.fake_ec2.should_receive('run_instances').with_args('ami-ABCDEFG', 1,
+      2, key_name='bookey', security_groups=['boogroup'],
+      instance_type='m1.large', placement='zone-a').and_return(flexmock(
+      name='fake_reservation', instances=[self.make_instance('i-ONE')])) \
+      .and_return(flexmock(name='fake_reservation', instances=[
+      self.make_instance('i-TWO'), self.make_instance('i-THREE')])).twice()
+    self.fake_ec2.should_receive('run_instances').with_args('ami-ABCDEFG', 1,
+      1, key_name='bookey', security_groups=['boogroup'],
+      instance_type='m1.large', placement='zone-b').and_raise(no_capacity) \
+      .once()
+
+    agent = EC2Agent()
+    agent.MAX_BATCH_SIZE = 2
+    flexmock(agent).should_receive('open_connection').and_return(self.fake_ec2)
+    self.params[EC2Agent.PARAM_ZONES] = ['zone-a', 'zone-b']
+    self.assertEquals((['i-ONE', 'i-TWO', 'i-THREE'],
+      ['public-i-ONE', 'public-i-TWO', 'public-i-THREE'],
+      ['private-i-ONE', 'private-i-TWO', 'private-i-THREE']),
+      agent.run_instances(3, self.params, True))
+
+
+  def test_run_instances_waits_longer_before_each_top_up(self):
+    # there's no capacity the first two times we ask, but there is the last
+    # time, so we should back off before asking again each time
+    no_capacity = EC2ResponseError(500, 'Server Error')
+    no_capacity.error_code = 'InsufficientInstanceCapacity'
+    no_capacity.error_message = 'no more m1.larges'
+    self.fake_ec2.should_receive('run_instances').and_raise(no_capacity) \
+      .and_raise(no_capacity).and_return(flexmock(name='fake_reservation',
+      instances=[self.make_instance('i-ONE')])).times(3)
+    self.fake_ec2.should_receive('get_all_instances').and_return(
+      self.make_page([self.make_instance('i-ONE')]))
+
+    sleeps = []
+    time.should_receive('sleep').replace_with(sleeps.append)
+
+    agent = EC2Agent()
+    flexmock(agent).should_receive('open_connection').and_return(self.fake_ec2)
+    self.assertEquals((['i-ONE'], ['public-i-ONE'], ['private-i-ONE']),
+      agent.run_instances(1, self.params, True))
+    self.assertEquals([EC2Agent.INITIAL_TOP_UP_DELAY,
+      EC2Agent.INITIAL_TOP_UP_DELAY * EC2Agent.TOP_UP_BACKOFF_FACTOR],
+      sleeps[:2])
+
+
+  def test_run_instances_terminates_instances_when_a_batch_fails(self):
+    # one batch starts an instance, but the other can't start any, and the
+    # instance that did start shouldn't be left running
+    bad_request = EC2ResponseError(400, 'Bad Request')
+    bad_request.error_code = 'InvalidParameterValue'
+    bad_request.error_message = 'no such image'
+    self.fake_ec2.should_receive('run_instances').and_return(flexmock(
+      name='fake_reservation', instances=[self.make_instance('i-ONE')])) \
+      .and_raise(bad_request).twice()
+    self.fake_ec2.should_receive('get_all_instances').and_return(
+      self.make_page([self.make_instance('i-ONE')]))
+    self.fake_ec2.should_receive('terminate_instances').with_args(['i-ONE']) \
+      .and_return().once()
+
+    agent = EC2Agent()
+    agent.MAX_BATCH_SIZE = 1
+    flexmock(agent).should_receive('open_connection').and_return(self.fake_ec2)
+    self.assertRaises(AgentRuntimeException, agent.run_instances, 2,
+      self.params, True)
+
+
+  def test_run_instances_terminates_instances_when_waiting_fails(self):
+    self.fake_ec2.should_receive('run_instances').and_return(flexmock(
+      name='fake_reservation', instances=[
+      self.make_instance('i-ONE', state='pending')]))
+    self.fake_ec2.should_receive('get_all_instances').and_raise(
+      socket.error('connection reset'))
+    self.fake_ec2.should_receive('terminate_instances').with_args(['i-ONE']) \
+      .and_return().once()
+
+    agent = EC2Agent()
+    flexmock(agent).should_receive('open_connection').and_return(self.fake_ec2)
+    self.assertRaises(socket.error, agent.run_instances, 1, self.params, True)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+
+# Third party libraries
+from flexmock import flexmock
+import M2Crypto.RSA
+
+
+# AppScale import, the library that we're testing here
+lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
+sys.path.append(lib)
+from key_pool import KeyPool
+
+
+class TestKeyPool(unittest.TestCase):
+
+
+  def setUp(self):
+    self.cache_dir = tempfile.mkdtemp()
+
+    # small keys are much faster to generate, and just as good for testing
+    flexmock(KeyPool)
+    KeyPool.should_receive('generate_key').replace_with(
+      lambda: M2Crypto.RSA.gen_key(512, 65537, callback=lambda *args: None))
+
+
+  def tearDown(self):
+    KeyPool.stop()
+    shutil.rmtree(self.cache_dir)
+
+
+  def test_get_key_without_starting_the_pool(self):
+    # if nobody started the pool, we should generate the key right away, and
+    # not bother making any more
+    key = KeyPool.get_key()
+    self.assertEquals(512, len(key))
+    self.assertEquals(0, KeyPool.keys_in_progress)
+    self.assertEquals([], KeyPool.spare_keys)
+
+
+  def test_keys_are_only_handed_out_once(self):
+    KeyPool.start()
+    first_key = KeyPool.get_key()
+    second_key = KeyPool.get_key()
+    self.assertNotEquals(first_key.pub(), second_key.pub())
+
+
+  def test_keys_in_memory_arent_replaced(self):
+    # nothing will ever take a key made after the one we take, so we
+    # shouldn't spend any time making one
+    KeyPool.start()
+    KeyPool.get_key()
+    self.assertEquals(0, KeyPool.keys_in_progress)
+    self.assertEquals([], KeyPool.spare_keys)
+
+
+  def test_spare_keys_are_cached_on_disk(self):
+    # make a spare key, and make sure it's still around once we stop
+    KeyPool.start(self.cache_dir)
+    KeyPool.stop()
+    cached_keys = os.listdir(self.cache_dir)
+    self.assertEquals(1, len(cached_keys))
+    cached_key = M2Crypto.RSA.load_key(os.path.join(self.cache_dir,
+      cached_keys[0]))
+
+    # the next time we start, we should use that key instead of making a new
+    # one, and replace it on disk with a new key
+    KeyPool.start(self.cache_dir)
+    self.assertEquals(cached_key.pub(), KeyPool.get_key().pub())
+    KeyPool.stop()
+    self.assertEquals(1, len(os.listdir(self.cache_dir)))
+    self.assertNotEquals(cached_keys, os.listdir(self.cache_dir))
+
+
+  def test_cached_keys_are_only_readable_by_us(self):
+    KeyPool.start(self.cache_dir)
+    KeyPool.stop()
+    cached_key = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+    self.assertEquals(0600, stat.S_IMODE(os.stat(cached_key).st_mode))
+
+
+  def test_write_key_wont_replace_existing_files(self):
+    location = os.path.join(self.cache_dir, 'existing.pem')
+    with open(location, 'w') as file_handle:
+      file_handle.write('existing contents')
+
+    key = KeyPool.get_key()
+    self.assertRaises(OSError, KeyPool.write_key, key, location)
+    with open(location, 'r') as file_handle:
+      self.assertEquals('existing contents', file_handle.read())
@@ -5,7 +5,11 @@
 # General-purpose Python library imports
 import json
 import os
+import shutil
+import subprocess
 import sys
+import tempfile
+import time
 import unittest
 import yaml
 
@@ -19,6 +23,7 @@ from flexmock import flexmock
 lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
 sys.path.append(lib)
 from custom_exceptions import BadConfigurationException
+from custom_exceptions import ShellException
 from local_state import LocalState
 from node_layout import NodeLayout
 
@@ -197,3 +202,105 @@ class TestLocalState(unittest.TestCase):
     host = 'public1'
     instance_id = 'i-ABCDEFG'
     LocalState.update_local_metadata(options, node_layout, host, instance_id)
+
+
+  def test_run_passes_arguments_without_a_shell(self):
+    # arguments that a shell would expand or split should arrive untouched,
+    # and standard output and error should be kept apart
+    script = "import sys; sys.stdout.write(sys.argv[1]); " + \
+      "sys.stderr.write('boo err')"
+    self.assertEquals((0, "it's $HOME *", "boo err"), LocalState.run(
+      [sys.executable, '-c', script, "it's $HOME *"], False))
+
+    self.assertEquals((0, "boo in", ""), LocalState.run([sys.executable, '-c',
+      "import sys; sys.stdout.write(sys.stdin.read())"], False,
+      stdin="boo in"))
+
+
+  def test_run_caps_output(self):
+    script = "import sys; sys.stdout.write('a' * 1000000)"
+    self.assertEquals((0, 'a' * 10, ''), LocalState.run([sys.executable, '-c',
+      script], False, max_output=10))
+
+
+  def test_run_writes_output_to_files(self):
+    output_dir = tempfile.mkdtemp()
+    output_path = os.path.join(output_dir, 'output.txt')
+    script = "import sys; sys.stdout.write('a' * 100); " + \
+      "sys.stderr.write('boo err')"
+    try:
+      self.assertEquals((0, '', 'boo err'), LocalState.run([sys.executable,
+        '-c', script], False, max_output=10, output_path=output_path))
+      with open(output_path, 'r') as file_handle:
+        self.assertEquals('a' * 100, file_handle.read())
+    finally:
+      shutil.rmtree(output_dir)
+
+
+  def test_run_exposes_exit_codes(self):
+    script = "import sys; sys.exit(1)"
+    self.assertEquals((1, '', ''), LocalState.run([sys.executable, '-c',
+      script], False, success_codes=(0, 1)))
+
+    try:
+      LocalState.run([sys.executable, '-c', script], False)
+      self.fail("run should have raised a ShellException")
+    except ShellException as exception:
+      self.assertEquals(1, exception.returncode)
+
+
+  def test_run_doesnt_retry_deterministic_failures(self):
+    flexmock(time)
+    time.should_receive('sleep').and_return()
+
+    flexmock(LocalState)
+    LocalState.should_receive('run_once').and_return((1, '', 'boo err')) \
+      .once()
+    self.assertRaises(ShellException, LocalState.run, ['false'], False,
+      num_retries=3, retry_policy=LocalState.RETRY_TRANSIENT)
+
+
+  def test_run_retries_transient_failures(self):
+    flexmock(time)
+    time.should_receive('sleep').and_return()
+
+    # ssh failing to reach the remote machine (or timing out) may not happen
+    # the next time, so it's worth retrying
+    flexmock(LocalState)
+    LocalState.should_receive('run_once').and_return((255, '', 'boo err')) \
+      .and_return((None, '', '')).and_return((0, 'boo out', ''))
+    self.assertEquals((0, 'boo out', ''), LocalState.run(['ssh', 'public1'],
+      False, num_retries=3, retry_policy=LocalState.RETRY_TRANSIENT))
+
+
+  def test_run_kills_commands_that_time_out(self):
+    try:
+      LocalState.run([sys.executable, '-c', 'import time; time.sleep(30)'],
+        False, timeout=0.1)
+      self.fail("run should have raised a ShellException")
+    except ShellException as exception:
+      self.assertEquals(None, exception.returncode)
+
+    # a command that never reads its standard input shouldn't keep us from
+    # noticing that it's taken too long
+    try:
+      LocalState.run([sys.executable, '-c', 'import time; time.sleep(30)'],
+        False, timeout=0.1, stdin='a' * 1000000)
+      self.fail("run should have raised a ShellException")
+    except ShellException as exception:
+      self.assertEquals(None, exception.returncode)
+
+
+  def test_shell_follows_retry_policy(self):
+    flexmock(time)
+    time.should_receive('sleep').and_return()
+
+    flexmock(subprocess)
+    subprocess.should_call('Popen').once()
+    try:
+      LocalState.shell("echo boo; exit 3", False,
+        retry_policy=LocalState.RETRY_NEVER)
+      self.fail("shell should have raised a ShellException")
+    except ShellException as exception:
+      self.assertEquals(3, exception.returncode)
+      self.assertEquals("boo\n", exception.output)
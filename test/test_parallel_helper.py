@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import os
+import sys
+import threading
+import unittest
+
+
+# Third party libraries
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
+sys.path.append(lib)
+from appscale_logger import AppScaleLogger
+from custom_exceptions import AppScaleException
+from parallel_helper import ParallelHelper
+
+
+class TestParallelHelper(unittest.TestCase):
+
+
+  def setUp(self):
+    # mock out any writing to stdout
+    flexmock(AppScaleLogger)
+    AppScaleLogger.should_receive('log').and_return()
+    AppScaleLogger.should_receive('warn').and_return()
+
+
+  def test_run_on_hosts_with_no_hosts(self):
+    self.assertEquals(({}, {}), ParallelHelper.run_on_hosts([], str.upper))
+
+
+  def test_run_on_hosts_collects_results_and_errors(self):
+    def function(host):
+      if host == 'public2':
+        raise AppScaleException("boo")
+      return host.upper()
+
+    results, errors = ParallelHelper.run_on_hosts(['public1', 'public2',
+      'public3'], function, description="testing")
+    self.assertEquals({'public1' : 'PUBLIC1', 'public3' : 'PUBLIC3'}, results)
+    self.assertEquals(['public2'], errors.keys())
+    self.assertEquals("boo", str(errors['public2']))
+
+
+  def test_run_on_hosts_respects_max_threads(self):
+    lock = threading.Lock()
+    state = {'running' : 0, 'most_running' : 0}
+    release = threading.Event()
+
+    def function(host):
+      with lock:
+        state['running'] += 1
+        state['most_running'] = max(state['most_running'], state['running'])
+        if state['running'] == 2:
+          release.set()
+      release.wait(5)
+      with lock:
+        state['running'] -= 1
+      return host
+
+    hosts = ['public{0}'.format(i) for i in range(6)]
+    results, errors = ParallelHelper.run_on_hosts(hosts, function,
+      max_threads=2)
+    self.assertEquals(6, len(results))
+    self.assertEquals({}, errors)
+    self.assertEquals(2, state['most_running'])
+
+
+  def test_run_on_hosts_times_out_stuck_hosts(self):
+    ParallelHelper.POLL_INTERVAL = 0.01
+    stuck = threading.Event()
+
+    def function(host):
+      if host == 'public1':
+        stuck.wait(5)
+      return host
+
+    try:
+      results, errors = ParallelHelper.run_on_hosts(['public1', 'public2'],
+        function, max_threads=1, timeout=0.1)
+    finally:
+      stuck.set()
+      ParallelHelper.POLL_INTERVAL = 0.5
+
+    self.assertEquals({'public2' : 'public2'}, results)
+    self.assertEquals(['public1'], errors.keys())
+    self.assertTrue(isinstance(errors['public1'], AppScaleException))
+
+
+  def test_raise_if_any_failed(self):
+    ParallelHelper.raise_if_any_failed({}, "testing")
+    self.assertRaises(AppScaleException, ParallelHelper.raise_if_any_failed,
+      {'public1' : AppScaleException("boo")}, "testing")
+
+
+  def test_run_task_graph_runs_independent_tasks_together(self):
+    # 'boot' can only finish once 'cert' has started, so this only works if
+    # the two run at the same time
+    cert_started = threading.Event()
+
+    def boot(results):
+      if not cert_started.wait(5):
+        raise AppScaleException("cert never started")
+      return 'public1'
+
+    def cert(results):
+      cert_started.set()
+      return 'the cert'
+
+    results = ParallelHelper.run_task_graph({
+      'boot' : (boot, []),
+      'cert' : (cert, []),
+      'copy' : (lambda results: (results['boot'], results['cert']),
+        ['boot', 'cert'])
+    })
+    self.assertEquals(('public1', 'the cert'), results['copy'])
+
+
+  def test_run_task_graph_stops_after_failures(self):
+    def fail(results):
+      raise ValueError("boo")
+
+    def never_run(results):
+      raise AssertionError("depends on a failed task")
+
+    self.assertRaises(ValueError, ParallelHelper.run_task_graph, {
+      'boot' : (fail, []),
+      'copy' : (never_run, ['boot'])
+    })
+
+
+  def test_run_task_graph_with_bad_dependencies(self):
+    self.assertRaises(AppScaleException, ParallelHelper.run_task_graph, {
+      'copy' : (lambda results: None, ['boot'])
+    })
+    self.assertRaises(AppScaleException, ParallelHelper.run_task_graph, {
+      'boot' : (lambda results: None, ['copy']),
+      'copy' : (lambda results: None, ['boot'])
+    })
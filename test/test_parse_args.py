@@ -137,10 +137,72 @@ class TestParseArgs(unittest.TestCase):
     argv = ["--location", "/boo/baz"]
     actual = ParseArgs(argv, "appscale-gather-logs")
     self.assertEquals("/boo/baz", actual.args.location)
+    self.assertEquals(ParseArgs.DEFAULT_LOG_CONCURRENCY,
+      actual.args.concurrency)
+    self.assertEquals(False, actual.args.compressed)
+
+    # Copying logs from a positive number of machines at once should be ok
+    argv_2 = ["--concurrency", "50", "--compressed"]
+    actual_2 = ParseArgs(argv_2, "appscale-gather-logs")
+    self.assertEquals(50, actual_2.args.concurrency)
+    self.assertEquals(True, actual_2.args.compressed)
+
+    # But copying logs from zero machines at once should not be
+    argv_3 = ["--concurrency", "0"]
+    self.assertRaises(BadConfigurationException, ParseArgs, argv_3,
+      "appscale-gather-logs")
+
+    # and we can't keep logs compressed if we're adding to them incrementally
+    argv_4 = ["--incremental", "--compressed"]
+    self.assertRaises(BadConfigurationException, ParseArgs, argv_4,
+      "appscale-gather-logs")
+
+    # we can copy logs from only some of the machines, as long as we ask for
+    # roles that exist
+    argv_5 = ["--roles", "memcache+database,appengine"]
+    actual_5 = ParseArgs(argv_5, "appscale-gather-logs")
+    self.assertEquals("memcache+database,appengine", actual_5.args.roles)
+
+    argv_6 = ["--roles", "memcache+boo"]
+    self.assertRaises(BadConfigurationException, ParseArgs, argv_6,
+      "appscale-gather-logs")
+
+    argv_7 = ["--roles", ","]
+    self.assertRaises(BadConfigurationException, ParseArgs, argv_7,
+      "appscale-gather-logs")
+
+
+  def test_describe_instances_flags(self):
+    # by default, we report on each machine with the AppController's own
+    # status, and give each machine a while to respond
+    actual = ParseArgs([], "appscale-describe-instances")
+    self.assertEquals("text", actual.args.format)
+    self.assertEquals(ParseArgs.DEFAULT_DESCRIBE_TIMEOUT, actual.args.timeout)
+    self.assertEquals(ParseArgs.DEFAULT_DESCRIBE_CONCURRENCY,
+      actual.args.concurrency)
+
+    # reporting as json or a table should be ok
+    argv_2 = ["--format", "json", "--timeout", "5", "--concurrency", "100"]
+    actual_2 = ParseArgs(argv_2, "appscale-describe-instances")
+    self.assertEquals("json", actual_2.args.format)
+    self.assertEquals(5, actual_2.args.timeout)
+    self.assertEquals(100, actual_2.args.concurrency)
+
+    # but other formats, or not waiting at all, should not be
+    self.assertRaises(SystemExit, ParseArgs, ["--format", "xml"],
+      "appscale-describe-instances")
+    self.assertRaises(BadConfigurationException, ParseArgs,
+      ["--timeout", "0"], "appscale-describe-instances")
+
+    # and we can report on only some of the machines
+    self.assertEquals("appengine", ParseArgs(["--roles", "appengine"],
+      "appscale-describe-instances").args.roles)
+    self.assertRaises(BadConfigurationException, ParseArgs,
+      ["--roles", "boo"], "appscale-describe-instances")
 
 
   def test_developer_flags(self):
-    # Specifying force or test should have that carried over
+    # Specifying force, test, or keep_spare_keys should have that carried over
     # to in the resulting hash
     argv_1 = self.cloud_argv[:] + ['--force']
     actual_1 = ParseArgs(argv_1, self.function)
@@ -150,6 +212,21 @@ class TestParseArgs(unittest.TestCase):
     actual_2 = ParseArgs(argv_2, self.function)
     self.assertEquals(True, actual_2.args.test)
 
+    argv_3 = self.cloud_argv[:] + ['--keep_spare_keys']
+    actual_3 = ParseArgs(argv_3, self.function)
+    self.assertEquals(True, actual_3.args.keep_spare_keys)
+    self.assertEquals(False, actual_1.args.keep_spare_keys)
+
+
+  def test_zone_flags(self):
+    # Each zone given should be carried over, in order, and without any zones
+    # the cloud gets to pick
+    argv = self.cloud_argv[:] + ['--zone', 'us-east-1a', '-z', 'us-east-1b']
+    actual = ParseArgs(argv, self.function)
+    self.assertEquals(['us-east-1a', 'us-east-1b'], actual.args.zones)
+    self.assertEquals(None, ParseArgs(self.cloud_argv[:],
+      self.function).args.zones)
+
 
   def test_infrastructure_flags(self):
     # Specifying infastructure as EC2 or Eucalyptus is acceptable.
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+
+# Third party libraries
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
+sys.path.append(lib)
+from appscale_logger import AppScaleLogger
+from phase_timer import PhaseTimer
+
+
+class TestPhaseTimer(unittest.TestCase):
+
+
+  def setUp(self):
+    # mock out any writing to stdout
+    flexmock(AppScaleLogger)
+    AppScaleLogger.should_receive('log').and_return()
+
+    # and pretend that each call to time.time takes a second
+    self.now = [1000]
+    def fake_time():
+      self.now[0] += 1
+      return self.now[0]
+    flexmock(time).should_receive('time').replace_with(fake_time)
+
+    PhaseTimer.reset()
+
+
+  def test_spans_are_named_after_the_spans_they_are_in(self):
+    with PhaseTimer.span('start_head_node'):
+      with PhaseTimer.span('ssl_cert'):
+        pass
+
+      # functions wrapped in a span are in it, even in other threads
+      thread = threading.Thread(target=PhaseTimer.wrap('head_node',
+        lambda: None))
+      thread.start()
+      thread.join()
+    with PhaseTimer.span('uaserver_wait'):
+      pass
+
+    spans = PhaseTimer.get_spans()
+    self.assertEquals(['start_head_node', 'start_head_node.ssl_cert',
+      'start_head_node.head_node', 'uaserver_wait'],
+      [span['name'] for span in spans])
+    self.assertEquals([5, 1, 1, 1], [span['duration'] for span in spans])
+
+
+  def test_critical_path(self):
+    spans = [
+      {'name' : 'start_head_node', 'start' : 0, 'end' : 10},
+      {'name' : 'start_head_node.head_node', 'start' : 0, 'end' : 8},
+      {'name' : 'start_head_node.ssl_cert', 'start' : 0, 'end' : 3},
+      {'name' : 'start_head_node.appcontroller', 'start' : 8, 'end' : 10},
+      {'name' : 'uaserver_wait', 'start' : 10, 'end' : 15}
+    ]
+
+    # generating the cert happened while the head node booted, so it didn't
+    # make us wait
+    self.assertEquals(['start_head_node.head_node',
+      'start_head_node.appcontroller', 'uaserver_wait'],
+      [span['name'] for span in PhaseTimer.get_critical_path(spans)])
+
+
+  def test_write_report(self):
+    with PhaseTimer.span('start_head_node'):
+      pass
+
+    directory = tempfile.mkdtemp()
+    try:
+      location = os.path.join(directory, 'timing-bookey.json')
+      PhaseTimer.write_report(location)
+      with open(location, 'r') as file_handle:
+        report = json.loads(file_handle.read())
+    finally:
+      shutil.rmtree(directory)
+
+    self.assertEquals(['start_head_node'], report['critical_path'])
+    self.assertEquals(2, report['total'])
+    self.assertEquals('start_head_node', report['spans'][0]['name'])
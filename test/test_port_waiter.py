@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import errno
+import os
+import socket
+import sys
+import unittest
+
+
+# Third party libraries
+from flexmock import flexmock
+
+
+# AppScale import, the library that we're testing here
+lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
+sys.path.append(lib)
+from appscale_logger import AppScaleLogger
+from custom_exceptions import AppScaleException
+from port_waiter import PortWaiter
+
+
+class TestPortWaiter(unittest.TestCase):
+
+
+  def setUp(self):
+    # mock out any writing to stdout
+    flexmock(AppScaleLogger)
+    AppScaleLogger.should_receive('verbose').and_return()
+
+    # open up a port that accepts connections
+    self.server = socket.socket()
+    self.server.bind(('127.0.0.1', 0))
+    self.server.listen(5)
+    self.open_port = self.server.getsockname()[1]
+
+    # and find a port that nobody is listening on
+    closed = socket.socket()
+    closed.bind(('127.0.0.1', 0))
+    self.closed_port = closed.getsockname()[1]
+    closed.close()
+
+
+  def tearDown(self):
+    self.server.close()
+
+
+  def test_wait_for_ports_with_no_ports(self):
+    PortWaiter.wait_for_ports([], False, timeout=0)
+
+
+  def test_wait_for_ports_calls_back_when_ports_open(self):
+    opened = []
+    PortWaiter.wait_for_ports([('127.0.0.1', self.open_port)], False,
+      timeout=5, on_ready=lambda host, port: opened.append((host, port)))
+    self.assertEquals([('127.0.0.1', self.open_port)], opened)
+
+
+  def test_wait_for_ports_times_out_on_closed_ports(self):
+    flexmock(PortWaiter)
+    PortWaiter.should_receive('get_retry_delay').and_return(0.01)
+
+    opened = []
+    with self.assertRaises(AppScaleException) as context_manager:
+      PortWaiter.wait_for_ports([('127.0.0.1', self.open_port),
+        ('127.0.0.1', self.closed_port)], False, timeout=0.2,
+        on_ready=lambda host, port: opened.append(port))
+
+    # the open port shouldn't have to wait for the closed one
+    self.assertEquals([self.open_port], opened)
+    self.assertTrue(str(self.closed_port) in
+      str(context_manager.exception))
+
+
+  def test_wait_for_ports_retries_until_port_opens(self):
+    fake_socket = flexmock(name='fake_socket')
+    fake_socket.should_receive('setblocking').with_args(0).and_return()
+    fake_socket.should_receive('connect_ex').with_args(('public1', 17443)) \
+      .and_return(errno.ECONNREFUSED).and_return(errno.ECONNREFUSED) \
+      .and_return(0)
+    fake_socket.should_receive('close').times(3).and_return()
+    flexmock(socket)
+    socket.should_receive('socket').and_return(fake_socket)
+
+    flexmock(PortWaiter)
+    PortWaiter.should_receive('get_retry_delay').and_return(0)
+
+    PortWaiter.wait_for_ports([('public1', 17443)], False, timeout=5)
+
+
+  def test_get_retry_delay_is_jittered(self):
+    for _ in range(100):
+      delay = PortWaiter.get_retry_delay(4)
+      self.assertTrue(2 <= delay <= 4)
@@ -3,12 +3,18 @@
 
 
 # General-purpose Python library imports
+import cStringIO
+import errno
+import gzip
+import hashlib
 import json
 import os
 import re
+import shutil
 import socket
 import subprocess
 import sys
+import tarfile
 import tempfile
 import time
 import unittest
@@ -17,10 +23,14 @@ import unittest
 # Third party libraries
 import boto
 from flexmock import flexmock
-import M2Crypto
 import SOAPpy
 
 
+# Test helpers
+from command_mocks import ArgvMatching
+from command_mocks import expect_command
+
+
 # AppScale import, the library that we're testing here
 lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
 sys.path.append(lib)
@@ -28,9 +38,11 @@ from appcontroller_client import AppControllerClient
 from appscale_logger import AppScaleLogger
 from custom_exceptions import AppScaleException
 from custom_exceptions import BadConfigurationException
+from custom_exceptions import ShellException
 from local_state import APPSCALE_VERSION
 from local_state import LocalState
 from node_layout import NodeLayout
+from port_waiter import PortWaiter
 from remote_helper import RemoteHelper
 
 
@@ -46,13 +58,24 @@ class TestRemoteHelper(unittest.TestCase):
     flexmock(time)
     time.should_receive('sleep').and_return()
 
+    # and don't wait in between attempts to connect to ports that aren't
+    # open yet
+    flexmock(PortWaiter)
+    PortWaiter.should_receive('get_retry_delay').and_return(0)
+
     # set up some fake options so that we don't have to generate them via
     # ParseArgs
     self.options = flexmock(infrastructure='ec2', group='boogroup',
       machine='ami-ABCDEFG', instance_type='m1.large', keyname='bookey',
-      table='cassandra', verbose=False)
+      table='cassandra', verbose=False, zones=None, scp=None)
     self.node_layout = NodeLayout(self.options)
 
+    # generating the head node's parameters needs more options than we set
+    # up here, and happens while we check if the head node can run AppScale,
+    # so don't let it fail before that check does
+    flexmock(LocalState)
+    LocalState.should_receive('generate_deployment_params').and_return({})
+
     # mock out calls to EC2
     # begin by assuming that our ssh keypair doesn't exist, and thus that we
     # need to create it
@@ -95,22 +118,23 @@ class TestRemoteHelper(unittest.TestCase):
     fake_ec2.should_receive('authorize_security_group').and_return()
 
     # next, add in mocks for run_instances
-    # the first time around, let's say that no machines are running
-    # the second time around, let's say that our machine is pending
-    # and that it's up the third time around
-    fake_pending_instance = flexmock(state='pending')
-    fake_pending_reservation = flexmock(instances=fake_pending_instance)
+    # the first time around, let's say that our machine is pending
+    # and that it's up the second time around
+    fake_pending_instance = flexmock(state='pending', key_name='bookey',
+      id='i-12345678', public_dns_name='', private_dns_name='')
+    fake_pending_reservation = flexmock(instances=[fake_pending_instance])
 
     fake_running_instance = flexmock(state='running', key_name='bookey',
       id='i-12345678', public_dns_name='public1', private_dns_name='private1')
-    fake_running_reservation = flexmock(instances=fake_running_instance)
+    fake_running_reservation = flexmock(instances=[fake_running_instance])
 
-    fake_ec2.should_receive('get_all_instances').and_return([]) \
+    fake_ec2.should_receive('get_all_instances') \
       .and_return([fake_pending_reservation]) \
       .and_return([fake_running_reservation])
 
     # next, assume that our run_instances command succeeds
-    fake_ec2.should_receive('run_instances').and_return()
+    fake_ec2.should_receive('run_instances').and_return(
+      fake_pending_reservation)
 
     # finally, inject our mocked EC2
     flexmock(boto)
@@ -118,15 +142,18 @@ class TestRemoteHelper(unittest.TestCase):
 
     # assume that ssh comes up on the third attempt
     fake_socket = flexmock(name='fake_socket')
-    fake_socket.should_receive('connect').with_args(('public1',
-      RemoteHelper.SSH_PORT)).and_raise(Exception).and_raise(Exception) \
-      .and_return(None)
+    fake_socket.should_receive('setblocking').and_return()
+    fake_socket.should_receive('close').and_return()
+    fake_socket.should_receive('connect_ex').with_args(('public1',
+      RemoteHelper.SSH_PORT)).and_return(errno.ECONNREFUSED) \
+      .and_return(errno.ECONNREFUSED).and_return(0)
     flexmock(socket)
     socket.should_receive('socket').and_return(fake_socket)
 
     # throw some default mocks together for when invoking via shell succeeds
     # and when it fails
     self.fake_temp_file = flexmock(name='fake_temp_file')
+    self.fake_temp_file.should_receive('seek').and_return()
     self.fake_temp_file.should_receive('read').and_return('boo out')
     self.fake_temp_file.should_receive('close').and_return()
 
@@ -139,74 +166,122 @@ class TestRemoteHelper(unittest.TestCase):
     self.failed = flexmock(name='success', returncode=1)
     self.failed.should_receive('wait').and_return(1)
 
-    # and assume that we can ssh in as ubuntu to enable root login, but that
-    # it fails the first time
-    flexmock(subprocess)
-    subprocess.should_receive('Popen').with_args(re.compile('ubuntu'), \
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.failed).and_return(self.success)
-
-    # also assume that we can scp over our ssh keys, but that it fails the first
-    # time
-    subprocess.should_receive('Popen').with_args(re.compile('/root/.ssh/id_'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.failed).and_return(self.success)
+    # ssh exits with 255 when it can't reach the remote machine
+    self.unreachable = flexmock(name='unreachable', returncode=255)
+    self.unreachable.should_receive('wait').and_return(255)
 
-    subprocess.should_receive('Popen').with_args(re.compile(
-      '/root/.appscale/bookey.key'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.failed).and_return(self.success)
+    # and assume that we can ssh in as ubuntu to enable root login, but that
+    # the first attempt can't reach the machine
+    expect_command('ubuntu', 255, 0)
+
+    # also assume that we can copy over our ssh keys in a single tarball, but
+    # that the first attempt can't reach the machine
+    fake_ssh_key = flexmock(name='fake_ssh_key')
+    fake_ssh_key.should_receive('read').and_return(key_contents)
+    builtins.should_receive('open').with_args(ssh_key_location, 'r') \
+      .and_return(fake_ssh_key)
+
+    self.success.should_receive('communicate').and_return(('', None))
+    self.unreachable.should_receive('communicate').and_return(('', None))
+    expect_command('tar -xf', 255, 0)
+
+
+  def probe_report(self, has_appscale, has_version, has_database):
+    """Constructs the output that probing a machine for AppScale
+    compatibility would produce.
+    """
+    version_dir = '/etc/appscale/{0}'.format(APPSCALE_VERSION)
+    report = []
+    for location, exists in [('/etc/appscale', has_appscale),
+      (version_dir, has_version),
+      (version_dir + '/cassandra', has_database)]:
+      if exists:
+        report.append('present ' + location)
+      else:
+        report.append('missing ' + location)
+    report.append('kernel 3.2.0-23-virtual')
+    report.append('disk /dev/xvda1 10321208 4317504 5479416 45% /')
+    report.append(RemoteHelper.PROBE_DONE_MARKER)
+    return "\n".join(report)
 
 
   def test_start_head_node_in_cloud_but_ami_not_appscale(self):
-    # mock out our attempts to find /etc/appscale and presume it doesn't exist
-    subprocess.should_receive('Popen').with_args(re.compile('/etc/appscale'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.failed)
+    # mock out our attempt to probe the machine, and presume that /etc/appscale
+    # doesn't exist
+    expect_command('/etc/appscale', (0, self.probe_report(False, False,
+      False))).once()
 
     self.assertRaises(AppScaleException, RemoteHelper.start_head_node,
       self.options, self.node_layout)
 
 
   def test_start_head_node_in_cloud_but_ami_wrong_version(self):
-    # mock out our attempts to find /etc/appscale and presume it does exist
-    subprocess.should_receive('Popen').with_args(re.compile('/etc/appscale'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    # mock out our attempts to find /etc/appscale/version and presume it doesn't
-    # exist
-    subprocess.should_receive('Popen').with_args(re.compile(
-      '/etc/appscale/{0}'.format(APPSCALE_VERSION)),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.failed)
+    # mock out our attempt to probe the machine, and presume that
+    # /etc/appscale exists but /etc/appscale/version doesn't
+    expect_command('/etc/appscale', (0, self.probe_report(True, False,
+      False))).once()
 
     self.assertRaises(AppScaleException, RemoteHelper.start_head_node,
       self.options, self.node_layout)
 
 
   def test_start_head_node_in_cloud_but_using_unsupported_database(self):
-    # mock out our attempts to find /etc/appscale and presume it does exist
-    subprocess.should_receive('Popen').with_args(re.compile('/etc/appscale'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    # mock out our attempt to probe the machine, and presume that the database
+    # the user wants isn't supported
+    expect_command('/etc/appscale', (0, self.probe_report(True, True,
+      False))).once()
 
-    # mock out our attempts to find /etc/appscale/version and presume it does
-    # exist
-    subprocess.should_receive('Popen').with_args(re.compile(
-      '/etc/appscale/{0}'.format(APPSCALE_VERSION)),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    self.assertRaises(AppScaleException, RemoteHelper.start_head_node,
+      self.options, self.node_layout)
 
-    # finally, put in a mock indicating that the database the user wants
-    # isn't supported
-    subprocess.should_receive('Popen').with_args(re.compile(
-      '/etc/appscale/{0}/{1}'.format(APPSCALE_VERSION, 'cassandra')),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.failed)
+
+  def test_start_head_node_doesnt_send_credentials_to_bad_machines(self):
+    # mock out everything up to the point where we check if the head node can
+    # run AppScale, and presume that it can't
+    LocalState.should_receive('generate_secret_key').and_return('secret')
+    LocalState.should_receive('generate_ssl_cert').and_return()
+
+    flexmock(RemoteHelper)
+    RemoteHelper.should_receive('acquire_head_node').and_return(('i-ABCDEFG',
+      'public1', 'private1'))
+    RemoteHelper.should_receive('get_cloud_credentials').and_return({})
+    RemoteHelper.should_receive('ensure_machine_is_compatible') \
+      .and_raise(AppScaleException)
+
+    # and make sure that our secret key and cloud credentials never make it
+    # onto that machine
+    copied_to = []
+    RemoteHelper.should_receive('copy_deployment_credentials').replace_with(
+      lambda host, options: copied_to.append(host))
 
     self.assertRaises(AppScaleException, RemoteHelper.start_head_node,
       self.options, self.node_layout)
+    self.assertEquals([], copied_to)
+
+
+  def test_probe_host_when_ssh_fails(self):
+    # if we can't log into the machine at all, we should say so instead of
+    # claiming that AppScale isn't installed there
+    expect_command('/etc/appscale', 1)
+
+    self.assertRaises(AppScaleException, RemoteHelper.probe_host, 'public1',
+      'bookey', ['/etc/appscale'], False)
+
+
+  def test_probe_host_with_structured_report(self):
+    expect_command('/etc/appscale', (0, self.probe_report(True, True,
+      False))).once()
+
+    version_dir = '/etc/appscale/{0}'.format(APPSCALE_VERSION)
+    report = RemoteHelper.probe_host('public1', 'bookey', ['/etc/appscale',
+      version_dir, version_dir + '/cassandra'], False)
+    self.assertEquals({
+      '/etc/appscale' : True,
+      version_dir : True,
+      version_dir + '/cassandra' : False
+    }, report['locations'])
+    self.assertEquals('3.2.0-23-virtual', report['kernel'])
+    self.assertEquals(5479416, report['free_disk_kb'])
 
 
   def test_rsync_files_from_dir_that_doesnt_exist(self):
@@ -235,52 +310,26 @@ class TestRemoteHelper(unittest.TestCase):
 
 
   def test_copy_deployment_credentials_in_cloud(self):
-    # mock out the scp'ing to public1 and assume they succeed
-    subprocess.should_receive('Popen').with_args(re.compile('secret.key'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
-
-    subprocess.should_receive('Popen').with_args(re.compile('ssh.key'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    # mock out reading the credentials that we copy over
+    os.environ['EC2_CERT'] = '/boo/mycert.pem'
+    os.environ['EC2_PRIVATE_KEY'] = '/boo/mykey.pem'
 
-    # mock out generating the private key
-    flexmock(M2Crypto.RSA)
-    fake_rsa_key = flexmock(name='fake_rsa_key')
-    fake_rsa_key.should_receive('save_key').with_args(
-      LocalState.get_private_key_location('bookey'), None)
-    M2Crypto.RSA.should_receive('gen_key').and_return(fake_rsa_key)
-
-    flexmock(M2Crypto.EVP)
-    fake_pkey = flexmock(name='fake_pkey')
-    fake_pkey.should_receive('assign_rsa').with_args(fake_rsa_key).and_return()
-    M2Crypto.EVP.should_receive('PKey').and_return(fake_pkey)
-
-    # and mock out generating the certificate
-    flexmock(M2Crypto.X509)
-    fake_cert = flexmock(name='fake_x509')
-    fake_cert.should_receive('set_pubkey').with_args(fake_pkey).and_return()
-    fake_cert.should_receive('set_subject')
-    fake_cert.should_receive('set_issuer_name')
-    fake_cert.should_receive('set_not_before')
-    fake_cert.should_receive('set_not_after')
-    fake_cert.should_receive('sign').with_args(fake_pkey, md="sha256")
-    fake_cert.should_receive('save_pem').with_args(
-      LocalState.get_certificate_location('bookey'))
-    M2Crypto.X509.should_receive('X509').and_return(fake_cert)
-
-    # next, mock out copying the private key and certificate
-    subprocess.should_receive('Popen').with_args(re.compile('mycert.pem'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    builtins = flexmock(sys.modules['__builtin__'])
+    builtins.should_call('open')  # set the fall-through
 
-    subprocess.should_receive('Popen').with_args(re.compile('mykey.pem'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    fake_credential = flexmock(name='fake_credential')
+    fake_credential.should_receive('read').and_return('credential contents')
+    for location in [LocalState.get_secret_key_location('bookey'),
+      LocalState.get_key_path_from_name('bookey'),
+      LocalState.get_certificate_location('bookey'),
+      LocalState.get_private_key_location('bookey'), '/boo/mycert.pem',
+      '/boo/mykey.pem']:
+      builtins.should_receive('open').with_args(location, 'r') \
+        .and_return(fake_credential)
 
-    subprocess.should_receive('Popen').with_args(re.compile('mkdir -p'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    # finally, make sure that all of the credentials get copied over to public1
+    # in a single ssh call
+    expect_command("root@public1 tar -xf - -C /$").once()
 
     options = flexmock(name='options', keyname='bookey', infrastructure='ec2',
       verbose=True)
@@ -289,48 +338,45 @@ class TestRemoteHelper(unittest.TestCase):
 
   def test_start_remote_appcontroller(self):
     # mock out removing the old json file
-    subprocess.should_receive('Popen').with_args(re.compile('rm -rf'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    expect_command('rm -rf')
 
     # assume we started god on public1 fine
-    subprocess.should_receive('Popen').with_args(re.compile('god &'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    expect_command('god &')
 
     # also assume that we scp'ed over the god config file fine
-    subprocess.should_receive('Popen').with_args(re.compile('appcontroller'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    expect_command('appcontroller')
 
     # and assume we started the AppController on public1 fine
-    subprocess.should_receive('Popen').with_args(re.compile('god load'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    expect_command('god load')
 
     # finally, assume the appcontroller comes up after a few tries
     # assume that ssh comes up on the third attempt
     fake_socket = flexmock(name='fake_socket')
-    fake_socket.should_receive('connect').with_args(('public1',
-      AppControllerClient.PORT)).and_raise(Exception) \
-      .and_raise(Exception).and_return(None)
+    fake_socket.should_receive('setblocking').and_return()
+    fake_socket.should_receive('close').and_return()
+    fake_socket.should_receive('connect_ex').with_args(('public1',
+      AppControllerClient.PORT)).and_return(errno.ECONNREFUSED) \
+      .and_return(errno.ECONNREFUSED).and_return(0)
     socket.should_receive('socket').and_return(fake_socket)
 
     RemoteHelper.start_remote_appcontroller('public1', 'bookey', False)
 
 
   def test_copy_local_metadata(self):
-    # mock out the copying of the two files
-    subprocess.should_receive('Popen').with_args(re.compile(
-      'locations-bookey.[yaml|json]'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    # mock out reading the two metadata files and the secret file
+    builtins = flexmock(sys.modules['__builtin__'])
+    builtins.should_call('open')  # set the fall-through
 
-    # and mock out copying the secret file
-    subprocess.should_receive('Popen').with_args(re.compile(
-      'bookey.secret'),
-      shell=True, stdout=self.fake_temp_file, stderr=subprocess.STDOUT) \
-      .and_return(self.success)
+    fake_metadata = flexmock(name='fake_metadata')
+    fake_metadata.should_receive('read').and_return('metadata contents')
+    for location in [LocalState.get_locations_yaml_location('bookey'),
+      LocalState.get_locations_json_location('bookey'),
+      LocalState.get_secret_key_location('bookey')]:
+      builtins.should_receive('open').with_args(location, 'r') \
+        .and_return(fake_metadata)
+
+    # and make sure that they get copied over in a single ssh call
+    expect_command('tar -xf').once()
 
     RemoteHelper.copy_local_metadata('public1', 'bookey', False)
 
@@ -417,4 +463,404 @@ class TestRemoteHelper(unittest.TestCase):
     SOAPpy.should_receive('SOAPProxy').with_args('https://public2:17443') \
       .and_return(fake_soap)
 
+    # and that both AppControllers are already accepting connections
+    fake_socket = flexmock(name='fake_socket')
+    fake_socket.should_receive('setblocking').and_return()
+    fake_socket.should_receive('close').and_return()
+    fake_socket.should_receive('connect_ex').with_args(('public1',
+      AppControllerClient.PORT)).and_return(0)
+    fake_socket.should_receive('connect_ex').with_args(('public2',
+      AppControllerClient.PORT)).and_return(0)
+    socket.should_receive('socket').and_return(fake_socket)
+
+    AppScaleLogger.should_receive('log').with_args(
+      '2/2 AppControllers started').once()
+
     RemoteHelper.wait_for_machines_to_finish_loading('public1', 'bookey')
+
+
+  def test_wait_for_machines_to_finish_loading_times_out(self):
+    # mock out reading the secret key
+    builtins = flexmock(sys.modules['__builtin__'])
+    builtins.should_call('open')  # set the fall-through
+
+    secret_key_location = LocalState.LOCAL_APPSCALE_PATH + "bookey.secret"
+    fake_secret = flexmock(name="fake_secret")
+    fake_secret.should_receive('read').and_return('the secret')
+    builtins.should_receive('open').with_args(secret_key_location, 'r') \
+      .and_return(fake_secret)
+
+    # let's say that public1 finishes loading, but public2 never does
+    fake_public1 = flexmock(name='fake_public1')
+    fake_public1.should_receive('get_all_public_ips').with_args('the secret') \
+      .and_return(json.dumps(['public1', 'public2']))
+    fake_public1.should_receive('is_done_initializing') \
+      .with_args('the secret').and_return(True)
+
+    fake_public2 = flexmock(name='fake_public2')
+    fake_public2.should_receive('is_done_initializing') \
+      .with_args('the secret').and_return(False)
+
+    # and make sure that we only make one connection to each machine
+    flexmock(SOAPpy)
+    SOAPpy.should_receive('SOAPProxy').with_args('https://public1:17443') \
+      .and_return(fake_public1).once()
+    SOAPpy.should_receive('SOAPProxy').with_args('https://public2:17443') \
+      .and_return(fake_public2).once()
+
+    # both AppControllers are accepting connections, though
+    fake_socket = flexmock(name='fake_socket')
+    fake_socket.should_receive('setblocking').and_return()
+    fake_socket.should_receive('close').and_return()
+    fake_socket.should_receive('connect_ex').and_return(0)
+    socket.should_receive('socket').and_return(fake_socket)
+
+    with self.assertRaises(AppScaleException) as context_manager:
+      RemoteHelper.wait_for_machines_to_finish_loading('public1', 'bookey',
+        timeout=0.1)
+    self.assertTrue('public2' in str(context_manager.exception))
+    self.assertFalse('public1' in str(context_manager.exception))
+
+
+  def test_wait_for_machines_gives_up_on_missing_appcontrollers(self):
+    # mock out reading the secret key
+    builtins = flexmock(sys.modules['__builtin__'])
+    builtins.should_call('open')  # set the fall-through
+
+    secret_key_location = LocalState.LOCAL_APPSCALE_PATH + "bookey.secret"
+    fake_secret = flexmock(name="fake_secret")
+    fake_secret.should_receive('read').and_return('the secret')
+    builtins.should_receive('open').with_args(secret_key_location, 'r') \
+      .and_return(fake_secret)
+
+    # let's say that public2 never starts its AppController
+    fake_public1 = flexmock(name='fake_public1')
+    fake_public1.should_receive('get_all_public_ips').with_args('the secret') \
+      .and_return(json.dumps(['public1', 'public2']))
+
+    flexmock(SOAPpy)
+    SOAPpy.should_receive('SOAPProxy').with_args('https://public1:17443') \
+      .and_return(fake_public1)
+    SOAPpy.should_receive('SOAPProxy').with_args('https://public2:17443') \
+      .and_return(flexmock(name='fake_public2'))
+
+    fake_socket = flexmock(name='fake_socket')
+    fake_socket.should_receive('setblocking').and_return()
+    fake_socket.should_receive('close').and_return()
+    fake_socket.should_receive('connect_ex').with_args(('public1',
+      AppControllerClient.PORT)).and_return(0)
+    fake_socket.should_receive('connect_ex').with_args(('public2',
+      AppControllerClient.PORT)).and_return(errno.ECONNREFUSED)
+    socket.should_receive('socket').and_return(fake_socket)
+
+    # so we should give up on it without asking either machine if it's done
+    # loading
+    fake_public1.should_receive('is_done_initializing').never()
+    with self.assertRaises(AppScaleException) as context_manager:
+      RemoteHelper.wait_for_machines_to_finish_loading('public1', 'bookey',
+        timeout=0.1)
+    self.assertTrue('public2:17443' in str(context_manager.exception))
+
+
+  def test_log_loading_progress(self):
+    AppScaleLogger.should_receive('log').with_args(
+      "1/8 nodes initialized, waiting on public2, public3, public4, " \
+      "public5, public6 and 2 more").once()
+    RemoteHelper.log_loading_progress(8, set(['public{0}'.format(i)
+      for i in range(2, 9)]))
+
+    AppScaleLogger.should_receive('log').with_args("8/8 nodes initialized") \
+      .once()
+    RemoteHelper.log_loading_progress(8, set())
+
+
+  def test_terminate_virtualized_cluster_gives_up_on_stuck_machines(self):
+    flexmock(LocalState)
+    LocalState.should_receive('get_host_with_role').and_return('public1')
+    LocalState.should_receive('get_secret_key').and_return('the secret')
+    flexmock(AppControllerClient)
+    AppControllerClient.should_receive('get_all_public_ips').and_return(
+      ['public1'])
+
+    # the AppController never finishes stopping, so we should stop waiting
+    # for it instead of waiting forever
+    flexmock(RemoteHelper, MAX_SHUTDOWN_TIME=0)
+    RemoteHelper.should_receive('stop_remote_appcontroller').and_return()
+    RemoteHelper.should_receive('ssh').with_args('public1', 'bookey', 'ps x',
+      False, timeout=RemoteHelper.MIN_SSH_TIMEOUT).and_return(
+      '1234 ? S 0:00 service appscale-controller stop')
+
+    self.assertRaises(AppScaleException,
+      RemoteHelper.terminate_virtualized_cluster, 'bookey', False)
+
+
+  def test_ssh_uses_multiplexed_connection(self):
+    RemoteHelper.ssh_connections.clear()
+
+    # mock out the ssh call, and make sure that it asks for a control socket
+    # for the host we're logging into
+    control_path = RemoteHelper.get_control_path('public1')
+    expect_command('ControlMaster=auto -o ControlPath={0}'.format(
+      re.escape(control_path)))
+
+    RemoteHelper.ssh('public1', 'bookey', 'ls', False)
+    self.assertEquals(set([('root', 'public1')]), RemoteHelper.ssh_connections)
+
+
+  def test_ssh_passes_commands_as_a_single_argument(self):
+    # the remote command should reach ssh as a single, intact argument, with
+    # no local shell in between to mangle its quotes
+    argv = RemoteHelper.get_ssh_argv('public1', 'bookey',
+      "echo 'hello world'")
+    self.assertEquals(['root@public1', "echo 'hello world'"], argv[-2:])
+
+    expect_command("root@public1 echo 'hello world'$",
+      (0, 'hello world\n')).once()
+    self.assertEquals('hello world\n', RemoteHelper.ssh('public1', 'bookey',
+      "echo 'hello world'", False))
+
+
+  def test_close_ssh_connections(self):
+    RemoteHelper.ssh_connections.clear()
+    RemoteHelper.ssh_connections.update([('root', 'public1'),
+      ('root', 'public2')])
+
+    # let's say that only public1 has a control socket still open
+    flexmock(os.path)
+    os.path.should_call('exists')  # set the fall-through
+    os.path.should_receive('exists').with_args(
+      RemoteHelper.get_control_path('public1')).and_return(True)
+    os.path.should_receive('exists').with_args(
+      RemoteHelper.get_control_path('public2')).and_return(False)
+
+    # and make sure that we only ask the master connection for public1 to exit
+    subprocess.should_receive('call').with_args(["ssh", "-O", "exit", "-o",
+      "ControlPath={0}".format(RemoteHelper.get_control_path('public1')),
+      "root@public1"], stdout=file, stderr=file).and_return(0).once()
+
+    RemoteHelper.close_ssh_connections()
+    self.assertEquals(set(), RemoteHelper.ssh_connections)
+
+
+
+  def make_app(self):
+    """Creates a Python 2.5 app on the local filesystem, with a hidden file at
+    its top level that (like 'tar -czf app.tar.gz *') we shouldn't copy over.
+    """
+    app_dir = tempfile.mkdtemp()
+    os.mkdir(os.path.join(app_dir, 'lib'))
+    for name, contents in [('app.yaml', 'application: baz\nruntime: python\n'),
+      ('.hidden', 'boo'), (os.path.join('lib', 'main.py'), 'main')]:
+      with open(os.path.join(app_dir, name), 'w') as file_handle:
+        file_handle.write(contents)
+    return app_dir
+
+
+  def mock_streaming_ssh(self, command):
+    """Mocks out an ssh call that reads a tarball from its standard input.
+
+    Returns:
+      A list that everything written to the ssh call is appended to.
+    """
+    written = []
+    fake_stdin = flexmock(name='fake_stdin')
+    fake_stdin.should_receive('write').replace_with(written.append)
+    fake_stdin.should_receive('close').and_return()
+    fake_ssh = flexmock(name='fake_ssh', returncode=0, stdin=fake_stdin)
+    fake_ssh.should_receive('wait').and_return(0)
+
+    subprocess.should_receive('Popen').with_args(ArgvMatching(command),
+      stdin=subprocess.PIPE, stdout=self.fake_temp_file,
+      stderr=subprocess.STDOUT, close_fds=True).and_return(fake_ssh).once()
+    return written
+
+
+  def test_copy_app_to_host_without_manifest(self):
+    app_dir = self.make_app()
+    manifest_dir = tempfile.mkdtemp()
+    manifest_location = os.path.join(manifest_dir, 'manifest.json')
+
+    flexmock(LocalState)
+    LocalState.should_receive('get_login_host').and_return('public1')
+    LocalState.should_receive('get_app_manifest_location').with_args('bookey',
+      'baz').and_return(manifest_location)
+
+    # since we've never uploaded this app before, the login node has no
+    # manifest, and we should clear out its copy of the app and send everything
+    expect_command('sha1sum')
+    written = self.mock_streaming_ssh(re.compile(
+      'rm -rf /var/cache/appscale/uploads/baz && .*tar -xzf -'))
+
+    try:
+      self.assertEquals('/var/apps/baz/app/baz.tar.gz',
+        RemoteHelper.copy_app_to_host(app_dir, 'bookey', False))
+      with open(manifest_location, 'r') as file_handle:
+        manifest = json.loads(file_handle.read())
+    finally:
+      shutil.rmtree(app_dir)
+      shutil.rmtree(manifest_dir)
+
+    self.assertEquals(['app.yaml', 'lib', 'lib/main.py'], sorted(manifest.keys()))
+    tar = tarfile.open(fileobj=cStringIO.StringIO(''.join(written)),
+      mode='r:gz')
+    self.assertEquals(['files/app.yaml', 'files/lib', 'files/lib/main.py',
+      'manifest.json', 'removed'], sorted(tar.getnames()))
+    self.assertEquals('', tar.extractfile('removed').read())
+    self.assertEquals(manifest, json.loads(tar.extractfile(
+      'manifest.json').read()))
+
+
+  def test_copy_app_to_host_with_matching_manifest(self):
+    app_dir = self.make_app()
+    manifest_dir = tempfile.mkdtemp()
+    manifest_location = os.path.join(manifest_dir, 'manifest.json')
+
+    flexmock(LocalState)
+    LocalState.should_receive('get_login_host').and_return('public1')
+    LocalState.should_receive('get_app_manifest_location').with_args('bookey',
+      'baz').and_return(manifest_location)
+
+    # let's say that we've uploaded this app before, and that since then, we
+    # changed lib/main.py and removed old.py
+    old_manifest = LocalState.generate_app_manifest(app_dir)
+    old_manifest['lib/main.py'] = 'the old digest'
+    old_manifest['old.py'] = 'another old digest'
+    old_manifest_contents = json.dumps(old_manifest, sort_keys=True)
+    with open(manifest_location, 'w') as file_handle:
+      file_handle.write(old_manifest_contents)
+
+    # the login node's copy of the app matches what we uploaded last time, so
+    # we should only send over what changed
+    flexmock(RemoteHelper)
+    RemoteHelper.should_receive('ssh').with_args('public1', 'bookey',
+      re.compile('sha1sum'), False).and_return('{0}  /var/cache/appscale/' \
+      'uploads/baz.json\n'.format(hashlib.sha1(old_manifest_contents) \
+      .hexdigest()))
+    written = self.mock_streaming_ssh(re.compile(
+      "rm -rf /var/cache/appscale/uploads/baz.json"))
+
+    try:
+      RemoteHelper.copy_app_to_host(app_dir, 'bookey', False)
+    finally:
+      shutil.rmtree(app_dir)
+      shutil.rmtree(manifest_dir)
+
+    tar = tarfile.open(fileobj=cStringIO.StringIO(''.join(written)),
+      mode='r:gz')
+    self.assertEquals(['files/lib/main.py', 'manifest.json', 'removed'],
+      sorted(tar.getnames()))
+    self.assertEquals('main', tar.extractfile('files/lib/main.py').read())
+    self.assertEquals('old.py\0', tar.extractfile('removed').read())
+
+
+  def test_list_remote_files(self):
+    # mock out the ssh call, and say that one file vanished while we were
+    # looking at it, and that another has a name we can't safely use
+    flexmock(RemoteHelper)
+    RemoteHelper.should_receive('ssh').with_args('public1', 'bookey',
+      re.compile('cd /var/log/appscale && find . -type f'), False,
+      user='root').and_return("""12 0123456789abcdef0123456789abcdef controller-17443.log
+stat: cannot stat 'gone.log': No such file or directory
+0 d41d8cd98f00b204e9800998ecf8427e nginx/access log.txt
+3 0123456789abcdef0123456789abcdef bad"name.log
+""")
+
+    self.assertEquals({
+      'controller-17443.log' : (12, '0123456789abcdef0123456789abcdef'),
+      'nginx/access log.txt' : (0, 'd41d8cd98f00b204e9800998ecf8427e')
+    }, RemoteHelper.list_remote_files('public1', 'bookey', '/var/log/appscale',
+      False))
+
+
+  def test_copy_remote_file_ranges(self):
+    # let's say that we've copied the start of one log before, and that it's
+    # had more written to it since then (and that our copy has a partial line
+    # at the end that should be thrown away), and that the other log is new
+    local_dir = tempfile.mkdtemp()
+    with open(os.path.join(local_dir, 'old.log'), 'w') as file_handle:
+      file_handle.write('line one\npartial')
+
+    # mock out the ssh call, which sends the ranges we asked for as gzipped
+    # data
+    stream = cStringIO.StringIO()
+    gzip_file = gzip.GzipFile(fileobj=stream, mode='wb')
+    gzip_file.write('line two\nline one\n')
+    gzip_file.close()
+    stream.seek(0)
+
+    fake_ssh = flexmock(name='fake_ssh', returncode=0, stdout=stream)
+    fake_ssh.should_receive('wait').and_return(0)
+    subprocess.should_receive('Popen').with_args(ArgvMatching(
+      'tail -c \+10 "./old.log" 2>/dev/null \| head -c 9;.*' \
+      'tail -c \+1 "./new/new.log" 2>/dev/null \| head -c 9;.*\| gzip -c'),
+      stdout=subprocess.PIPE, stderr=self.fake_temp_file, close_fds=True) \
+      .and_return(fake_ssh).once()
+
+    try:
+      self.assertEquals(18, RemoteHelper.copy_remote_file_ranges('public1',
+        'bookey', '/var/log/appscale', [('old.log', 9, 9),
+        ('new/new.log', 0, 9)], local_dir, False))
+      with open(os.path.join(local_dir, 'old.log'), 'r') as file_handle:
+        self.assertEquals('line one\nline two\n', file_handle.read())
+      with open(os.path.join(local_dir, 'new', 'new.log'), 'r') as file_handle:
+        self.assertEquals('line one\n', file_handle.read())
+    finally:
+      shutil.rmtree(local_dir)
+
+
+  def mock_failed_ssh(self, pattern, returncode, **popen_args):
+    """Mocks out an ssh call whose output we read as it runs, and which fails
+    with the given exit code.
+
+    Returns:
+      The flexmock expectation for the ssh call.
+    """
+    def start_ssh(*args, **kwargs):
+      """Starts a fake ssh call that fails without sending anything."""
+      fake_ssh = flexmock(name='fake_ssh', returncode=returncode,
+        stdin=cStringIO.StringIO(), stdout=cStringIO.StringIO())
+      fake_ssh.should_receive('wait').and_return(returncode)
+      return fake_ssh
+
+    return subprocess.should_receive('Popen').with_args(ArgvMatching(pattern),
+      **popen_args).replace_with(start_ssh)
+
+
+  def test_copy_remote_file_ranges_only_retries_unreachable_hosts(self):
+    # a remote command that fails will fail the same way next time, so we
+    # shouldn't try it again
+    self.mock_failed_ssh('gzip -c', 1, stdout=subprocess.PIPE,
+      stderr=self.fake_temp_file, close_fds=True).once()
+    self.assertRaises(ShellException, RemoteHelper.copy_remote_file_ranges,
+      'public1', 'bookey', '/var/log/appscale', [('old.log', 0, 9)],
+      '/tmp/boo', False, num_retries=3)
+
+    # but if ssh couldn't reach the machine, it's worth trying again
+    self.mock_failed_ssh('gzip -c', 255, stdout=subprocess.PIPE,
+      stderr=self.fake_temp_file, close_fds=True).times(3)
+    self.assertRaises(ShellException, RemoteHelper.copy_remote_file_ranges,
+      'public1', 'bookey', '/var/log/appscale', [('old.log', 0, 9)],
+      '/tmp/boo', False, num_retries=3)
+
+
+  def test_stream_to_host_only_retries_unreachable_hosts(self):
+    # a remote command that fails will fail the same way next time, so we
+    # shouldn't try it again
+    self.mock_failed_ssh('tar -xzf', 1, stdin=subprocess.PIPE,
+      stdout=self.fake_temp_file, stderr=subprocess.STDOUT,
+      close_fds=True).once()
+    try:
+      RemoteHelper.stream_to_host('public1', 'bookey', 'tar -xzf - -C /',
+        lambda stdin: stdin.write('boo'), False, num_retries=3)
+      self.fail("stream_to_host should have raised a ShellException")
+    except ShellException as exception:
+      self.assertEquals(1, exception.returncode)
+      self.assertEquals('boo out', exception.output)
+
+    # but if ssh couldn't reach the machine, it's worth trying again
+    self.mock_failed_ssh('tar -xzf', 255, stdin=subprocess.PIPE,
+      stdout=self.fake_temp_file, stderr=subprocess.STDOUT,
+      close_fds=True).times(3)
+    self.assertRaises(ShellException, RemoteHelper.stream_to_host, 'public1',
+      'bookey', 'tar -xzf - -C /', lambda stdin: stdin.write('boo'), False,
+      num_retries=3)
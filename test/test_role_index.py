@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import os
+import sys
+import unittest
+
+
+# AppScale import, the library that we're testing here
+lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
+sys.path.append(lib)
+from custom_exceptions import BadConfigurationException
+from role_index import RoleIndex
+
+
+class TestRoleIndex(unittest.TestCase):
+
+
+  def setUp(self):
+    self.role_index = RoleIndex([
+      {'public_ip' : 'public1', 'private_ip' : 'private1',
+        'jobs' : ['shadow', 'login', 'db_master', 'memcache']},
+      {'public_ip' : 'public2', 'private_ip' : 'private2',
+        'jobs' : ['appengine', 'memcache']},
+      {'public_ip' : 'public3', 'private_ip' : 'private3',
+        'jobs' : ['appengine', 'db_slave', 'memcache']},
+      {'public_ip' : 'public4', 'private_ip' : 'private4',
+        'jobs' : ['zookeeper']}
+    ])
+
+
+  def test_get_hosts_with_role(self):
+    self.assertEquals(['public1', 'public2', 'public3', 'public4'],
+      self.role_index.get_all_hosts())
+    self.assertEquals(['public2', 'public3'],
+      self.role_index.get_hosts_with_role('appengine'))
+    self.assertEquals([], self.role_index.get_hosts_with_role('rabbitmq'))
+
+
+  def test_get_hosts_with_roles(self):
+    self.assertEquals(['public3'], self.role_index.get_hosts_with_roles(
+      ['appengine', 'db_slave']))
+    self.assertEquals(['public1', 'public3'],
+      self.role_index.get_hosts_with_roles(['db_master', 'db_slave'],
+      match_all=False))
+    self.assertEquals([], self.role_index.get_hosts_with_roles(
+      ['zookeeper', 'memcache']))
+    self.assertEquals([], self.role_index.get_hosts_with_roles([]))
+
+
+  def test_ip_mappings(self):
+    self.assertEquals('private2', self.role_index.get_private_ip('public2'))
+    self.assertEquals('public2', self.role_index.get_public_ip('private2'))
+    self.assertEquals(None, self.role_index.get_private_ip('public5'))
+    self.assertEquals(['shadow', 'login', 'db_master', 'memcache'],
+      self.role_index.get_roles_for_host('public1'))
+
+
+  def test_query(self):
+    self.assertEquals(['public2', 'public3'],
+      self.role_index.query('appengine'))
+    self.assertEquals(['public1', 'public3'],
+      self.role_index.query('memcache+db_master,memcache+db_slave'))
+    self.assertEquals(['public3', 'public4'],
+      self.role_index.query('zookeeper, db_slave'))
+    self.assertEquals([], self.role_index.query('rabbitmq'))
+
+
+  def test_parse_query(self):
+    self.assertEquals([['memcache', 'db_master'], ['appengine']],
+      RoleIndex.parse_query('memcache+db_master,appengine'))
+    self.assertEquals([], RoleIndex.parse_query(',+'))
+    self.assertEquals(['memcache', 'db_master', 'appengine'],
+      RoleIndex.get_roles_in_query('memcache+db_master,appengine'))
+
+
+  def test_validate_query(self):
+    RoleIndex.validate_query('memcache+db_master,appengine')
+    self.assertRaises(BadConfigurationException, RoleIndex.validate_query,
+      'memcache+boo')
+    self.assertRaises(BadConfigurationException, RoleIndex.validate_query,
+      ',+')
+
+    # 'master' is expanded into other roles before machines start, so no
+    # machine is ever listed as running it
+    self.assertRaises(BadConfigurationException, RoleIndex.validate_query,
+      'master')
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# Programmer: Chris Bunch (chris@appscale.com)
+
+
+# General-purpose Python library imports
+import BaseHTTPServer
+import httplib
+import os
+import sys
+import threading
+import unittest
+
+
+# Third party libraries
+import SOAPpy
+
+
+# AppScale import, the library that we're testing here
+lib = os.path.dirname(__file__) + os.sep + ".." + os.sep + "lib"
+sys.path.append(lib)
+from soap_transport import PooledTransport
+
+
+class FakeSOAPHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """A SOAP server that echoes back whatever it's given, and remembers which
+  connections each request came in on."""
+
+
+  protocol_version = 'HTTP/1.1'
+
+
+  def do_POST(self):
+    body = self.rfile.read(int(self.headers['Content-length']))
+    self.server.connections.add(self.client_address)
+    self.server.requests += 1
+    if self.server.truncate_responses:
+      # start a response, but hang up before finishing it
+      self.send_response(200)
+      self.send_header('Content-type', 'text/xml')
+      self.send_header('Content-length', '1000')
+      self.end_headers()
+      self.wfile.write('<?xml')
+      self.close_connection = 1
+      return
+
+    if self.server.status != 200:
+      self.send_response(self.server.status)
+      self.send_header('Content-length', '0')
+      self.end_headers()
+      return
+
+    argument = SOAPpy.parseSOAPRPC(body)[0]
+    response = SOAPpy.buildSOAP(kw={'return' : argument},
+      method='echoResponse')
+    self.send_response(200)
+    self.send_header('Content-type', 'text/xml')
+    self.send_header('Content-length', str(len(response)))
+    self.end_headers()
+    self.wfile.write(response)
+    if self.server.hang_up_after_responding:
+      self.close_connection = 1
+
+
+  def log_message(self, *args):
+    pass
+
+
+class TestPooledTransport(unittest.TestCase):
+
+
+  def setUp(self):
+    PooledTransport.close_all()
+    self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), FakeSOAPHandler)
+    self.server.connections = set()
+    self.server.requests = 0
+    self.server.status = 200
+    self.server.truncate_responses = False
+    self.server.hang_up_after_responding = False
+    thread = threading.Thread(target=self.server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    self.url = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+
+
+  def tearDown(self):
+    PooledTransport.close_all()
+    self.server.shutdown()
+    self.server.server_close()
+
+
+  def make_proxy(self):
+    proxy = SOAPpy.SOAPProxy(self.url)
+    proxy.transport = PooledTransport()
+    return proxy
+
+
+  def test_connections_are_reused_across_requests_and_clients(self):
+    first = self.make_proxy()
+    self.assertEquals('boo', first.echo('boo'))
+    self.assertEquals('baz', first.echo('baz'))
+
+    second = self.make_proxy()
+    self.assertEquals('bar', second.echo('bar'))
+
+    self.assertEquals(1, len(self.server.connections))
+
+
+  def test_closed_connections_are_replaced(self):
+    proxy = self.make_proxy()
+    self.assertEquals('boo', proxy.echo('boo'))
+
+    # pretend the server timed out our idle connection
+    for connections in PooledTransport.idle_connections.values():
+      for connection in connections:
+        connection.sock.close()
+
+    self.assertEquals('baz', proxy.echo('baz'))
+    self.assertEquals(2, len(self.server.connections))
+
+
+  def test_connections_closed_by_the_server_are_replaced(self):
+    # the server hangs up on idle connections without telling us, so it never
+    # sees the request we send over one, and we hear nothing back
+    self.server.hang_up_after_responding = True
+    proxy = self.make_proxy()
+    self.assertEquals('boo', proxy.echo('boo'))
+    self.assertEquals('baz', proxy.echo('baz'))
+    self.assertEquals(2, self.server.requests)
+    self.assertEquals(2, len(self.server.connections))
+
+
+  def test_requests_that_were_sent_arent_retried(self):
+    proxy = self.make_proxy()
+    self.assertEquals('boo', proxy.echo('boo'))
+
+    # once the server has our request, it may have acted on it, so we
+    # shouldn't send it again even though our connection was reused
+    self.server.truncate_responses = True
+    self.assertRaises(httplib.HTTPException, proxy.echo, 'baz')
+    self.assertEquals(2, self.server.requests)
+
+
+  def test_http_errors_are_raised(self):
+    self.server.status = 403
+    proxy = self.make_proxy()
+    self.assertRaises(SOAPpy.HTTPError, proxy.echo, 'boo')
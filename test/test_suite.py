@@ -20,17 +20,27 @@ from test_appscale_terminate_instances import TestAppScaleTerminateInstances
 
 # imports for appscale library tests
 from test_appscale_logger import TestAppScaleLogger
+from test_deployment_metadata import TestDeploymentMetadata
+from test_ec2_agent import TestEC2Agent
+from test_key_pool import TestKeyPool
 from test_local_state import TestLocalState
 from test_node_layout import TestNodeLayout
+from test_parallel_helper import TestParallelHelper
 from test_parse_args import TestParseArgs
+from test_phase_timer import TestPhaseTimer
+from test_port_waiter import TestPortWaiter
 from test_remote_helper import TestRemoteHelper
+from test_role_index import TestRoleIndex
+from test_soap_transport import TestPooledTransport
 
 
 test_cases = [TestAppScale, TestAppScaleAddInstances, TestAppScaleAddKeypair,
   TestAppScaleDescribeInstances, TestAppScaleGatherLogs, TestAppScaleRemoveApp,
   TestAppScaleResetPassword, TestAppScaleRunInstances,
   TestAppScaleTerminateInstances, TestAppScaleUploadApp, TestAppScaleLogger,
-  TestLocalState, TestNodeLayout, TestParseArgs, TestRemoteHelper]
+  TestDeploymentMetadata, TestEC2Agent, TestKeyPool, TestLocalState,
+  TestNodeLayout, TestParallelHelper, TestParseArgs, TestPhaseTimer,
+  TestPooledTransport, TestPortWaiter, TestRemoteHelper, TestRoleIndex]
 appscale_test_suite = unittest.TestSuite()
 for test_class in test_cases:
   tests = unittest.TestLoader().loadTestsFromTestCase(test_class)